@@ -1,7 +1,55 @@
+import os
+import sys
 import unittest
 
+# 测试模块以tests目录为根导入，通过pytest运行时同样需要
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
 # noinspection PyUnresolvedReferences
 from api.base import *
 
+# noinspection PyUnresolvedReferences
+from event.EventEngineTest import *
+
+# noinspection PyUnresolvedReferences
+from pricing.CrrTest import *
+# noinspection PyUnresolvedReferences
+from pricing.GreeksArrayTest import *
+# noinspection PyUnresolvedReferences
+from pricing.ImpvTest import *
+
+# noinspection PyUnresolvedReferences
+from trader.ArrayManagerTest import *
+# noinspection PyUnresolvedReferences
+from trader.BacktestingKernelTest import *
+# noinspection PyUnresolvedReferences
+from trader.ColumnarStoreTest import *
+# noinspection PyUnresolvedReferences
+from trader.CtaHistoryDataTest import *
+# noinspection PyUnresolvedReferences
+from trader.CtaOptimizerTest import *
+# noinspection PyUnresolvedReferences
+from trader.DataEngineTest import *
+# noinspection PyUnresolvedReferences
+from trader.DrEngineTest import *
+# noinspection PyUnresolvedReferences
+from trader.DrJournalTest import *
+# noinspection PyUnresolvedReferences
+from trader.OmPortfolioTest import *
+# noinspection PyUnresolvedReferences
+from trader.OptimizationTest import *
+# noinspection PyUnresolvedReferences
+from trader.ResampleTest import *
+# noinspection PyUnresolvedReferences
+from trader.RmEngineTest import *
+# noinspection PyUnresolvedReferences
+from trader.RmRuleTest import *
+# noinspection PyUnresolvedReferences
+from trader.StopOrderBookTest import *
+# noinspection PyUnresolvedReferences
+from trader.VtFunctionTest import *
+# noinspection PyUnresolvedReferences
+from trader.VtObjectTest import *
+
 if __name__ == "__main__":
     unittest.main()
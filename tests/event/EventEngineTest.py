@@ -0,0 +1,336 @@
+# encoding: UTF-8
+
+import threading
+import unittest
+from time import sleep, time
+
+from vnpy.event import BatchEventEngine, ShardedEventEngine, Event, EVENT_TIMER, shardBySymbol
+from vnpy.event.eventEngine import LatencyHistogram, EventProfiler
+from vnpy.event.eventType import EVENT_PROFILE
+from vnpy.trader.vtEvent import EVENT_TICK, EVENT_ORDER, EVENT_TRADE
+from vnpy.trader.vtGateway import VtGateway
+from vnpy.trader.vtObject import VtTickData
+
+
+#----------------------------------------------------------------------
+def waitFor(condition, timeout=5):
+    """等待事件处理线程完成处理"""
+    end = time() + timeout
+    while not condition() and time() < end:
+        sleep(0.001)
+    return condition()
+
+
+class BatchEventEngineTest(unittest.TestCase):
+    
+    engineClass = BatchEventEngine
+    
+    def setUp(self):
+        self.ee = self.engineClass()
+        self.ee.start(timer=False)
+    
+    def tearDown(self):
+        self.ee.stop()
+    
+    def test_order(self):
+        resultList = []
+        
+        def handler1(event):
+            resultList.append(('h1', event.type_, event.dict_['data']))
+        def handler2(event):
+            resultList.append(('h2', event.type_, event.dict_['data']))
+        def generalHandler(event):
+            resultList.append(('g', event.type_, event.dict_['data']))
+        
+        self.ee.register('eA', handler1)
+        self.ee.register('eA', handler2)
+        self.ee.register('eA', handler1)        # 重复注册无效
+        self.ee.register('eB', handler2)
+        self.ee.registerGeneralHandler(generalHandler)
+        
+        count = 5000
+        for i in range(count):
+            event = Event('eA' if i % 3 else 'eB')
+            event.dict_['data'] = i
+            self.ee.put(event)
+        
+        # 同一事件的处理函数按注册顺序调用，通用处理函数最后调用，事件按存入顺序处理
+        expected = []
+        for i in range(count):
+            if i % 3:
+                expected.extend([('h1', 'eA', i), ('h2', 'eA', i), ('g', 'eA', i)])
+            else:
+                expected.extend([('h2', 'eB', i), ('g', 'eB', i)])
+        
+        self.assertTrue(waitFor(lambda: len(resultList) >= len(expected)))
+        self.assertEqual(resultList, expected)
+        
+        # 注销后不再调用
+        del resultList[:]
+        self.ee.unregister('eA', handler1)
+        self.ee.unregisterGeneralHandler(generalHandler)
+        
+        event = Event('eA')
+        event.dict_['data'] = -1
+        self.ee.put(event)
+        self.assertTrue(waitFor(lambda: resultList))
+        sleep(0.01)
+        self.assertEqual(resultList, [('h2', 'eA', -1)])
+    
+    def test_hasHandler(self):
+        def handler(event):
+            pass
+        
+        self.assertFalse(self.ee.hasHandler('eA'))
+        
+        self.ee.register('eA', handler)
+        self.assertTrue(self.ee.hasHandler('eA'))
+        self.assertFalse(self.ee.hasHandler('eB'))
+        
+        # 通用处理函数监听所有事件
+        self.ee.registerGeneralHandler(handler)
+        self.assertTrue(self.ee.hasHandler('eB'))
+        
+        self.ee.unregisterGeneralHandler(handler)
+        self.ee.unregister('eA', handler)
+        self.assertFalse(self.ee.hasHandler('eA'))
+        self.assertFalse(self.ee.hasHandler('eB'))
+    
+    def test_gatewayTick(self):
+        typeList = []
+        
+        def handler(event):
+            typeList.append(event.type_)
+        
+        self.ee.register(EVENT_TICK, handler)
+        self.ee.register(EVENT_TICK + 'rb1810.SHFE', handler)
+        
+        gateway = VtGateway(self.ee, 'CTP')
+        for vtSymbol in ['rb1810.SHFE', 'hc1810.SHFE']:
+            tick = VtTickData()
+            tick.vtSymbol = vtSymbol
+            gateway.onTick(tick)
+        
+        # 没有函数监听的合约不推送特定合约代码的事件
+        self.assertTrue(waitFor(lambda: len(typeList) >= 3))
+        sleep(0.01)
+        self.assertEqual(typeList, [EVENT_TICK, EVENT_TICK + 'rb1810.SHFE', EVENT_TICK])
+
+
+class ShardedEventEngineTest(BatchEventEngineTest):
+    
+    engineClass = ShardedEventEngine
+    
+    def newTickEvent(self, vtSymbol, i):
+        tick = VtTickData()
+        tick.vtSymbol = vtSymbol
+        tick.volume = i
+        event = Event(EVENT_TICK)
+        event.dict_['data'] = tick
+        return event
+    
+    def test_shard(self):
+        shardList = []
+        mainList = []
+        
+        def shardHandler(event):
+            tick = event.dict_['data']
+            shardList.append((tick.vtSymbol, tick.volume, threading.current_thread().name))
+        def mainHandler(event):
+            mainList.append(threading.current_thread().name)
+        
+        self.ee.register(EVENT_TICK, shardHandler, shardKey=shardBySymbol)
+        self.ee.register(EVENT_TICK, mainHandler)
+        
+        symbolList = ['SYMBOL%s' % i for i in range(20)]
+        count = 200
+        for i in range(count):
+            for vtSymbol in symbolList:
+                self.ee.put(self.newTickEvent(vtSymbol, i))
+        
+        total = count * len(symbolList)
+        self.assertTrue(waitFor(lambda: len(shardList) >= total and len(mainList) >= total))
+        
+        # 同一合约的事件由同一个线程按存入顺序处理
+        threadSet = set()
+        for vtSymbol in symbolList:
+            l = [(volume, name) for symbol, volume, name in shardList if symbol == vtSymbol]
+            self.assertEqual([volume for volume, name in l], list(range(count)))
+            self.assertEqual(len(set([name for volume, name in l])), 1)
+            threadSet.add(l[0][1])
+        self.assertTrue(len(threadSet) > 1)
+        
+        # 未声明分片键的处理函数在0号线程中处理
+        self.assertEqual(set(mainList), set(['EventWorker0']))
+    
+    def test_profileConcurrent(self):
+        # 工作线程不断插入新的统计项，同时0号线程处理计时器事件读取统计结果
+        self.ee.setProfiling(True, interval=0)
+        
+        profileList = []
+        resultList = []
+        self.ee.register('eProfile', profileList.append)
+        self.ee.register(EVENT_TIMER, lambda event: None)
+        
+        typeList = ['eType%s' % i for i in range(600)]
+        for type_ in typeList:
+            self.ee.register(type_, resultList.append, shardKey=shardBySymbol)
+        
+        # 每个事件类型只推送一次，统计项在处理过程中不断新增
+        timerCount = 0
+        for i, type_ in enumerate(typeList):
+            event = self.newTickEvent('SYMBOL%s' % (i % 7), i)
+            event.type_ = type_
+            self.ee.put(event)
+            
+            if not i % 5:
+                self.ee.put(Event(EVENT_TIMER))
+                timerCount += 1
+        
+        self.assertTrue(waitFor(lambda: (len(resultList) >= len(typeList) and 
+                                         len(profileList) >= timerCount)))
+        
+        # 所有工作线程仍在运行
+        self.assertEqual(self.ee.getQueueSize(), [0] * 4)
+        d = self.ee.getProfile()
+        self.assertEqual(sum([d['events'][type_]['count'] for type_ in typeList]), len(typeList))
+
+
+########################################################################
+class FakeMainEngine(object):
+    """CtaEngine测试用的主引擎"""
+    
+    #----------------------------------------------------------------------
+    def registerLogEvent(self, eventType):
+        pass
+
+
+class CtaShardTest(unittest.TestCase):
+    
+    def test_register(self):
+        from vnpy.trader.vtGlobal import globalSetting
+        from vnpy.trader.app.ctaStrategy.ctaEngine import CtaEngine
+        
+        ee = ShardedEventEngine()
+        resultList = []
+        ee.register(EVENT_TICK, lambda event: resultList.append(event))
+        
+        engine = CtaEngine(FakeMainEngine(), ee)
+        self.assertTrue(ee.hasHandler(EVENT_TICK))
+        
+        globalSetting['ctaShardBySymbol'] = True
+        try:
+            shardEngine = CtaEngine(FakeMainEngine(), ShardedEventEngine())
+        finally:
+            del globalSetting['ctaShardBySymbol']
+        
+        # 开启分片后行情、委托、成交的监听函数都按合约分片
+        for eventEngine, shard in [(ee, False), (shardEngine.eventEngine, True)]:
+            dispatchDict = eventEngine._ShardedEventEngine__dispatchDict
+            for type_ in [EVENT_TICK, EVENT_ORDER, EVENT_TRADE]:
+                mainTuple, shardTuple = dispatchDict[type_]
+                self.assertEqual(bool(shardTuple), shard)
+
+
+########################################################################
+class ProfiledObject(object):
+    """用于检查处理函数名的对象"""
+    
+    #----------------------------------------------------------------------
+    def onEvent(self, event):
+        pass
+
+
+class ProfilerTest(unittest.TestCase):
+    
+    def test_histogram(self):
+        histogram = LatencyHistogram()
+        self.assertEqual(histogram.getResult(), {'count': 0, 'mean': 0, 'p50': 0, 
+                                                 'p99': 0, 'max': 0})
+        
+        for us in [0.5, 1, 2, 3, 100]:
+            histogram.add(us)
+        
+        result = histogram.getResult()
+        self.assertEqual(result['count'], 5)
+        self.assertAlmostEqual(result['mean'], 21.3)
+        self.assertEqual(result['max'], 100)
+        
+        # 分位数为所在桶的上限，不超过最大值
+        self.assertAlmostEqual(result['p50'], 2 ** 1.25)
+        self.assertEqual(result['p99'], 100)
+        self.assertEqual(histogram.percentile(20), 1)
+        
+        # 均值使用真除法
+        histogram = LatencyHistogram()
+        histogram.add(1)
+        histogram.add(2)
+        self.assertEqual(histogram.getResult()['mean'], 1.5)
+    
+    def test_process(self):
+        eventList = []
+        profiler = EventProfiler(eventList.append, interval=0)
+        
+        obj = ProfiledObject()
+        def handler(event):
+            sleep(0.002)
+        
+        for queueSize in [0, 4, 2]:
+            event = Event('eA')
+            event.putTime = time() - 0.001
+            profiler.process(event, [obj.onEvent, handler], queueSize)
+        
+        d = profiler.getProfile()
+        self.assertEqual(d['queue']['depthMax'], 4)
+        self.assertEqual(d['queue']['depthMean'], 2)
+        self.assertEqual(d['queue']['wait']['count'], 3)
+        self.assertTrue(d['queue']['wait']['p50'] >= 1000)
+        
+        self.assertEqual(d['events']['eA']['count'], 3)
+        self.assertEqual(sorted(d['handlers']['eA'].keys()), ['ProfiledObject.onEvent', 'handler'])
+        self.assertTrue(d['handlers']['eA']['handler']['p50'] >= 2000)
+        self.assertTrue(d['events']['eA']['mean'] >= d['handlers']['eA']['handler']['mean'])
+        
+        # 按总耗时排序，耗时最长的处理函数排在前面
+        lines = profiler.dump().split('\n')
+        self.assertIn('handler', lines[3])
+        self.assertIn('ProfiledObject.onEvent', lines[4])
+        
+        # 计时器事件到达推送间隔时推送统计事件
+        self.assertFalse(eventList)
+        profiler.process(Event(EVENT_TIMER), [], 0)
+        self.assertEqual(len(eventList), 1)
+        self.assertEqual(eventList[0].type_, EVENT_PROFILE)
+        self.assertEqual(eventList[0].dict_['data']['events']['eA']['count'], 3)
+        
+        profiler.getProfile(reset=True)
+        self.assertEqual(profiler.getProfile()['events'], {})
+    
+    def test_engine(self):
+        ee = BatchEventEngine()
+        self.assertEqual(ee.getProfile(), {})
+        self.assertEqual(ee.dumpProfile(), '')
+        
+        resultList = []
+        ee.register('eA', resultList.append)
+        ee.setProfiling(True)
+        ee.start(timer=False)
+        
+        try:
+            for i in range(100):
+                ee.put(Event('eA'))
+            self.assertTrue(waitFor(lambda: len(resultList) >= 100))
+        finally:
+            ee.stop()
+        
+        d = ee.getProfile()
+        self.assertEqual(d['events']['eA']['count'], 100)
+        self.assertEqual(d['queue']['wait']['count'], 100)
+        self.assertIn('eA', ee.dumpProfile())
+        
+        ee.setProfiling(False)
+        self.assertEqual(ee.getProfile(), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
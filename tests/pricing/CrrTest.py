@@ -0,0 +1,78 @@
+# encoding: UTF-8
+
+import unittest
+
+import numpy as np
+
+from vnpy.pricing import crr
+
+
+class CrrTest(unittest.TestCase):
+    """批量二叉树和逐个生成完整二叉树的结果一致性"""
+    
+    def setUp(self):
+        self.f = 3.0
+        self.k = np.array([2.5, 2.8, 2.95, 3.0, 3.05, 3.2, 3.5] * 2)
+        self.cp = np.array([1] * 7 + [-1] * 7)
+        self.r = 0.03
+        self.t = 0.2
+        self.v = 0.25
+    
+    def test_price(self):
+        for n in (2, 15, 50):
+            price = crr.calculatePriceArray(self.f, self.k, self.r, self.t, self.v, self.cp, n)
+            
+            for i, (k, cp) in enumerate(zip(self.k, self.cp)):
+                oTree, uTree = crr.generateTree(self.f, k, self.r, self.t, self.v, cp, n)
+                self.assertAlmostEqual(price[i], oTree[0, 0], places=12)
+                self.assertAlmostEqual(crr.calculatePrice(self.f, k, self.r, self.t, self.v, cp, n), 
+                                       oTree[0, 0], places=12)
+    
+    def test_greeks(self):
+        price, delta, gamma, theta, vega = crr.calculateGreeksArray(self.f, self.k, self.r, self.t, 
+                                                                    self.v, self.cp)
+        
+        for i, (k, cp) in enumerate(zip(self.k, self.cp)):
+            oTree, uTree = crr.generateTree(self.f, k, self.r, self.t, self.v, cp, 15)
+            
+            # delta和gamma基于二叉树前两步的节点计算
+            originalDelta = (oTree[0, 1] - oTree[1, 1]) / (uTree[0, 1] - uTree[1, 1])
+            deltaUp = (oTree[0, 2] - oTree[1, 2]) / (uTree[0, 2] - uTree[1, 2])
+            deltaDown = (oTree[1, 2] - oTree[2, 2]) / (uTree[1, 2] - uTree[2, 2])
+            originalGamma = (deltaUp - deltaDown) / ((uTree[0, 2] - uTree[2, 2]) / 2)
+            
+            self.assertAlmostEqual(price[i], oTree[0, 0], places=12)
+            self.assertAlmostEqual(delta[i], originalDelta * self.f * 0.01, places=12)
+            self.assertAlmostEqual(gamma[i], (originalDelta + self.f * originalGamma) * 1e-6 * self.f ** 2, 
+                                   places=12)
+            self.assertAlmostEqual(theta[i], (oTree[1, 2] - oTree[0, 0]) / (2 * self.t / 15 * 240), 
+                                   places=12)
+            
+            # vega和逐个差分计算的方法相同
+            self.assertAlmostEqual(vega[i], crr.calculateVega(self.f, k, self.r, self.t, self.v, cp), 
+                                   places=10)
+    
+    def test_scalar(self):
+        result = crr.calculateGreeks(self.f, 3.0, self.r, self.t, self.v, 1)
+        expected = crr.calculateGreeksArray(self.f, 3.0, self.r, self.t, self.v, 1)
+        self.assertEqual(result, tuple([float(x) for x in expected]))
+    
+    def test_invalid(self):
+        intrinsic = np.maximum(0, self.cp * (self.f - self.k))
+        
+        price = crr.calculatePriceArray(self.f, self.k, self.r, 0, self.v, self.cp)
+        np.testing.assert_allclose(price, intrinsic)
+        
+        price, delta, gamma, theta, vega = crr.calculateGreeksArray(self.f, self.k, self.r, self.t, 
+                                                                    0, self.cp)
+        np.testing.assert_allclose(price, intrinsic)
+        self.assertFalse(gamma.any() or theta.any() or vega.any())
+    
+    def test_shape(self):
+        k = self.k.reshape(2, 7)
+        price = crr.calculatePriceArray(self.f, k, self.r, self.t, self.v, self.cp.reshape(2, 7))
+        self.assertEqual(price.shape, (2, 7))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+# encoding: UTF-8
+
+import unittest
+
+import numpy as np
+
+from vnpy.pricing import bs, black
+
+
+class GreeksArrayTest(unittest.TestCase):
+    """解析希腊值和逐个数值差分结果的一致性"""
+    
+    def setUp(self):
+        self.s = 3.0
+        self.k = np.array([2.5, 2.8, 2.95, 3.0, 3.05, 3.2, 3.5] * 2)
+        self.cp = np.array([1] * 7 + [-1] * 7)
+        self.r = 0.03
+        self.t = 0.2
+        self.v = 0.25
+    
+    def checkModel(self, model):
+        result = model.calculateGreeksArray(self.s, self.k, self.r, self.t, self.v, self.cp)
+        
+        for i, (k, cp) in enumerate(zip(self.k, self.cp)):
+            expected = model.calculateGreeks(self.s, k, self.r, self.t, self.v, cp)
+            
+            # 价格使用同样的解析公式，希腊值和差分结果的误差为差分步长的平方量级
+            price, delta, gamma, theta, vega = [x[i] for x in result]
+            self.assertAlmostEqual(price, expected[0], places=10)
+            np.testing.assert_allclose([delta, gamma, theta, vega], expected[1:], 
+                                       rtol=1e-3, atol=1e-7)
+    
+    def test_bs(self):
+        self.checkModel(bs)
+    
+    def test_black(self):
+        self.checkModel(black)
+    
+    def test_price(self):
+        for model in (bs, black):
+            price = model.calculatePriceArray(self.s, self.k, self.r, self.t, self.v, self.cp)
+            expected = [model.calculatePrice(self.s, k, self.r, self.t, self.v, cp) 
+                        for k, cp in zip(self.k, self.cp)]
+            np.testing.assert_allclose(price, expected, rtol=1e-12)
+    
+    def test_invalid(self):
+        # 剩余时间或波动率为0时按期权空间价值计算
+        for model in (bs, black):
+            price, delta, gamma, theta, vega = model.calculateGreeksArray(self.s, self.k, self.r, 
+                                                                          0, self.v, self.cp)
+            intrinsic = np.maximum(0, self.cp * (self.s - self.k))
+            np.testing.assert_allclose(price, intrinsic)
+            np.testing.assert_allclose(delta, np.where(intrinsic > 0, self.cp * self.s * 0.01, 0))
+            self.assertFalse(gamma.any() or theta.any() or vega.any())
+            
+            price = model.calculatePriceArray(self.s, self.k, self.r, self.t, 0, self.cp)
+            np.testing.assert_allclose(price, intrinsic)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+# encoding: UTF-8
+
+import unittest
+
+import numpy as np
+
+from vnpy.pricing import bs, black, crr
+from vnpy.pricing.impv import (solveImpv, IMPV_CONVERGED, IMPV_NOT_CONVERGED,
+                               IMPV_BELOW_MIN, IMPV_ABOVE_MAX, MAX_VOL)
+
+
+class ImpvArrayTest(unittest.TestCase):
+    """批量隐含波动率求解"""
+    
+    def setUp(self):
+        self.s = 3.0
+        self.k = np.array([2.5, 2.8, 2.95, 3.0, 3.05, 3.2, 3.5] * 2)
+        self.cp = np.array([1] * 7 + [-1] * 7)
+        self.r = 0.03
+        self.t = 0.2
+        self.v = np.linspace(0.15, 0.6, len(self.k))
+    
+    def checkRoundTrip(self, model, places=4):
+        price = model.calculatePriceArray(self.s, self.k, self.r, self.t, self.v, self.cp)
+        impv, status = model.calculateImpvArray(price, self.s, self.k, self.r, self.t, self.cp)
+        
+        self.assertTrue((status == IMPV_CONVERGED).all())
+        np.testing.assert_allclose(impv, self.v, atol=10 ** -places)
+        
+        # 使用上一次的结果热启动
+        impv2, status2 = model.calculateImpvArray(price, self.s, self.k, self.r, self.t, self.cp, 
+                                                  v0=impv)
+        self.assertTrue((status2 == IMPV_CONVERGED).all())
+        np.testing.assert_allclose(impv2, self.v, atol=10 ** -places)
+    
+    def test_bs(self):
+        self.checkRoundTrip(bs)
+    
+    def test_black(self):
+        self.checkRoundTrip(black)
+    
+    def test_crr(self):
+        self.checkRoundTrip(crr)
+    
+    def test_scalar(self):
+        # 和原有的逐个计算结果一致
+        for model in (bs, black):
+            price = model.calculatePriceArray(self.s, self.k, self.r, self.t, self.v, self.cp)
+            impv, status = model.calculateImpvArray(price, self.s, self.k, self.r, self.t, self.cp)
+            expected = [model.calculateImpv(p, self.s, k, self.r, self.t, cp) 
+                        for p, k, cp in zip(price, self.k, self.cp)]
+            np.testing.assert_allclose(impv, expected, atol=1e-4)
+    
+    def test_status(self):
+        for model in (bs, black, crr):
+            intrinsic = np.maximum(0, self.cp * (self.s - self.k))
+            price = model.calculatePriceArray(self.s, self.k, self.r, self.t, 0.3, self.cp)
+            
+            # 价格为0、低于内在价值、剩余时间为0时均无法计算
+            for p, t in ((0, self.t), (intrinsic * 0.5, self.t), (price, 0)):
+                impv, status = model.calculateImpvArray(p, self.s, self.k, self.r, t, self.cp)
+                self.assertTrue((status == IMPV_BELOW_MIN).all())
+                self.assertFalse(impv.any())
+            
+            # 价格高于最高波动率对应的价格
+            pMax = model.calculatePriceArray(self.s, self.k, self.r, self.t, MAX_VOL, self.cp)
+            impv, status = model.calculateImpvArray(pMax * 1.01, self.s, self.k, self.r, self.t, self.cp)
+            self.assertTrue((status == IMPV_ABOVE_MAX).all())
+            self.assertFalse(impv.any())
+    
+    def test_notConverged(self):
+        price = bs.calculatePriceArray(self.s, self.k, self.r, self.t, self.v, self.cp)
+        priceVegaFunc = lambda v, index: bs.calculatePriceVega(self.s, self.k[index], self.r, self.t, 
+                                                               v, self.cp[index])
+        valid = np.ones(len(price), dtype=bool)
+        
+        impv, status = solveImpv(price, valid, priceVegaFunc, maxIteration=1)
+        self.assertTrue((status == IMPV_NOT_CONVERGED).any())
+        self.assertTrue((impv[status == IMPV_NOT_CONVERGED] > 0).all())
+        
+        impv, status = solveImpv(price, valid, priceVegaFunc)
+        self.assertTrue((status == IMPV_CONVERGED).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+# encoding: UTF-8
+
+import unittest
+
+import numpy as np
+import talib
+
+from vnpy.trader.vtObject import VtBarData
+from vnpy.trader.vtUtility import ArrayManager, RingArrayManager
+
+
+#----------------------------------------------------------------------
+def generateBars(count, seed=0):
+    """生成随机K线"""
+    rng = np.random.RandomState(seed)
+    close = 100 + np.cumsum(rng.normal(0, 1, count))
+    
+    l = []
+    for c in close:
+        bar = VtBarData()
+        bar.open = c + rng.normal(0, 0.5)
+        bar.high = max(bar.open, c) + abs(rng.normal(0, 0.5))
+        bar.low = min(bar.open, c) - abs(rng.normal(0, 0.5))
+        bar.close = c
+        bar.volume = rng.randint(1, 100)
+        l.append(bar)
+    return l
+
+
+class RingArrayManagerTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.size = 50
+        self.am = ArrayManager(self.size)
+        self.ram = RingArrayManager(self.size)
+        self.bars = generateBars(300)
+    
+    def assertClose(self, a, b):
+        np.testing.assert_allclose(a, b, rtol=1e-7, atol=1e-7)
+    
+    def test_series(self):
+        for bar in self.bars:
+            self.am.updateBar(bar)
+            self.ram.updateBar(bar)
+            
+            self.assertEqual(self.am.inited, self.ram.inited)
+            self.assertClose(self.am.open, self.ram.open)
+            self.assertClose(self.am.high, self.ram.high)
+            self.assertClose(self.am.low, self.ram.low)
+            self.assertClose(self.am.close, self.ram.close)
+            self.assertClose(self.am.volume, self.ram.volume)
+    
+    def test_indicators(self):
+        for i, bar in enumerate(self.bars):
+            self.am.updateBar(bar)
+            self.ram.updateBar(bar)
+            
+            # 流式指标在初始化完成后首次调用时创建，之后增量更新
+            if not self.am.inited:
+                continue
+            
+            for n in (5, 20):
+                self.assertClose(self.am.sma(n), self.ram.sma(n))
+                self.assertClose(self.am.std(n), self.ram.std(n))
+                self.assertClose(self.am.boll(n, 2), self.ram.boll(n, 2))
+                self.assertClose(self.am.keltner(n, 2), self.ram.keltner(n, 2))
+                self.assertClose(self.am.donchian(n), self.ram.donchian(n))
+                self.assertClose(self.am.atr(n), self.ram.atr(n))
+                self.assertClose(self.am.rsi(n), self.ram.rsi(n))
+    
+    def test_array(self):
+        for bar in self.bars:
+            self.am.updateBar(bar)
+            self.ram.updateBar(bar)
+        
+        n = 10
+        self.assertClose(self.am.sma(n, True), self.ram.sma(n, True))
+        self.assertClose(self.am.std(n, True), self.ram.std(n, True))
+        self.assertClose(self.am.atr(n, True), self.ram.atr(n, True))
+        self.assertClose(self.am.rsi(n, True), self.ram.rsi(n, True))
+        self.assertClose(self.am.boll(n, 2, True), self.ram.boll(n, 2, True))
+        self.assertClose(self.am.keltner(n, 2, True), self.ram.keltner(n, 2, True))
+        self.assertClose(self.am.donchian(n, True), self.ram.donchian(n, True))
+    
+    def test_recursive(self):
+        ram = RingArrayManager(self.size, recursive=True)
+        
+        closeList = []
+        highList = []
+        lowList = []
+        for bar in self.bars:
+            ram.updateBar(bar)
+            closeList.append(bar.close)
+            highList.append(bar.high)
+            lowList.append(bar.low)
+            
+            if not ram.inited:
+                continue
+            
+            # 递推结果等同于在全部历史数据上计算
+            close = np.array(closeList)
+            atr = talib.ATR(np.array(highList), np.array(lowList), close, 14)[-1]
+            rsi = talib.RSI(close, 14)[-1]
+            self.assertClose(ram.atr(14), atr)
+            self.assertClose(ram.rsi(14), rsi)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+# encoding: UTF-8
+
+import random
+import unittest
+from datetime import datetime, timedelta
+
+from vnpy.trader.vtObject import VtBarData
+from vnpy.trader.app.ctaStrategy.ctaBacktesting import BacktestingEngine
+from vnpy.trader.app.ctaStrategy.ctaTemplate import CtaTemplate
+
+
+########################################################################
+class GridStrategy(CtaTemplate):
+    """挂有大量限价单和停止单的网格策略，记录收到的所有回调"""
+    className = 'GridStrategy'
+    
+    #----------------------------------------------------------------------
+    def __init__(self, ctaEngine, setting):
+        super(GridStrategy, self).__init__(ctaEngine, setting)
+        self.eventList = []
+        self.barCount = 0
+    
+    #----------------------------------------------------------------------
+    def onBar(self, bar):
+        self.barCount += 1
+        
+        # 每隔几根K线全部撤单，其余时间委托不断累积
+        if self.barCount % 7 == 0:
+            self.cancelAll()
+        
+        for i in range(1, 4):
+            self.buy(bar.close - i, 1)
+            self.short(bar.close + i, 1)
+        
+        self.buy(bar.close + 3, 2, stop=True)
+        self.short(bar.close - 3, 2, stop=True)
+        
+        # 撤销一部分较早的委托
+        if self.barCount % 3 == 0:
+            self.cancelOrder(str(self.barCount))
+            self.cancelOrder('CtaStopOrder.%s' % self.barCount)
+    
+    #----------------------------------------------------------------------
+    def onOrder(self, order):
+        self.eventList.append(('order', order.orderID, order.status, order.tradedVolume))
+    
+    #----------------------------------------------------------------------
+    def onTrade(self, trade):
+        self.eventList.append(('trade', trade.tradeID, trade.orderID, trade.direction,
+                               trade.offset, trade.price, trade.volume))
+        
+        # 成交回调中继续发单
+        if trade.volume == 1:
+            self.sell(trade.price + 2, 1)
+    
+    #----------------------------------------------------------------------
+    def onStopOrder(self, so):
+        self.eventList.append(('stop', so.stopOrderID, so.status))
+
+
+#----------------------------------------------------------------------
+def generateBars(count, seed=0):
+    """生成随机游走的K线"""
+    random.seed(seed)
+    
+    barList = []
+    price = 1000
+    dt = datetime(2018, 1, 2, 9, 0)
+    
+    for i in range(count):
+        bar = VtBarData()
+        bar.vtSymbol = 'rb1805'
+        bar.datetime = dt
+        bar.open = price
+        bar.close = price + random.randint(-5, 5)
+        bar.high = max(bar.open, bar.close) + random.randint(0, 3)
+        bar.low = min(bar.open, bar.close) - random.randint(0, 3)
+        barList.append(bar)
+        
+        price = bar.close
+        dt += timedelta(minutes=1)
+    
+    return barList
+
+
+class MatchingKernelTest(unittest.TestCase):
+    
+    def runBacktesting(self, barList, vectorized):
+        engine = BacktestingEngine()
+        engine.setBacktestingMode(engine.BAR_MODE)
+        engine.setPriceTick(1)
+        engine.setVectorizedMatching(vectorized)
+        engine.initStrategy(GridStrategy, {'vtSymbol': 'rb1805'})
+        engine.strategy.inited = True
+        engine.strategy.trading = True
+        
+        for bar in barList:
+            engine.newBar(bar)
+        
+        return engine
+    
+    def test_parity(self):
+        barList = generateBars(500)
+        
+        engine = self.runBacktesting(barList, False)
+        kernelEngine = self.runBacktesting(barList, True)
+        
+        self.assertTrue(len(engine.tradeDict) > 100)
+        self.assertEqual(kernelEngine.strategy.eventList, engine.strategy.eventList)
+        self.assertEqual(kernelEngine.strategy.pos, engine.strategy.pos)
+        
+        tradeList = [(t.tradeID, t.orderID, t.direction, t.price, t.volume, t.dt)
+                     for t in engine.tradeDict.values()]
+        kernelTradeList = [(t.tradeID, t.orderID, t.direction, t.price, t.volume, t.dt)
+                           for t in kernelEngine.tradeDict.values()]
+        self.assertEqual(kernelTradeList, tradeList)
+        
+        self.assertEqual(sorted(kernelEngine.workingLimitOrderDict.keys()),
+                         sorted(engine.workingLimitOrderDict.keys()))
+        self.assertEqual(sorted(kernelEngine.workingStopOrderDict.keys()),
+                         sorted(engine.workingStopOrderDict.keys()))
+    
+    def test_clear(self):
+        barList = generateBars(100, seed=1)
+        
+        engine = self.runBacktesting(barList, True)
+        eventList = engine.strategy.eventList
+        
+        # 清空结果后重新回测，委托数组同样被清空
+        engine.clearBacktestingResult()
+        engine.initStrategy(GridStrategy, {'vtSymbol': 'rb1805'})
+        engine.strategy.inited = True
+        engine.strategy.trading = True
+        for bar in barList:
+            engine.newBar(bar)
+        
+        self.assertEqual(engine.strategy.eventList, eventList)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+# encoding: UTF-8
+
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from vnpy.trader.vtObject import VtBarData, VtTickData, VtCompactBarData
+from vnpy.trader.vtDataStore import ColumnarStore, DATA_BAR, DATA_TICK
+
+
+#----------------------------------------------------------------------
+def generateBars(start, count, price=100.0):
+    """生成分钟K线"""
+    l = []
+    for i in range(count):
+        bar = VtBarData()
+        bar.vtSymbol = 'rb1801'
+        bar.symbol = 'rb1801'
+        bar.exchange = 'SHFE'
+        bar.datetime = start + timedelta(minutes=i)
+        bar.date = bar.datetime.strftime('%Y%m%d')
+        bar.time = bar.datetime.strftime('%H:%M:%S')
+        bar.open = price + i
+        bar.high = price + i + 2
+        bar.low = price + i - 2
+        bar.close = price + i + 1
+        bar.volume = 10 + i
+        l.append(bar)
+    return l
+
+
+class ColumnarStoreTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.store = ColumnarStore(self.path)
+        self.dbName = 'VnTrader_1Min_Db'
+        self.start = datetime(2018, 1, 2, 9, 0)
+    
+    def tearDown(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+    
+    def test_writeRead(self):
+        barList = generateBars(self.start, 100)
+        self.assertEqual(self.store.writeData(self.dbName, 'rb1801', barList, DATA_BAR), 100)
+        self.assertTrue(self.store.hasData(self.dbName, 'rb1801'))
+        
+        array = self.store.loadArray(self.dbName, 'rb1801')
+        self.assertEqual(len(array), 100)
+        
+        # 读取的对象和写入的一致，不随行变化的字段从元数据恢复
+        dataList = list(self.store.iterData(self.dbName, 'rb1801', array, chunkSize=30))
+        self.assertEqual(len(dataList), 100)
+        for bar, data in zip(barList, dataList):
+            self.assertIsInstance(data, VtBarData)
+            self.assertEqual(data.__dict__, bar.__dict__)
+        
+        compactList = list(self.store.iterData(self.dbName, 'rb1801', array, compact=True))
+        self.assertIsInstance(compactList[0], VtCompactBarData)
+        self.assertEqual(compactList[-1].__dict__, barList[-1].__dict__)
+    
+    def test_range(self):
+        self.store.writeData(self.dbName, 'rb1801', generateBars(self.start, 100), DATA_BAR)
+        
+        start = self.start + timedelta(minutes=10)
+        end = self.start + timedelta(minutes=19)
+        
+        array = self.store.loadRange(self.dbName, 'rb1801', start, end)
+        self.assertEqual(len(array), 10)
+        self.assertEqual(array['close'][0], 111)
+        
+        array = self.store.loadRange(self.dbName, 'rb1801', start, end, includeEnd=False)
+        self.assertEqual(len(array), 9)
+        
+        self.assertEqual(len(self.store.loadRange(self.dbName, 'rb1801', end=end)), 20)
+        self.assertEqual(len(self.store.loadRange(self.dbName, 'rb1801', start=start)), 90)
+        self.assertEqual(len(self.store.loadRange(self.dbName, 'rb1801', start=datetime(2019, 1, 1))), 0)
+    
+    def test_merge(self):
+        self.store.writeData(self.dbName, 'rb1801', generateBars(self.start, 50), DATA_BAR)
+        
+        # 和已有数据合并，重叠部分以后写入的为准
+        start = self.start + timedelta(minutes=40)
+        count = self.store.writeData(self.dbName, 'rb1801', generateBars(start, 20, 200.0), DATA_BAR)
+        self.assertEqual(count, 60)
+        
+        array = self.store.loadArray(self.dbName, 'rb1801')
+        self.assertTrue((array['datetime'][1:] > array['datetime'][:-1]).all())
+        self.assertEqual(array['close'][39], 140)
+        self.assertEqual(array['close'][40], 201)
+    
+    def test_tick(self):
+        tick = VtTickData()
+        tick.vtSymbol = 'rb1801'
+        tick.datetime = self.start
+        tick.lastPrice = 3500.0
+        tick.bidPrice1 = 3499.0
+        tick.askPrice1 = 3501.0
+        tick.time = '09:00:00.500'
+        
+        d = dict(tick.__dict__)
+        d['_id'] = 'mongo'
+        self.store.writeData('VnTrader_Tick_Db', 'rb1801', [tick, d], DATA_TICK)
+        
+        array = self.store.loadArray('VnTrader_Tick_Db', 'rb1801')
+        self.assertEqual(len(array), 1)
+        
+        data = list(self.store.iterData('VnTrader_Tick_Db', 'rb1801', array))[0]
+        self.assertEqual(data.lastPrice, 3500.0)
+        self.assertEqual(data.time, '09:00:00.500')
+        self.assertEqual(data.datetime, self.start)
+    
+    def test_delete(self):
+        self.store.writeData(self.dbName, 'rb1801', generateBars(self.start, 10), DATA_BAR)
+        self.store.deleteData(self.dbName, 'rb1801')
+        self.assertFalse(self.store.hasData(self.dbName, 'rb1801'))
+        self.assertEqual(self.store.writeData(self.dbName, 'rb1801', [], DATA_BAR), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+# encoding: UTF-8
+
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+
+from vnpy.trader.app.ctaStrategy.ctaHistoryData import (loadMcCsv, loadTbCsv, loadTbPlusCsv,
+                                                        loadTdxCsv, loadOKEXCsv)
+from vnpy.trader.vtDataStore import ColumnarStore
+
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+
+#----------------------------------------------------------------------
+def getDataFile(name):
+    """获取测试数据文件路径"""
+    return os.path.join(DATA_PATH, name)
+
+
+class CsvLoaderTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.store = ColumnarStore(self.path)
+        self.dbName = 'VnTrader_1Min_Db'
+    
+    def tearDown(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+    
+    def loadBars(self, symbol):
+        array = self.store.loadArray(self.dbName, symbol)
+        return [(dt.astype(datetime), str(date), str(time)) for dt, date, time in 
+                zip(array['datetime'], array['date'], array['time'])], array
+    
+    def test_mc(self):
+        count = loadMcCsv(getDataFile('mc.csv'), self.dbName, 'rb', self.store)
+        self.assertEqual(count, 3)
+        
+        l, array = self.loadBars('rb')
+        self.assertEqual(l[0], (datetime(2017, 9, 28, 9, 0), '20170928', '09:00:00'))
+        self.assertEqual(l[2], (datetime(2017, 9, 28, 9, 2), '20170928', '09:02:00'))
+        
+        # 重复的时间戳保留文件中靠后的一条
+        self.assertEqual(array['close'][1], 3453)
+        self.assertEqual(array['volume'][1], 130)
+    
+    def test_mcEmpty(self):
+        self.assertEqual(loadMcCsv(getDataFile('empty.csv'), self.dbName, 'rb', self.store), 0)
+        self.assertEqual(loadMcCsv(getDataFile('mc_empty_body.csv'), self.dbName, 'rb', self.store), 0)
+        self.assertFalse(self.store.hasData(self.dbName, 'rb'))
+    
+    def test_empty(self):
+        for func in (loadTbCsv, loadTbPlusCsv, loadTdxCsv, loadOKEXCsv):
+            self.assertEqual(func(getDataFile('empty.csv'), self.dbName, 'rb', self.store), 0)
+    
+    def test_tb(self):
+        self.assertEqual(loadTbCsv(getDataFile('tb.csv'), self.dbName, 'rb', self.store), 2)
+        
+        l, array = self.loadBars('rb')
+        self.assertEqual(l[0], (datetime(2017, 9, 28, 9, 5), '20170928', '09:05:00'))
+        self.assertEqual(l[1], (datetime(2017, 9, 28, 21, 5), '20170928', '21:05:00'))
+        self.assertEqual(list(array['openInterest']), [2010, 2000])
+    
+    def test_tbPlus(self):
+        self.assertEqual(loadTbPlusCsv(getDataFile('tbplus.csv'), self.dbName, 'rb', self.store), 2)
+        
+        l, array = self.loadBars('rb')
+        self.assertEqual(l[0], (datetime(2017, 9, 28, 9, 5), '20170928', '09:05:00'))
+        self.assertEqual(l[1], (datetime(2017, 9, 28, 21, 1), '20170928', '21:01:00'))
+    
+    def test_tdx(self):
+        self.assertEqual(loadTdxCsv(getDataFile('tdx.csv'), self.dbName, 'rb', self.store), 4)
+        
+        # 夜盘K线的日期改为之前最近一根15:00的K线的日期，之前没有15:00的K线时不变
+        l, array = self.loadBars('rb')
+        self.assertEqual(l[0], (datetime(2017, 9, 27, 21, 1), '20170927', '21:01:00'))
+        self.assertEqual(l[1], (datetime(2017, 9, 28, 9, 1), '20170928', '09:01:00'))
+        self.assertEqual(l[3], (datetime(2017, 9, 28, 21, 1), '20170928', '21:01:00'))
+    
+    def test_okex(self):
+        self.assertEqual(loadOKEXCsv(getDataFile('okex.csv'), self.dbName, 'btc', self.store), 2)
+        
+        l, array = self.loadBars('btc')
+        self.assertEqual(l[1], (datetime(2018, 1, 1, 0, 1), '20180101', '00:01:00'))
+        self.assertEqual(list(array['close']), [13005, 13015])
+
+
+if __name__ == '__main__':
+    unittest.main()
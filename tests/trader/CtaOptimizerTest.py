@@ -0,0 +1,108 @@
+# encoding: UTF-8
+
+import unittest
+from collections import OrderedDict
+
+from vnpy.trader.app.ctaStrategy.ctaOptimizer import SearchBase, GeneticSearch, SurrogateSearch
+
+
+#----------------------------------------------------------------------
+def generateParamDict(fastCount=20, slowCount=15):
+    """生成参数网格"""
+    paramDict = OrderedDict()
+    paramDict['fastWindow'] = list(range(fastCount))
+    paramDict['slowWindow'] = [10 * i for i in range(slowCount)]
+    return paramDict
+
+#----------------------------------------------------------------------
+def calculateTarget(setting):
+    """最优值在fastWindow=7、slowWindow=30处的目标函数"""
+    return -(setting['fastWindow'] - 7) ** 2 - (setting['slowWindow'] / 10 - 3) ** 2
+
+
+class OptimizerTest(unittest.TestCase):
+    
+    def runSearch(self, searcher):
+        """运行ask/tell循环，返回每批的参数组合列表"""
+        batchList = []
+        toldSet = set()
+        
+        while True:
+            settingList = searcher.ask()
+            if not settingList:
+                break
+            
+            keyList = [str(sorted(setting.items())) for setting in settingList]
+            
+            # 同一批中不重复，且不会再次返回已回测过的组合
+            self.assertEqual(len(set(keyList)), len(keyList))
+            self.assertFalse(toldSet & set(keyList))
+            toldSet.update(keyList)
+            
+            searcher.tell(settingList, [calculateTarget(setting) for setting in settingList])
+            batchList.append(settingList)
+        
+        return batchList
+    
+    def test_tell(self):
+        searcher = SearchBase(generateParamDict(), seed=0)
+        self.assertEqual(searcher.totalCount, 300)
+        self.assertEqual(searcher.toSetting((2, 3)), {'fastWindow': 2, 'slowWindow': 30})
+        
+        # 运行出错的组合按已有结果中的最差值处理
+        searcher.tell([{'fastWindow': 1, 'slowWindow': 0}, {'fastWindow': 2, 'slowWindow': 10}],
+                      [-5, None])
+        self.assertEqual(searcher.fitnessDict, {(1, 0): -5, (2, 1): -5})
+        
+        searcher.tell([{'fastWindow': 3, 'slowWindow': 10}], [None])
+        self.assertEqual(searcher.fitnessDict[(3, 1)], -5)
+        
+        # 全部为正值时最差值为0
+        searcher = SearchBase(generateParamDict(), seed=0)
+        searcher.tell([{'fastWindow': 1, 'slowWindow': 0}, {'fastWindow': 2, 'slowWindow': 10}],
+                      [5, None])
+        self.assertEqual(searcher.fitnessDict[(2, 1)], 0)
+    
+    def test_genetic(self):
+        searcher = GeneticSearch(generateParamDict(), populationSize=20, generations=15, seed=1)
+        batchList = self.runSearch(searcher)
+        
+        self.assertEqual(searcher.generation, searcher.generations)
+        self.assertTrue(len(batchList) <= searcher.generations)
+        self.assertTrue(len(searcher.fitnessDict) < searcher.totalCount)
+        self.assertEqual(max(searcher.fitnessDict.values()), 0)
+        
+        # 相同种子的搜索过程相同
+        searcher2 = GeneticSearch(generateParamDict(), populationSize=20, generations=15, seed=1)
+        self.assertEqual(self.runSearch(searcher2), batchList)
+    
+    def test_geneticConverged(self):
+        # 网格全部回测完后继续繁殖，直到达到迭代代数才结束
+        searcher = GeneticSearch(generateParamDict(3, 3), populationSize=10, generations=30, 
+                                 seed=2)
+        self.runSearch(searcher)
+        
+        self.assertEqual(searcher.generation, 30)
+        self.assertEqual(len(searcher.fitnessDict), 9)
+        self.assertEqual(searcher.ask(), [])
+    
+    def test_surrogate(self):
+        searcher = SurrogateSearch(generateParamDict(), initPoints=10, iterations=8, 
+                                   batchSize=4, seed=3)
+        batchList = self.runSearch(searcher)
+        
+        self.assertEqual(len(batchList[0]), 10)
+        self.assertEqual([len(l) for l in batchList[1:]], [4] * 8)
+        self.assertEqual(searcher.iteration, 8)
+        self.assertTrue(max(searcher.fitnessDict.values()) >= -1)
+    
+    def test_surrogateExhausted(self):
+        # 网格小于批量时回测完全部组合后结束
+        searcher = SurrogateSearch(generateParamDict(3, 2), initPoints=2, iterations=10, 
+                                   batchSize=3, seed=4)
+        self.runSearch(searcher)
+        self.assertEqual(len(searcher.fitnessDict), 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
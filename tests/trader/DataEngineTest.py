@@ -0,0 +1,106 @@
+# encoding: UTF-8
+
+import logging
+import unittest
+
+from vnpy.event import Event
+from vnpy.trader.vtConstant import (DIRECTION_SHORT, OFFSET_CLOSE,
+                                    STATUS_NOTTRADED)
+from vnpy.trader.vtEngine import DataEngine
+from vnpy.trader.vtEvent import EVENT_LOG, EVENT_ORDER
+from vnpy.trader.vtObject import VtLogData, VtOrderData
+
+
+class FakeEventEngine(object):
+    """记录推送事件的事件引擎"""
+    
+    def __init__(self):
+        self.eventList = []
+    
+    def register(self, type_, handler):
+        pass
+    
+    def put(self, event):
+        self.eventList.append(event)
+
+
+class DataEngineTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.ee = FakeEventEngine()
+        self.engine = DataEngine(self.ee)
+        self.vtSymbol = 'rb1801.SHFE'
+    
+    def newOrderEvent(self, vtOrderID, volume):
+        order = VtOrderData()
+        order.gatewayName = 'CTP'
+        order.vtSymbol = self.vtSymbol
+        order.vtOrderID = vtOrderID
+        order.direction = DIRECTION_SHORT
+        order.offset = OFFSET_CLOSE
+        order.totalVolume = volume
+        order.status = STATUS_NOTTRADED
+        
+        event = Event(type_=EVENT_ORDER)
+        event.dict_['data'] = order
+        return event
+    
+    def test_frozenCheck(self):
+        self.engine.setFrozenCheck(True)
+        detail = self.engine.getPositionDetail(self.vtSymbol)
+        detail.longTd = 10
+        
+        self.engine.processOrderEvent(self.newOrderEvent('CTP.1', 2))
+        self.assertEqual(self.ee.eventList, [])
+        self.assertEqual(detail.longPosFrozen, 2)
+        
+        # 人为破坏增量计算结果
+        detail.frozenSumDict[(DIRECTION_SHORT, OFFSET_CLOSE)] += 5
+        self.engine.processOrderEvent(self.newOrderEvent('CTP.2', 3))
+        
+        self.assertEqual(len(self.ee.eventList), 1)
+        event = self.ee.eventList[0]
+        self.assertEqual(event.type_, EVENT_LOG)
+        
+        log = event.dict_['data']
+        self.assertEqual(log.logLevel, logging.WARNING)
+        self.assertEqual(log.gatewayName, 'CTP')
+        self.assertIn(self.vtSymbol, log.logContent)
+        
+        # 冻结量已经修正
+        self.assertEqual(detail.longPosFrozen, 5)
+        self.assertTrue(detail.checkFrozen())
+    
+    def newLogEvent(self, gatewayName, logLevel=logging.INFO):
+        log = VtLogData()
+        log.gatewayName = gatewayName
+        log.logContent = u'test'
+        log.logLevel = logLevel
+        
+        event = Event(type_=EVENT_LOG)
+        event.dict_['data'] = log
+        return event
+    
+    def test_logRate(self):
+        self.engine.logRateLimit = 2
+        
+        # 每个来源分别限流，WARNING及以上级别不限流
+        for i in range(5):
+            self.engine.processLogEvent(self.newLogEvent('CTP'))
+            self.engine.processLogEvent(self.newLogEvent('RiskManager'))
+            self.engine.processLogEvent(self.newLogEvent(''))
+        self.engine.processLogEvent(self.newLogEvent('CTP', logging.WARNING))
+        
+        logList = self.engine.getLog()
+        count = lambda name: len([log for log in logList if log.gatewayName == name])
+        self.assertEqual(count('CTP'), 3)
+        self.assertEqual(count('RiskManager'), 2)
+        self.assertEqual(count(''), 2)
+        
+        self.assertIn('CTP', self.engine.logRateDict)
+        self.assertIn('RiskManager', self.engine.logRateDict)
+        self.assertIn(EVENT_LOG, self.engine.logRateDict)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+# encoding: UTF-8
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from time import sleep, time
+
+from pymongo.errors import BulkWriteError
+
+from vnpy.trader.vtEvent import EVENT_TIMER
+from vnpy.trader.vtObject import VtTickData
+from vnpy.trader.app.dataRecorder.drEngine import DrEngine
+from vnpy.trader.app.dataRecorder.drBase import TICK_DB_NAME
+
+
+#----------------------------------------------------------------------
+def waitFor(condition, timeout=5):
+    """等待插入线程完成处理"""
+    end = time() + timeout
+    while not condition() and time() < end:
+        sleep(0.001)
+    return condition()
+
+
+########################################################################
+class FakeEventEngine(object):
+    """记录推送事件的事件引擎"""
+    
+    #----------------------------------------------------------------------
+    def __init__(self):
+        self.eventList = []
+    
+    #----------------------------------------------------------------------
+    def register(self, type_, handler):
+        pass
+    
+    #----------------------------------------------------------------------
+    def put(self, event):
+        self.eventList.append(event)
+
+
+########################################################################
+class FakeMainEngine(object):
+    """记录批量插入请求的主引擎"""
+    
+    #----------------------------------------------------------------------
+    def __init__(self):
+        self.insertList = []        # 元素为(dbName, collectionName, dList)
+        self.error = None           # 插入时抛出的异常
+    
+    #----------------------------------------------------------------------
+    def subscribe(self, req, gatewayName):
+        pass
+    
+    #----------------------------------------------------------------------
+    def dbInsertMany(self, dbName, collectionName, dList, ordered=False):
+        self.insertList.append((dbName, collectionName, dList))
+        if self.error:
+            raise self.error
+        return len(dList)
+
+
+class DrEngineTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        
+        setting = {
+            'working': True,
+            'tick': [['rb1810', 'CTP', 'SHFE']],
+            'active': {'rb0000.SHFE': 'rb1810.SHFE'},
+            'batchSize': 3,
+            'flushInterval': 0.05
+        }
+        settingFilePath = os.path.join(self.path, 'DR_setting.json')
+        with open(settingFilePath, 'w') as f:
+            json.dump(setting, f)
+        
+        self.mainEngine = FakeMainEngine()
+        self.eventEngine = FakeEventEngine()
+        
+        DrEngine.settingFilePath = settingFilePath
+        self.engine = DrEngine(self.mainEngine, self.eventEngine)
+    
+    def tearDown(self):
+        self.engine.stop()
+        del DrEngine.settingFilePath
+        shutil.rmtree(self.path, ignore_errors=True)
+    
+    def insertTicks(self, count):
+        for i in range(count):
+            tick = VtTickData()
+            tick.vtSymbol = 'rb1810.SHFE'
+            tick.lastPrice = 3000 + i
+            self.engine.onTick(tick)
+    
+    def getLogList(self):
+        return [event.dict_['data'].logContent for event in self.eventEngine.eventList]
+    
+    def test_batchFlush(self):
+        self.insertTicks(7)
+        self.assertTrue(waitFor(lambda: self.engine.insertCount >= 14))
+        
+        # 主力合约和具体合约分别按批量大小写入，剩余数据超时后写入
+        for name in ['rb1810.SHFE', 'rb0000.SHFE']:
+            l = [dList for dbName, collectionName, dList in self.mainEngine.insertList
+                 if dbName == TICK_DB_NAME and collectionName == name]
+            self.assertEqual([len(dList) for dList in l], [3, 3, 1])
+            self.assertEqual([d['lastPrice'] for dList in l for d in dList], 
+                             list(range(3000, 3007)))
+        
+        # 写入不同集合的是不同的字典对象
+        dList1 = self.mainEngine.insertList[0][2]
+        dList2 = self.mainEngine.insertList[1][2]
+        self.assertIsNot(dList1[0], dList2[0])
+        
+        backlog = self.engine.getBacklog()
+        self.assertEqual(backlog['bufferCount'], 0)
+        self.assertEqual(backlog['failCount'], 0)
+        self.assertEqual(backlog['flushCount'], 6)
+    
+    def test_bulkWriteError(self):
+        self.mainEngine.error = BulkWriteError({'nInserted': 2, 
+                                                'writeErrors': [{'errmsg': 'duplicate key'}]})
+        self.insertTicks(3)
+        self.assertTrue(waitFor(lambda: self.engine.flushCount >= 2))
+        
+        # 只统计实际写入成功的数量
+        self.assertEqual(self.engine.insertCount, 4)
+        self.assertEqual(self.engine.failCount, 2)
+        
+        self.mainEngine.error = ValueError('connection lost')
+        self.insertTicks(3)
+        self.assertTrue(waitFor(lambda: self.engine.flushCount >= 4))
+        self.assertEqual(self.engine.insertCount, 4)
+        self.assertEqual(self.engine.failCount, 8)
+    
+    def test_backlogLog(self):
+        def runTimer():
+            del self.eventEngine.eventList[:]
+            for i in range(10):
+                self.engine.processTimerEvent(None)
+            return [content for content in self.getLogList() if u'积压' in content]
+        
+        self.assertEqual(runTimer(), [])
+        
+        # 有新的失败数据时输出一次，之后不再重复输出
+        self.mainEngine.error = ValueError('connection lost')
+        self.insertTicks(3)
+        self.assertTrue(waitFor(lambda: self.engine.failCount >= 6))
+        
+        self.assertEqual(len(runTimer()), 1)
+        self.assertEqual(runTimer(), [])
+        
+        self.engine.dropCount += 1
+        self.assertEqual(len(runTimer()), 1)
+        self.assertEqual(runTimer(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
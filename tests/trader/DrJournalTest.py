@@ -0,0 +1,174 @@
+# encoding: UTF-8
+
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from time import sleep, time
+
+from pymongo import ReplaceOne
+
+from vnpy.trader.app.dataRecorder.drJournal import (DrJournal, readJournal, listJournal,
+                                                    replayToMongo, HEADER)
+
+
+DB_NAME = 'VnTrader_Tick_Db'
+
+
+#----------------------------------------------------------------------
+def generateTicks(count):
+    """生成Tick数据字典，每两个Tick的时间戳相同"""
+    start = datetime(2018, 1, 2, 9, 0)
+    return [{'vtSymbol': 'rb1805', 
+             'lastPrice': 3000.0 + i, 
+             'volume': i,
+             'datetime': start + timedelta(seconds=i // 2)} 
+            for i in range(count)]
+
+
+########################################################################
+class FakeCollection(object):
+    """记录批量写入请求的集合"""
+    
+    #----------------------------------------------------------------------
+    def __init__(self):
+        self.requestList = []
+    
+    #----------------------------------------------------------------------
+    def bulk_write(self, requests, ordered=True):
+        self.requestList.extend(requests)
+
+
+########################################################################
+class FakeDb(object):
+    """按集合名返回集合的数据库"""
+    
+    #----------------------------------------------------------------------
+    def __init__(self):
+        self.collectionDict = {}
+    
+    #----------------------------------------------------------------------
+    def __getitem__(self, name):
+        return self.collectionDict.setdefault(name, FakeCollection())
+
+
+class DrJournalTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+    
+    def writeJournal(self, dList, collectionName='rb1805'):
+        journal = DrJournal(self.path, fsyncInterval=0)
+        for d in dList:
+            journal.write(DB_NAME, collectionName, d)
+        journal.close()
+        
+        fileList = listJournal(self.path)
+        self.assertEqual(len(fileList), 1)
+        return fileList[0]
+    
+    def test_readWrite(self):
+        dList = generateTicks(10)
+        fileName = self.writeJournal(dList)
+        
+        self.assertEqual(list(readJournal(fileName)), 
+                         [(DB_NAME, 'rb1805', d) for d in dList])
+        
+        # 主力合约的记录展开为多条
+        os.remove(fileName)
+        fileName = self.writeJournal(dList[:2], ('rb1805', 'rb0000'))
+        self.assertEqual([name for dbName, name, d in readJournal(fileName)],
+                         ['rb1805', 'rb0000', 'rb1805', 'rb0000'])
+    
+    def getOffsetList(self, fileName):
+        """获取每条记录在文件中的起始位置"""
+        offsetList = []
+        with open(fileName, 'rb') as f:
+            data = f.read()
+        
+        offset = 0
+        while offset < len(data):
+            offsetList.append(offset)
+            length, crc = HEADER.unpack(data[offset:offset+HEADER.size])
+            offset += HEADER.size + length
+        return offsetList
+    
+    def test_tornTail(self):
+        dList = generateTicks(10)
+        fileName = self.writeJournal(dList)
+        offsetList = self.getOffsetList(fileName)
+        self.assertEqual(len(offsetList), 10)
+        
+        # 崩溃时最后一条记录的数据只写了一半，读取到完整的记录为止
+        with open(fileName, 'rb+') as f:
+            f.truncate(os.path.getsize(fileName) - 5)
+        self.assertEqual([d for dbName, name, d in readJournal(fileName)], dList[:9])
+        
+        # 只写了一半的记录头
+        with open(fileName, 'rb+') as f:
+            f.truncate(offsetList[8] + 3)
+        self.assertEqual([d for dbName, name, d in readJournal(fileName)], dList[:8])
+    
+    def test_crc(self):
+        dList = generateTicks(10)
+        fileName = self.writeJournal(dList)
+        offsetList = self.getOffsetList(fileName)
+        
+        # 第4条记录的数据损坏时校验失败，停止读取
+        with open(fileName, 'rb') as f:
+            data = bytearray(f.read())
+        data[offsetList[3] + HEADER.size + 10] ^= 0xff
+        with open(fileName, 'wb') as f:
+            f.write(bytes(data))
+        
+        self.assertEqual([d for dbName, name, d in readJournal(fileName)], dList[:3])
+    
+    def test_sync(self):
+        journal = DrJournal(self.path, fsyncInterval=0.01)
+        try:
+            journal.write(DB_NAME, 'rb1805', generateTicks(1)[0])
+            
+            # 同步线程定时将缓存写入文件
+            fileName = listJournal(self.path)[0]
+            end = time() + 5
+            while not os.path.getsize(fileName) and time() < end:
+                sleep(0.01)
+            self.assertEqual(len(list(readJournal(fileName))), 1)
+            self.assertFalse(journal.dirty)
+        finally:
+            journal.close()
+        
+        self.assertFalse(journal.thread)
+        self.assertIsNone(journal.f)
+    
+    def test_list(self):
+        for date in ['20180101', '20180102', '20180103']:
+            open(os.path.join(self.path, date + '.jnl'), 'wb').close()
+        open(os.path.join(self.path, 'readme.txt'), 'wb').close()
+        
+        fileList = listJournal(self.path, '20180102')
+        self.assertEqual([os.path.basename(name) for name in fileList], 
+                         ['20180102.jnl', '20180103.jnl'])
+        fileList = listJournal(self.path, endDate='20180101')
+        self.assertEqual([os.path.basename(name) for name in fileList], ['20180101.jnl'])
+        self.assertEqual(listJournal(os.path.join(self.path, 'none')), [])
+    
+    def test_replayToMongo(self):
+        dList = generateTicks(6)
+        fileName = self.writeJournal(dList)
+        
+        db = FakeDb()
+        count = replayToMongo({DB_NAME: db}, [fileName], chunkSize=4)
+        self.assertEqual(count, 6)
+        
+        # 时间戳相同的不同Tick以完整记录作为查询条件，不会互相覆盖
+        requestList = db['rb1805'].requestList
+        self.assertEqual(requestList, [ReplaceOne(d, d, upsert=True) for d in dList])
+
+
+if __name__ == '__main__':
+    unittest.main()
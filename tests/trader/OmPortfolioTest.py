@@ -0,0 +1,167 @@
+# encoding: UTF-8
+
+import random
+import unittest
+
+import numpy as np
+
+from vnpy.pricing import bs, black
+from vnpy.trader.vtConstant import (DIRECTION_LONG, DIRECTION_SHORT, OFFSET_OPEN, OFFSET_CLOSE,
+                                    OPTION_CALL, OPTION_PUT, PRODUCT_EQUITY)
+from vnpy.trader.vtObject import VtContractData, VtTickData, VtTradeData
+from vnpy.trader.app.optionMaster.omBase import OmUnderlying, OmOption, OmChain, OmPortfolio
+
+
+UNDERLYING_SYMBOL = '510050'
+STRIKE_COUNT = 10
+
+
+#----------------------------------------------------------------------
+def newContract(symbol, strikePrice=0, optionType=''):
+    """创建合约"""
+    contract = VtContractData()
+    contract.symbol = symbol
+    contract.vtSymbol = symbol
+    contract.size = 10000
+    contract.strikePrice = strikePrice
+    contract.optionType = optionType
+    contract.expiryDate = '20991218'
+    contract.productClass = PRODUCT_EQUITY
+    return contract
+
+#----------------------------------------------------------------------
+def getOptionSymbol(optionType, chainIndex, strikeIndex):
+    """期权代码"""
+    return '%s%s_%s' %(optionType, chainIndex, strikeIndex)
+
+#----------------------------------------------------------------------
+def newTick(symbol, bidPrice, askPrice):
+    """创建行情"""
+    tick = VtTickData()
+    tick.symbol = symbol
+    tick.bidPrice1 = bidPrice
+    tick.askPrice1 = askPrice
+    return tick
+
+#----------------------------------------------------------------------
+def newTrade(symbol, direction, offset, volume):
+    """创建成交"""
+    trade = VtTradeData()
+    trade.symbol = symbol
+    trade.direction = direction
+    trade.offset = offset
+    trade.volume = volume
+    return trade
+
+
+class OmPortfolioTest(unittest.TestCase):
+    """按变化量更新的组合持仓希腊值和全量汇总结果的一致性"""
+    
+    def createPortfolio(self, model, interval):
+        underlying = OmUnderlying(newContract(UNDERLYING_SYMBOL), None)
+        
+        chainList = []
+        for c in range(2):
+            callList = []
+            putList = []
+            for i in range(STRIKE_COUNT):
+                for l, optionType in ((callList, OPTION_CALL), (putList, OPTION_PUT)):
+                    contract = newContract(getOptionSymbol(optionType, c, i), 2.7 + i * 0.05, optionType)
+                    option = OmOption(contract, None, underlying, model, 0.03)
+                    option.t = 0.2 + c * 0.1
+                    option.pricingImpv = 0.2 + 0.005 * i
+                    l.append(option)
+            
+            chain = OmChain('chain%s' %c, callList, putList)
+            underlying.addChain(chain)
+            chainList.append(chain)
+        
+        return OmPortfolio('portfolio', model, [underlying], chainList, interval)
+    
+    def generateEvents(self):
+        rng = random.Random(0)
+        eventList = [('tick', newTick(UNDERLYING_SYMBOL, 2.9, 2.9002))]
+        
+        for n in range(500):
+            x = rng.random()
+            c = rng.randrange(2)
+            i = rng.randrange(STRIKE_COUNT)
+            optionType = rng.choice([OPTION_CALL, OPTION_PUT])
+            symbol = getOptionSymbol(optionType, c, i)
+            
+            if x < 0.1:
+                s = 2.9 + rng.uniform(-0.05, 0.05)
+                eventList.append(('tick', newTick(UNDERLYING_SYMBOL, s, s + 0.0002)))
+            elif x < 0.2:
+                eventList.append(('trade', newTrade(symbol, rng.choice([DIRECTION_LONG, DIRECTION_SHORT]),
+                                                    OFFSET_OPEN, rng.randint(1, 5))))
+            elif x < 0.25:
+                eventList.append(('trade', newTrade(UNDERLYING_SYMBOL, DIRECTION_LONG, OFFSET_OPEN, 
+                                                    rng.randint(1, 5) * 100)))
+            else:
+                cp = 1 if optionType == OPTION_CALL else -1
+                price = bs.calculatePrice(2.9, 2.7 + i * 0.05, 0.03, 0.2 + c * 0.1, 0.25, cp)
+                eventList.append(('tick', newTick(symbol, round(price * 0.99, 4), 
+                                                  round(price * 1.01, 4) + 0.0001)))
+        
+        return eventList
+    
+    def getPosGreeks(self, portfolio):
+        return [portfolio.longPos, portfolio.shortPos, portfolio.netPos, portfolio.posValue,
+                portfolio.posDelta, portfolio.posGamma, portfolio.posTheta, portfolio.posVega]
+    
+    def checkPortfolio(self, model, interval):
+        portfolio = self.createPortfolio(model, interval)
+        
+        for eventType, data in self.generateEvents():
+            if eventType == 'tick':
+                portfolio.newTick(data)
+            else:
+                portfolio.newTrade(data)
+        portfolio.update()
+        
+        self.assertFalse(portfolio.dirtyChainDict)
+        incremental = self.getPosGreeks(portfolio)
+        
+        # 全量重新计算
+        for chain in portfolio.chainDict.values():
+            chain.newUnderlyingTick()
+        portfolio.calculatePosGreeks()
+        full = self.getPosGreeks(portfolio)
+        
+        self.assertTrue(portfolio.longPos and portfolio.shortPos)
+        np.testing.assert_allclose(incremental, full, rtol=1e-9, atol=1e-6)
+        
+        # 理论价和逐个计算一致
+        s = portfolio.underlyingDict[UNDERLYING_SYMBOL].midPrice
+        for option in portfolio.optionDict.values():
+            price = model.calculatePrice(s, option.k, option.r, option.t, option.pricingImpv, option.cp)
+            self.assertAlmostEqual(option.theoPrice, price, places=10)
+            self.assertFalse(option.impvDirty)
+    
+    def test_everyTick(self):
+        self.checkPortfolio(bs, 0)
+        self.checkPortfolio(black, 0)
+    
+    def test_interval(self):
+        self.checkPortfolio(bs, 60 * 1000)
+        self.checkPortfolio(black, 60 * 1000)
+    
+    def test_deferred(self):
+        portfolio = self.createPortfolio(bs, 60 * 1000)
+        portfolio.update()
+        
+        # 间隔内的行情只标记待计算
+        portfolio.newTick(newTick(UNDERLYING_SYMBOL, 2.9, 2.9002))
+        self.assertEqual(len(portfolio.dirtyChainDict), 2)
+        
+        option = portfolio.optionDict[getOptionSymbol(OPTION_CALL, 0, 0)]
+        self.assertEqual(option.theoPrice, 0)
+        
+        portfolio.update()
+        self.assertFalse(portfolio.dirtyChainDict)
+        self.assertTrue(option.theoPrice > 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,239 @@
+# encoding: UTF-8
+
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from vnpy.trader.vtObject import VtBarData
+from vnpy.trader.vtDataStore import ColumnarStore, DATA_BAR
+from vnpy.trader.app.ctaStrategy.ctaBacktesting import (BacktestingEngine, OptimizationSetting,
+                                                        loadOptimizationCheckpoint, 
+                                                        saveOptimizationCheckpoint,
+                                                        sortOptimizationResult,
+                                                        getCompletedTarget)
+from vnpy.trader.app.ctaStrategy.ctaTemplate import CtaTemplate
+
+
+DB_NAME = 'VnTrader_1Min_Db'
+SYMBOL = 'rb1805'
+
+
+########################################################################
+class HoldStrategy(CtaTemplate):
+    """在第entryBar根K线买入并一直持有的策略"""
+    className = 'HoldStrategy'
+    
+    entryBar = 1
+    paramList = CtaTemplate.paramList + ['entryBar']
+    
+    #----------------------------------------------------------------------
+    def __init__(self, ctaEngine, setting):
+        super(HoldStrategy, self).__init__(ctaEngine, setting)
+        self.barCount = 0
+    
+    #----------------------------------------------------------------------
+    def onInit(self):
+        pass
+    
+    #----------------------------------------------------------------------
+    def onStart(self):
+        pass
+    
+    #----------------------------------------------------------------------
+    def onOrder(self, order):
+        pass
+    
+    #----------------------------------------------------------------------
+    def onTrade(self, trade):
+        pass
+    
+    #----------------------------------------------------------------------
+    def onBar(self, bar):
+        self.barCount += 1
+        if self.barCount == self.entryBar:
+            self.buy(bar.close + 10, 1)
+
+
+########################################################################
+class ErrorStrategy(CtaTemplate):
+    """初始化时出错的策略"""
+    className = 'ErrorStrategy'
+    
+    #----------------------------------------------------------------------
+    def __init__(self, ctaEngine, setting):
+        raise RuntimeError('init error')
+
+
+########################################################################
+class TempStoreEngine(BacktestingEngine):
+    """不连接数据库，直接创建临时数据目录的回测引擎"""
+    
+    #----------------------------------------------------------------------
+    def __init__(self, path):
+        super(TempStoreEngine, self).__init__()
+        self.path = path
+        self.storePath = ''
+    
+    #----------------------------------------------------------------------
+    def prepareOptimizationData(self):
+        if self.dataStore:
+            return self.dataStore.path
+        self.storePath = tempfile.mkdtemp(dir=self.path)
+        return self.storePath
+    
+    #----------------------------------------------------------------------
+    def output(self, content):
+        pass
+
+
+#----------------------------------------------------------------------
+def generateBars(dayCount, barCount=60):
+    """生成每日若干根分钟K线，前两天上涨，之后持续下跌"""
+    l = []
+    price = 1000.0
+    start = datetime(2018, 1, 2, 9, 0)
+    
+    for day in range(dayCount):
+        step = 1 if day < 2 else -2
+        for i in range(barCount):
+            bar = VtBarData()
+            bar.vtSymbol = SYMBOL
+            bar.symbol = SYMBOL
+            bar.datetime = start + timedelta(days=day, minutes=i)
+            bar.date = bar.datetime.strftime('%Y%m%d')
+            bar.time = bar.datetime.strftime('%H:%M:%S')
+            bar.open = price
+            bar.close = price + step
+            bar.high = max(bar.open, bar.close) + 1
+            bar.low = min(bar.open, bar.close) - 1
+            bar.volume = 10
+            l.append(bar)
+            price = bar.close
+    
+    return l
+
+
+class RunOptimizationTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+    
+    def test_cleanupOnError(self):
+        engine = TempStoreEngine(self.path)
+        
+        setting = OptimizationSetting()
+        setting.setOptimizeTarget('totalNetPnl')
+        setting.addParameter('fastWindow', 10, 20, 10)
+        
+        with self.assertRaises(RuntimeError):
+            engine.runOptimization(ErrorStrategy, setting)
+        
+        # 出错时恢复原有的数据存储，并删除临时数据目录
+        self.assertTrue(engine.storePath)
+        self.assertIsNone(engine.dataStore)
+        self.assertFalse(os.path.exists(engine.storePath))
+        self.assertFalse(engine.pruneSetting)
+
+
+class ParallelOptimizationTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.barList = generateBars(10)
+        
+        store = ColumnarStore(os.path.join(self.path, 'store'))
+        store.writeData(DB_NAME, SYMBOL, self.barList, DATA_BAR)
+        
+        self.engine = TempStoreEngine(self.path)
+        self.engine.setBacktestingMode(BacktestingEngine.BAR_MODE)
+        self.engine.setStartDate('20180102', 0)
+        self.engine.setDatabase(DB_NAME, SYMBOL)
+        self.engine.setSize(10)
+        self.engine.setPriceTick(1)
+        self.engine.setDataStore(store)
+        
+        self.setting = OptimizationSetting()
+        self.setting.setOptimizeTarget('totalNetPnl')
+        self.setting.addParameter('entryBar', 1, 3, 1)
+        
+        self.checkpointFile = os.path.join(self.path, 'checkpoint.json')
+    
+    def tearDown(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+    
+    def test_checkpoint(self):
+        result = ("{'entryBar': 1}", 12345, {'totalNetPnl': 12345, 'pruned': False})
+        saveOptimizationCheckpoint(self.checkpointFile, result)
+        
+        # 进程崩溃时写了一半的行被跳过
+        with open(self.checkpointFile, 'a') as f:
+            f.write('{"setting": "{\'entryBar\': 2}", "targ')
+        self.assertEqual(loadOptimizationCheckpoint(self.checkpointFile), [result])
+        
+        # 断点文件中已完成的组合直接返回，不再回测
+        resultList = list(self.engine.iterParallelOptimization(HoldStrategy, self.setting,
+                                                               self.checkpointFile))
+        self.assertEqual(len(resultList), 3)
+        self.assertEqual(resultList[0], result)
+        self.assertEqual(sorted(r[0] for r in resultList[1:]), 
+                         ["{'entryBar': 2}", "{'entryBar': 3}"])
+        for r in resultList[1:]:
+            self.assertIsNotNone(r[1])
+        
+        # 用户设置的数据存储不会被删除
+        self.assertTrue(os.path.exists(self.engine.dataStore.path))
+        
+        # 再次运行时全部从断点文件读取
+        settingSet = set(r[0] for r in loadOptimizationCheckpoint(self.checkpointFile))
+        self.assertEqual(len(settingSet), 3)
+        
+        self.engine.dataStore = None
+        resultList2 = list(self.engine.iterParallelOptimization(HoldStrategy, self.setting,
+                                                                self.checkpointFile))
+        self.assertEqual(sorted((r[0], r[1]) for r in resultList2), 
+                         sorted((r[0], r[1]) for r in resultList))
+        self.assertFalse(self.engine.storePath)
+    
+    def test_pruning(self):
+        # 不设置终止条件时完整回测
+        self.engine.initStrategy(HoldStrategy, {'entryBar': 1})
+        self.engine.runBacktesting()
+        self.assertFalse(self.engine.pruned)
+        self.assertEqual(self.engine.dt, self.barList[-1].datetime)
+        
+        # 第一天开盘买入后盈亏最高为2*60*10=1200，回撤超过1000时提前终止
+        self.engine.clearBacktestingResult()
+        self.engine.setPruning(maxDrawdown=1000)
+        self.engine.initStrategy(HoldStrategy, {'entryBar': 1})
+        self.engine.runBacktesting()
+        self.assertTrue(self.engine.pruned)
+        self.assertEqual(self.engine.dt, datetime(2018, 1, 5, 9, 0))
+        
+        self.engine.clearBacktestingResult()
+        self.engine.setPruning(minNetPnl=-5000)
+        self.engine.initStrategy(HoldStrategy, {'entryBar': 1})
+        self.engine.runBacktesting()
+        self.assertTrue(self.engine.pruned)
+        self.assertEqual(self.engine.dt, datetime(2018, 1, 10, 9, 0))
+    
+    def test_sort(self):
+        resultList = [
+            ('a', 10, {'pruned': True}),
+            ('b', 5, {'pruned': False}),
+            ('c', 8, {}),
+        ]
+        sortOptimizationResult(resultList)
+        
+        # 提前终止的结果排在完整回测的结果之后
+        self.assertEqual([r[0] for r in resultList], ['c', 'b', 'a'])
+        self.assertEqual([getCompletedTarget(r) for r in resultList], [8, 5, None])
+        self.assertIsNone(getCompletedTarget(('d', None, {'error': ''})))
+
+
+if __name__ == '__main__':
+    unittest.main()
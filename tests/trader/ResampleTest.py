@@ -0,0 +1,134 @@
+# encoding: UTF-8
+
+import random
+import unittest
+from datetime import datetime, timedelta, time
+
+import numpy as np
+
+from vnpy.trader.vtObject import VtTickData
+from vnpy.trader.vtUtility import BarGenerator
+from vnpy.trader.vtDataStore import TICK_DTYPE, documentsToArray
+from vnpy.trader.vtResample import (resampleTicks, resampleBars, arrayToBars,
+                                    INTERVAL_HOUR, INTERVAL_DAILY)
+
+
+#----------------------------------------------------------------------
+def generateTicks(count, seed=0):
+    """生成包含夜盘、周末和成交量重置的Tick序列"""
+    rng = random.Random(seed)
+    dt = datetime(2018, 1, 5, 20, 58, 3)
+    volume = 1000
+    price = 3000.0
+    
+    l = []
+    for i in range(count):
+        dt += timedelta(milliseconds=rng.choice([500, 500, 1000, 30000]))
+        if dt.hour == 23 and dt.minute >= 30:
+            dt = datetime(2018, 1, 8, 9, 0, 0)
+        
+        # 偶尔出现成交量变小（如夜盘开盘时），成交量变化记为0
+        if rng.random() > 0.01:
+            volume += rng.randint(0, 5)
+        else:
+            volume -= 50
+        price += rng.gauss(0, 1)
+        
+        tick = VtTickData()
+        tick.vtSymbol = 'rb1805'
+        tick.datetime = dt
+        tick.lastPrice = price
+        tick.volume = volume
+        tick.openInterest = i
+        l.append(tick)
+    return l
+
+
+class ResampleTest(unittest.TestCase):
+    """批量合成K线和BarGenerator逐个合成结果的一致性"""
+    
+    def setUp(self):
+        self.ticks = generateTicks(5000)
+        
+        self.barList = []
+        self.xminBarList = []
+        
+        def onBar(bar):
+            self.barList.append(bar)
+            self.bg.updateBar(bar)
+        
+        def onXminBar(bar):
+            self.xminBarList.append(bar)
+        
+        self.bg = BarGenerator(onBar, 5, onXminBar)
+        for tick in self.ticks:
+            self.bg.updateTick(tick)
+    
+    def assertBarEqual(self, bar, row):
+        self.assertEqual(np.datetime64(bar.datetime, 'us'), row['datetime'])
+        self.assertEqual(bar.date, row['date'])
+        self.assertEqual(bar.time, row['time'])
+        for name in ('open', 'high', 'low', 'close', 'volume', 'openInterest'):
+            self.assertEqual(getattr(bar, name), row[name])
+    
+    def test_ticks(self):
+        bars = resampleTicks(self.ticks)
+        self.assertEqual(len(bars), len(self.barList))
+        for bar, row in zip(self.barList, bars):
+            self.assertBarEqual(bar, row)
+        
+        # 结构化数组输入和对象列表输入的结果相同
+        array = documentsToArray([tick.__dict__ for tick in self.ticks], TICK_DTYPE)
+        self.assertTrue((resampleTicks(array) == bars).all())
+        
+        # 最后一根尚未结束的K线
+        bars = resampleTicks(self.ticks, includeLast=True)
+        self.assertEqual(len(bars), len(self.barList) + 1)
+        self.assertEqual(bars[-1]['close'], self.ticks[-1].lastPrice)
+    
+    def test_bars(self):
+        bars = resampleBars(resampleTicks(self.ticks), 5)
+        self.assertEqual(len(bars), len(self.xminBarList))
+        for bar, row in zip(self.xminBarList, bars):
+            self.assertBarEqual(bar, row)
+    
+    def test_daily(self):
+        bars = resampleTicks(self.ticks)
+        daily = resampleBars(bars, 1, INTERVAL_DAILY, time(21, 0), includeLast=True)
+        
+        # 21点之前属于当天，周五夜盘归入下周一的交易日
+        self.assertEqual(list(daily['date']), ['20180105', '20180108'])
+        
+        night = np.flatnonzero(bars['datetime'] >= np.datetime64('2018-01-05T21:00'))[0]
+        self.assertEqual(daily['open'][1], bars['open'][night])
+        self.assertEqual(daily['close'][1], bars['close'][-1])
+        self.assertEqual(daily['high'][1], bars['high'][night:].max())
+        self.assertEqual(daily['volume'].sum(), np.trunc(bars['volume']).sum())
+    
+    def test_hour(self):
+        bars = resampleTicks(self.ticks)
+        hourly = resampleBars(bars, 1, INTERVAL_HOUR, includeLast=True)
+        
+        hours = bars['datetime'].astype('datetime64[h]')
+        self.assertEqual(len(hourly), len(np.unique(hours)))
+        self.assertEqual(hourly['volume'].sum(), bars['volume'].sum())
+        
+        # 以每小时第一根K线的时间作为时间戳
+        first = np.flatnonzero(np.concatenate([[True], hours[1:] != hours[:-1]]))
+        self.assertTrue((hourly['datetime'] == bars['datetime'][first]).all())
+    
+    def test_empty(self):
+        self.assertEqual(len(resampleTicks([])), 0)
+        self.assertEqual(len(resampleTicks(self.ticks[:1])), 0)
+        self.assertEqual(len(resampleBars(resampleTicks([]), 5)), 0)
+    
+    def test_arrayToBars(self):
+        bars = resampleTicks(self.ticks)
+        barList = arrayToBars(bars, 'rb1805', 'rb1805', 'SHFE')
+        self.assertEqual(len(barList), len(bars))
+        self.assertBarEqual(barList[0], bars[0])
+        self.assertEqual(barList[0].exchange, 'SHFE')
+
+
+if __name__ == '__main__':
+    unittest.main()
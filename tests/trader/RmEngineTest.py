@@ -0,0 +1,166 @@
+# encoding: UTF-8
+
+import unittest
+
+from vnpy.trader.vtConstant import DIRECTION_LONG, OFFSET_OPEN
+from vnpy.trader.vtObject import VtOrderReq
+from vnpy.trader.app.riskManager import rmEngine
+from vnpy.trader.app.riskManager.rmEngine import RmEngine, OrderFlowWindow, benchmark
+
+
+#----------------------------------------------------------------------
+def newOrderReq(vtSymbol, strategyName=''):
+    """创建委托请求"""
+    req = VtOrderReq()
+    req.symbol = vtSymbol.split('.')[0]
+    req.vtSymbol = vtSymbol
+    req.direction = DIRECTION_LONG
+    req.offset = OFFSET_OPEN
+    req.volume = 1
+    req.strategyName = strategyName
+    return req
+
+
+########################################################################
+class FakeEventEngine(object):
+    """记录推送事件的事件引擎"""
+    
+    #----------------------------------------------------------------------
+    def __init__(self):
+        self.eventList = []
+    
+    #----------------------------------------------------------------------
+    def register(self, type_, handler):
+        pass
+    
+    #----------------------------------------------------------------------
+    def put(self, event):
+        self.eventList.append(event)
+
+
+########################################################################
+class FakeMainEngine(object):
+    """风控引擎测试用的主引擎"""
+    
+    #----------------------------------------------------------------------
+    def getContract(self, vtSymbol):
+        return None
+
+
+class OrderFlowWindowTest(unittest.TestCase):
+
+    def test_boundary(self):
+        window = OrderFlowWindow()
+        window.add(10.0)
+        window.add(10.5)
+        
+        # 记录在发出后interval秒（含）时移出窗口
+        self.assertEqual(window.getCount(10.999, 1), 2)
+        self.assertEqual(window.getCount(11.0, 1), 1)
+        self.assertEqual(window.getCount(11.499, 1), 1)
+        self.assertEqual(window.getCount(11.5, 1), 0)
+    
+    def test_clear(self):
+        window = OrderFlowWindow()
+        for i in range(5):
+            window.add(i)
+        window.clear()
+        self.assertEqual(window.getCount(0, 10), 0)
+
+
+class RmEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.time = rmEngine.time
+        rmEngine.time = lambda: self.now
+        
+        self.eventEngine = FakeEventEngine()
+        self.engine = RmEngine(FakeMainEngine(), self.eventEngine)
+        
+        self.engine.active = True
+        self.engine.orderSizeLimit = 100
+        self.engine.tradeLimit = 1000
+        self.engine.workingOrderLimit = 1000
+        self.engine.orderCancelLimit = 1000
+        self.engine.marginRatioLimit = 1
+        self.engine.orderFlowClear = 1
+        self.engine.orderFlowLimit = 1000
+        self.engine.ruleBook.loadRules([])
+    
+    def tearDown(self):
+        rmEngine.time = self.time
+    
+    def check(self, req):
+        return self.engine.checkRisk(req, 'CTP')
+    
+    def test_orderFlow(self):
+        self.engine.orderFlowLimit = 2
+        req = newOrderReq('rb1810.SHFE')
+        
+        self.assertTrue(self.check(req))
+        self.now += 0.5
+        self.assertTrue(self.check(req))
+        
+        # 第一笔委托移出窗口前不能再发单，移出时刚好允许
+        self.now += 0.499
+        self.assertFalse(self.check(req))
+        self.now += 0.001
+        self.assertTrue(self.check(req))
+        self.assertFalse(self.check(req))
+        self.assertEqual(self.engine.orderFlowCount, 2)
+        
+        # 窗口边界前后集中发单，任意1秒内的委托数量不超过限制
+        self.now += 0.5
+        self.assertTrue(self.check(req))
+        self.assertFalse(self.check(req))
+    
+    def test_symbolOrderFlow(self):
+        self.engine.symbolOrderFlowLimit = 1
+        
+        self.assertTrue(self.check(newOrderReq('rb1810.SHFE')))
+        self.assertTrue(self.check(newOrderReq('rb1901.SHFE')))
+        self.assertFalse(self.check(newOrderReq('rb1810.SHFE')))
+        
+        self.now += 1
+        self.assertTrue(self.check(newOrderReq('rb1810.SHFE')))
+    
+    def test_strategyOrderFlow(self):
+        self.engine.strategyOrderFlowLimit = 2
+        self.engine.gatewayOrderFlowLimit = 3
+        
+        self.assertTrue(self.check(newOrderReq('rb1810.SHFE', 'a')))
+        self.assertTrue(self.check(newOrderReq('rb1901.SHFE', 'a')))
+        self.assertFalse(self.check(newOrderReq('IF1809.CFFEX', 'a')))
+        
+        # 被拒绝的委托不占用任何窗口的计数
+        self.assertTrue(self.check(newOrderReq('IF1809.CFFEX', 'b')))
+        self.assertFalse(self.check(newOrderReq('IF1809.CFFEX', 'b')))
+        self.assertEqual(self.engine.orderFlowCount, 3)
+        
+        # 没有策略名的委托不检查策略流控
+        self.engine.gatewayOrderFlowLimit = 0
+        self.assertTrue(self.check(newOrderReq('IF1809.CFFEX')))
+    
+    def test_clear(self):
+        self.engine.orderFlowLimit = 1
+        self.engine.symbolOrderFlowLimit = 1
+        req = newOrderReq('rb1810.SHFE')
+        
+        self.assertTrue(self.check(req))
+        self.assertFalse(self.check(req))
+        
+        self.engine.clearOrderFlowCount()
+        self.assertTrue(self.check(req))
+
+
+class RmBenchmarkTest(unittest.TestCase):
+
+    def test_benchmark(self):
+        d = benchmark(100)
+        self.assertEqual(d['count'], 100)
+        self.assertTrue(d['p50'] <= d['p99'] <= d['max'])
+
+
+if __name__ == '__main__':
+    unittest.main()
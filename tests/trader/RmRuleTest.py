@@ -0,0 +1,143 @@
+# encoding: UTF-8
+
+import unittest
+
+from vnpy.trader.vtConstant import (DIRECTION_LONG, DIRECTION_SHORT, OFFSET_OPEN, OFFSET_CLOSE,
+                                    STATUS_CANCELLED)
+from vnpy.trader.vtObject import VtOrderReq, VtTradeData, VtOrderData, VtPositionData
+from vnpy.trader.app.riskManager.rmRule import RuleBook, getProduct
+
+
+GATEWAY_NAME = 'CTP'
+
+
+#----------------------------------------------------------------------
+def newOrderReq(vtSymbol, direction, volume, price=100.0):
+    """创建委托请求"""
+    req = VtOrderReq()
+    req.vtSymbol = vtSymbol
+    req.direction = direction
+    req.offset = OFFSET_OPEN
+    req.volume = volume
+    req.price = price
+    return req
+
+#----------------------------------------------------------------------
+def newTrade(vtSymbol, direction, offset, volume, price=100.0):
+    """创建成交"""
+    trade = VtTradeData()
+    trade.gatewayName = GATEWAY_NAME
+    trade.vtSymbol = vtSymbol
+    trade.direction = direction
+    trade.offset = offset
+    trade.volume = volume
+    trade.price = price
+    return trade
+
+
+class RuleBookTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.book = RuleBook()
+    
+    def check(self, req, size=10):
+        return self.book.check(req, GATEWAY_NAME, size)
+    
+    def test_product(self):
+        self.assertEqual(getProduct('rb1810'), 'rb')
+        self.assertEqual(getProduct('IF1809'), 'IF')
+        self.assertEqual(getProduct('600036'), '600036')
+    
+    def test_orderSize(self):
+        self.book.loadRules([{'scope': 'symbol', 'key': 'IF1809.CFFEX', 'type': 'orderSize', 'limit': 5}])
+        
+        self.assertFalse(self.check(newOrderReq('IF1809.CFFEX', DIRECTION_LONG, 5)))
+        self.assertTrue(self.check(newOrderReq('IF1809.CFFEX', DIRECTION_LONG, 6)))
+        self.assertFalse(self.check(newOrderReq('IF1810.CFFEX', DIRECTION_LONG, 6)))
+    
+    def test_tradeVolume(self):
+        self.book.loadRules([{'scope': 'product', 'key': 'rb', 'type': 'tradeVolume', 'limit': 10}])
+        req = newOrderReq('rb1810.SHFE', DIRECTION_LONG, 1)
+        
+        self.book.updateTrade(newTrade('rb1810.SHFE', DIRECTION_LONG, OFFSET_OPEN, 6), 10)
+        self.assertFalse(self.check(req))
+        
+        # 同一品种的不同合约合并统计
+        self.book.updateTrade(newTrade('rb1901.SHFE', DIRECTION_SHORT, OFFSET_OPEN, 4), 10)
+        self.assertTrue(self.check(req))
+        self.assertFalse(self.check(newOrderReq('hc1810.SHFE', DIRECTION_LONG, 1)))
+        
+        self.book.clear()
+        self.assertFalse(self.check(req))
+    
+    def test_cancelCount(self):
+        self.book.loadRules([{'scope': 'gateway', 'key': GATEWAY_NAME, 'type': 'cancelCount', 'limit': 2}])
+        req = newOrderReq('rb1810.SHFE', DIRECTION_LONG, 1)
+        
+        order = VtOrderData()
+        order.gatewayName = GATEWAY_NAME
+        order.vtSymbol = 'rb1810.SHFE'
+        order.status = STATUS_CANCELLED
+        
+        self.book.updateCancel(order)
+        self.assertFalse(self.check(req))
+        self.book.updateCancel(order)
+        self.assertTrue(self.check(req))
+        self.assertFalse(self.book.check(req, 'SEC', 10))
+    
+    def test_netDelta(self):
+        self.book.loadRules([{'scope': 'product', 'key': 'rb', 'type': 'netDelta', 'limit': 100}])
+        
+        self.book.updateTrade(newTrade('rb1810.SHFE', DIRECTION_LONG, OFFSET_OPEN, 8), 10)
+        
+        # 净Delta为80，再买入3手超过限制，卖出（减仓）始终放行
+        self.assertFalse(self.check(newOrderReq('rb1901.SHFE', DIRECTION_LONG, 2)))
+        self.assertTrue(self.check(newOrderReq('rb1901.SHFE', DIRECTION_LONG, 3)))
+        self.assertFalse(self.check(newOrderReq('rb1810.SHFE', DIRECTION_SHORT, 18)))
+        self.assertTrue(self.check(newOrderReq('rb1810.SHFE', DIRECTION_SHORT, 19)))
+        
+        self.book.updateTrade(newTrade('rb1810.SHFE', DIRECTION_SHORT, OFFSET_CLOSE, 8), 10)
+        self.assertFalse(self.check(newOrderReq('rb1901.SHFE', DIRECTION_LONG, 10)))
+    
+    def test_positionNotional(self):
+        self.book.loadRules([{'scope': 'account', 'key': '0001', 'type': 'positionNotional', 
+                              'limit': 10000}])
+        req = newOrderReq('rb1810.SHFE', DIRECTION_LONG, 1, 100)
+        
+        # 账户代码未知时账户规则不生效
+        self.book.updateTrade(newTrade('rb1810.SHFE', DIRECTION_LONG, OFFSET_OPEN, 10), 10)
+        self.assertFalse(self.check(newOrderReq('rb1810.SHFE', DIRECTION_LONG, 100)))
+        
+        # 设置账户后已有持仓推送给账户规则，名义价值为10*10*100=10000
+        self.book.setAccount(GATEWAY_NAME, '0001')
+        self.assertTrue(self.check(req))
+        self.assertFalse(self.check(newOrderReq('rb1810.SHFE', DIRECTION_SHORT, 5, 100)))
+        
+        # 持仓推送修正净持仓
+        pos = VtPositionData()
+        pos.gatewayName = GATEWAY_NAME
+        pos.vtSymbol = 'rb1810.SHFE'
+        pos.direction = DIRECTION_LONG
+        pos.position = 5
+        pos.price = 100
+        self.book.updatePosition(pos, 10)
+        self.assertFalse(self.check(newOrderReq('rb1810.SHFE', DIRECTION_LONG, 5, 100)))
+        self.assertTrue(self.check(newOrderReq('rb1810.SHFE', DIRECTION_LONG, 6, 100)))
+    
+    def test_reload(self):
+        self.book.updateTrade(newTrade('rb1810.SHFE', DIRECTION_LONG, OFFSET_OPEN, 10), 10)
+        
+        # 重新载入规则时已有持仓推送给新规则
+        self.book.loadRules([{'scope': 'symbol', 'key': 'rb1810.SHFE', 'type': 'netDelta', 'limit': 100}])
+        self.assertTrue(self.check(newOrderReq('rb1810.SHFE', DIRECTION_LONG, 1)))
+        self.assertEqual(self.book.getSettingList()[0]['limit'], 100)
+    
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            self.book.loadRules([{'scope': 'exchange', 'key': 'SHFE', 'type': 'orderSize', 'limit': 1}])
+        with self.assertRaises(ValueError):
+            self.book.loadRules([{'scope': 'symbol', 'key': 'rb1810.SHFE', 'type': 'margin', 'limit': 1}])
+
+
+if __name__ == '__main__':
+    unittest.main()
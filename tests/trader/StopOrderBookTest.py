@@ -0,0 +1,183 @@
+# encoding: UTF-8
+
+import random
+import unittest
+
+from vnpy.trader.vtConstant import DIRECTION_LONG, DIRECTION_SHORT
+from vnpy.trader.vtObject import VtContractData, VtTickData
+from vnpy.trader.app.ctaStrategy.ctaBase import (StopOrder, StopOrderBook, CTAORDER_BUY, 
+                                                 CTAORDER_SHORT, STOPORDER_WAITING, 
+                                                 STOPORDER_CANCELLED, STOPORDER_TRIGGERED)
+from vnpy.trader.app.ctaStrategy.ctaEngine import CtaEngine
+
+
+#----------------------------------------------------------------------
+def newStopOrder(stopOrderID, direction, price):
+    """创建停止单"""
+    so = StopOrder()
+    so.stopOrderID = stopOrderID
+    so.direction = direction
+    so.price = price
+    return so
+
+
+class StopOrderBookTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.book = StopOrderBook()
+    
+    def getTriggeredID(self, lastPrice):
+        return [so.stopOrderID for so in self.book.getTriggered(lastPrice)]
+    
+    def test_trigger(self):
+        self.book.addStopOrder(newStopOrder('L1', DIRECTION_LONG, 101))
+        self.book.addStopOrder(newStopOrder('L2', DIRECTION_LONG, 100))
+        self.book.addStopOrder(newStopOrder('L3', DIRECTION_LONG, 100))
+        self.book.addStopOrder(newStopOrder('S1', DIRECTION_SHORT, 99))
+        self.book.addStopOrder(newStopOrder('S2', DIRECTION_SHORT, 98))
+        self.assertEqual(len(self.book), 5)
+        
+        # 多头停止单在最新价大于等于触发价时触发，空头停止单在最新价小于等于触发价时触发
+        self.assertEqual(self.getTriggeredID(99.5), [])
+        self.assertEqual(self.getTriggeredID(100), ['L2', 'L3'])
+        self.assertEqual(self.getTriggeredID(102), ['L2', 'L3', 'L1'])
+        self.assertEqual(self.getTriggeredID(99), ['S1'])
+        self.assertEqual(self.getTriggeredID(97), ['S1', 'S2'])
+    
+    def test_remove(self):
+        soList = [newStopOrder('L%s' %i, DIRECTION_LONG, 100) for i in range(3)]
+        for so in soList:
+            self.book.addStopOrder(so)
+        
+        # 触发价相同时移除正确的停止单
+        self.assertTrue(self.book.removeStopOrder(soList[1]))
+        self.assertFalse(self.book.removeStopOrder(soList[1]))
+        self.assertEqual(self.getTriggeredID(100), ['L0', 'L2'])
+        self.assertEqual(len(self.book), 2)
+    
+    def test_random(self):
+        rng = random.Random(0)
+        orderDict = {}
+        
+        for i in range(2000):
+            if orderDict and rng.random() < 0.4:
+                so = orderDict.pop(rng.choice(sorted(orderDict.keys())))
+                self.assertTrue(self.book.removeStopOrder(so))
+            else:
+                so = newStopOrder(str(i), rng.choice([DIRECTION_LONG, DIRECTION_SHORT]), 
+                                  rng.randint(90, 110))
+                so.index = i
+                self.book.addStopOrder(so)
+                orderDict[so.stopOrderID] = so
+            
+            # 和遍历所有停止单的结果比较
+            lastPrice = rng.randint(88, 112)
+            longList = sorted([so for so in orderDict.values() 
+                               if so.direction == DIRECTION_LONG and lastPrice >= so.price],
+                              key=lambda so: (so.price, so.index))
+            shortList = sorted([so for so in orderDict.values() 
+                                if so.direction == DIRECTION_SHORT and lastPrice <= so.price],
+                               key=lambda so: (-so.price, so.index))
+            
+            self.assertEqual(self.book.getTriggered(lastPrice), longList + shortList)
+            self.assertEqual(len(self.book), len(orderDict))
+
+
+
+########################################################################
+class FakeEventEngine(object):
+    """CtaEngine测试用的事件引擎"""
+    
+    #----------------------------------------------------------------------
+    def register(self, type_, handler, shardKey=None):
+        pass
+    
+    #----------------------------------------------------------------------
+    def put(self, event):
+        pass
+
+
+########################################################################
+class FakeMainEngine(object):
+    """CtaEngine测试用的主引擎，记录发出的委托"""
+    
+    #----------------------------------------------------------------------
+    def __init__(self):
+        self.reqList = []
+    
+    #----------------------------------------------------------------------
+    def registerLogEvent(self, eventType):
+        pass
+    
+    #----------------------------------------------------------------------
+    def getContract(self, vtSymbol):
+        contract = VtContractData()
+        contract.symbol = contract.vtSymbol = vtSymbol
+        contract.priceTick = 1
+        contract.gatewayName = 'FAKE'
+        return contract
+    
+    #----------------------------------------------------------------------
+    def convertOrderReq(self, req):
+        return [req]
+    
+    #----------------------------------------------------------------------
+    def sendOrder(self, req, gatewayName):
+        self.reqList.append(req)
+        return 'FAKE.%s' % len(self.reqList)
+
+
+########################################################################
+class OcoStrategy(object):
+    """任一停止单触发后撤销另一个停止单"""
+    
+    name = 'oco'
+    productClass = ''
+    currency = ''
+    
+    #----------------------------------------------------------------------
+    def __init__(self):
+        self.engine = None
+        self.stopOrderIDList = []
+    
+    #----------------------------------------------------------------------
+    def onStopOrder(self, so):
+        if so.status == STOPORDER_TRIGGERED:
+            for stopOrderID in self.stopOrderIDList:
+                self.engine.cancelStopOrder(stopOrderID)
+
+
+class CtaStopOrderTest(unittest.TestCase):
+    
+    def test_oco(self):
+        mainEngine = FakeMainEngine()
+        engine = CtaEngine(mainEngine, FakeEventEngine())
+        
+        strategy = OcoStrategy()
+        strategy.engine = engine
+        engine.tickStrategyDict['IF'] = [strategy]
+        engine.strategyOrderDict[strategy.name] = set()
+        
+        # 两个停止单在同一个tick上同时触发
+        strategy.stopOrderIDList.extend(engine.sendStopOrder('IF', CTAORDER_BUY, 100, 1, strategy))
+        strategy.stopOrderIDList.extend(engine.sendStopOrder('IF', CTAORDER_SHORT, 100, 1, strategy))
+        soList = [engine.stopOrderDict[stopOrderID] for stopOrderID in strategy.stopOrderIDList]
+        self.assertEqual([so.status for so in soList], [STOPORDER_WAITING] * 2)
+        
+        tick = VtTickData()
+        tick.vtSymbol = 'IF'
+        tick.lastPrice = 100
+        tick.upperLimit = 110
+        tick.lowerLimit = 90
+        engine.processStopOrder(tick)
+        
+        # 第一个停止单触发后第二个被撤销，不再发出委托
+        self.assertEqual([so.status for so in soList], [STOPORDER_TRIGGERED, STOPORDER_CANCELLED])
+        self.assertEqual(len(mainEngine.reqList), 1)
+        self.assertEqual(mainEngine.reqList[0].price, 110)
+        self.assertEqual(engine.workingStopOrderDict, {})
+        self.assertEqual(len(engine.stopOrderBookDict['IF']), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
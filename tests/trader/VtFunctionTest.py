@@ -0,0 +1,72 @@
+# encoding: UTF-8
+
+import unittest
+from datetime import datetime
+
+from vnpy.trader.vtFunction import parseTickDatetime
+
+
+class ParseTickDatetimeTest(unittest.TestCase):
+
+    def test_standard(self):
+        self.assertEqual(parseTickDatetime('20180102', '09:30:01'),
+                         datetime(2018, 1, 2, 9, 30, 1))
+        self.assertEqual(parseTickDatetime('20180102', '21:00:00.5'),
+                         datetime(2018, 1, 2, 21, 0, 0, 500000))
+        self.assertEqual(parseTickDatetime('20180102', '21:00:00.123'),
+                         datetime(2018, 1, 2, 21, 0, 0, 123000))
+        
+        # 超过6位的小数部分截断到微秒
+        self.assertEqual(parseTickDatetime('20180102', '21:00:00.1234567'),
+                         datetime(2018, 1, 2, 21, 0, 0, 123456))
+    
+    def test_millisecond(self):
+        # 传入毫秒数时忽略time中的小数部分
+        self.assertEqual(parseTickDatetime('20180102', '09:30:01', 500),
+                         datetime(2018, 1, 2, 9, 30, 1, 500000))
+        self.assertEqual(parseTickDatetime('20180102', '09:30:01', 0),
+                         datetime(2018, 1, 2, 9, 30, 1))
+        self.assertEqual(parseTickDatetime('20180102', '09:30:01.2', '999'),
+                         datetime(2018, 1, 2, 9, 30, 1, 999000))
+    
+    def test_shortHour(self):
+        # 小时为一位数
+        self.assertEqual(parseTickDatetime('20180102', '9:30:01'),
+                         datetime(2018, 1, 2, 9, 30, 1))
+        self.assertEqual(parseTickDatetime('20180102', '9:30:01.25'),
+                         datetime(2018, 1, 2, 9, 30, 1, 250000))
+        self.assertEqual(parseTickDatetime('20180102', '9:30:01', 100),
+                         datetime(2018, 1, 2, 9, 30, 1, 100000))
+    
+    def test_midnight(self):
+        # 夜盘跨越零点
+        self.assertEqual(parseTickDatetime('20180103', '00:00:00'),
+                         datetime(2018, 1, 3))
+        self.assertEqual(parseTickDatetime('20180102', '23:59:59.999'),
+                         datetime(2018, 1, 2, 23, 59, 59, 999000))
+    
+    def test_invalid(self):
+        # 异常数据统一抛出ValueError
+        for date, time in [('', '09:30:01'),
+                           ('2018', '09:30:01'),
+                           ('20180231', '09:30:01'),
+                           ('20180102', ''),
+                           ('20180102', '24:00:00'),
+                           ('20180102', '09:30'),
+                           ('20180102', '09:30:01.x')]:
+            with self.assertRaises(ValueError):
+                parseTickDatetime(date, time)
+        
+        # 非法日期被缓存后仍然抛出异常
+        with self.assertRaises(ValueError):
+            parseTickDatetime('20180231', '09:30:01')
+    
+    def test_cache(self):
+        # 同一日期多次解析结果一致
+        for i in range(3):
+            self.assertEqual(parseTickDatetime('20180102', '09:30:0%s' % i),
+                             datetime(2018, 1, 2, 9, 30, i))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+# encoding: UTF-8
+
+import copy
+import pickle
+import unittest
+from datetime import datetime
+
+from vnpy.trader.vtObject import (VtBarData, VtTickData,
+                                  VtCompactBarData, VtCompactTickData)
+
+
+class VtCompactDataTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.bar = VtBarData()
+        self.bar.vtSymbol = 'rb1801'
+        self.bar.symbol = 'rb1801'
+        self.bar.open = 3500.0
+        self.bar.high = 3510.0
+        self.bar.low = 3490.0
+        self.bar.close = 3505.0
+        self.bar.volume = 100
+        self.bar.datetime = datetime(2018, 1, 2, 9, 1)
+        self.bar.date = '20180102'
+        self.bar.time = '09:01:00'
+    
+    def test_fields(self):
+        self.assertEqual(set(VtCompactBarData.__slots__), set(VtBarData().__dict__))
+        self.assertEqual(set(VtCompactTickData.__slots__), set(VtTickData().__dict__))
+    
+    def test_default(self):
+        bar = VtCompactBarData()
+        self.assertEqual(bar.__dict__, VtBarData().__dict__)
+        
+        tick = VtCompactTickData()
+        self.assertEqual(tick.__dict__, VtTickData().__dict__)
+    
+    def test_fromDict(self):
+        d = self.bar.__dict__
+        bar = VtCompactBarData.fromDict(d)
+        self.assertEqual(bar.__dict__, d)
+        
+        # 数据库中多余的字段忽略，缺少的字段使用默认值
+        d = {'_id': 1, 'vtSymbol': 'rb1801', 'lastPrice': 3500.0}
+        tick = VtCompactTickData.fromDict(d)
+        self.assertFalse(hasattr(tick, '_id'))
+        self.assertEqual(tick.vtSymbol, 'rb1801')
+        self.assertEqual(tick.lastPrice, 3500.0)
+        self.assertEqual(tick.bidPrice1, VtTickData().bidPrice1)
+        self.assertEqual(tick.datetime, None)
+    
+    def test_slots(self):
+        bar = VtCompactBarData.fromDict(self.bar.__dict__)
+        with self.assertRaises(AttributeError):
+            bar.newField = 1
+    
+    def test_copy(self):
+        bar = VtCompactBarData.fromDict(self.bar.__dict__)
+        
+        bar2 = copy.copy(bar)
+        self.assertEqual(bar2.__dict__, bar.__dict__)
+        
+        bar3 = pickle.loads(pickle.dumps(bar, 2))
+        self.assertEqual(bar3.__dict__, bar.__dict__)
+        
+        bar2.close = 0
+        self.assertEqual(bar.close, 3505.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,4 @@
 # encoding: UTF-8
 
-from .eventEngine import EventEngine, EventEngine2, Event, EVENT_TIMER
\ No newline at end of file
+from .eventEngine import (EventEngine, EventEngine2, BatchEventEngine, ShardedEventEngine,
+                          Event, EVENT_TIMER, shardBySymbol)
\ No newline at end of file
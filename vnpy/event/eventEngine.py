@@ -2,10 +2,12 @@
 
 # 系统模块
 from __future__ import print_function
+from __future__ import division
 from queue import Queue, Empty
-from threading import Thread
-from time import sleep
-from collections import defaultdict
+from threading import Thread, Condition, Lock
+from time import sleep, time
+from collections import defaultdict, deque
+import math
 
 # 第三方模块
 from qtpy.QtCore import QTimer
@@ -15,7 +17,43 @@ from .eventType import *
 
 
 ########################################################################
-class EventEngine(object):
+class EventProfilingMixin(object):
+    """
+    事件引擎的性能统计接口，由各事件引擎类继承
+    统计器对象保存在self._profiler中，为None时不统计，
+    事件引擎在处理事件时检查该对象，存在时交由统计器调用处理函数并计时
+    """
+    
+    _profiler = None
+    
+    #----------------------------------------------------------------------
+    def setProfiling(self, active=True, interval=10):
+        """
+        开启或关闭性能统计
+        开启后每隔interval秒（随计时器事件检查）推送一次EVENT_PROFILE统计事件
+        """
+        if active:
+            self._profiler = EventProfiler(self.put, interval)
+        else:
+            self._profiler = None
+    
+    #----------------------------------------------------------------------
+    def getProfile(self, reset=False):
+        """获取性能统计结果字典"""
+        if not self._profiler:
+            return {}
+        return self._profiler.getProfile(reset)
+    
+    #----------------------------------------------------------------------
+    def dumpProfile(self):
+        """获取格式化的性能统计结果文本"""
+        if not self._profiler:
+            return ''
+        return self._profiler.dump()
+
+
+########################################################################
+class EventEngine(EventProfilingMixin):
     """
     事件驱动引擎
     事件驱动引擎中所有的变量都设置为了私有，这是为了防止不小心
@@ -74,6 +112,9 @@ class EventEngine(object):
         # __generalHandlers是一个列表，用来保存通用回调函数（所有事件均调用）
         self.__generalHandlers = []
         
+        # 性能统计，为None时不统计
+        self._profiler = None
+        
     #----------------------------------------------------------------------
     def __run(self):
         """引擎运行"""
@@ -87,6 +128,12 @@ class EventEngine(object):
     #----------------------------------------------------------------------
     def __process(self, event):
         """处理事件"""
+        # 开启性能统计时，由统计器逐个调用处理函数并计时
+        if self._profiler:
+            handlerList = self.__handlers.get(event.type_, []) + self.__generalHandlers
+            self._profiler.process(event, handlerList, self.__queue.qsize())
+            return
+        
         # 检查是否存在对该事件进行监听的处理函数
         if event.type_ in self.__handlers:
             # 若存在，则按顺序将事件传递给处理函数执行
@@ -138,8 +185,11 @@ class EventEngine(object):
         self.__thread.join()
             
     #----------------------------------------------------------------------
-    def register(self, type_, handler):
-        """注册事件处理函数监听"""
+    def register(self, type_, handler, shardKey=None):
+        """
+        注册事件处理函数监听
+        shardKey为分片键函数，仅在ShardedEventEngine中生效，这里忽略
+        """
         # 尝试获取该事件类型对应的处理函数列表，若无defaultDict会自动创建新的list
         handlerList = self.__handlers[type_]
         
@@ -164,6 +214,9 @@ class EventEngine(object):
     #----------------------------------------------------------------------
     def put(self, event):
         """向事件队列中存入事件"""
+        if self._profiler:
+            event.putTime = time()
+        
         self.__queue.put(event)
         
     #----------------------------------------------------------------------
@@ -177,11 +230,17 @@ class EventEngine(object):
         """注销通用事件处理函数监听"""
         if handler in self.__generalHandlers:
             self.__generalHandlers.remove(handler)
+            
+    #----------------------------------------------------------------------
+    def hasHandler(self, type_):
+        """检查是否有函数监听该类型的事件（包括通用事件处理函数）"""
+        return type_ in self.__handlers or bool(self.__generalHandlers)
+            
         
 
 
 ########################################################################
-class EventEngine2(object):
+class EventEngine2(EventProfilingMixin):
     """
     计时器使用python线程的事件驱动引擎        
     """
@@ -210,6 +269,9 @@ class EventEngine2(object):
         # __generalHandlers是一个列表，用来保存通用回调函数（所有事件均调用）
         self.__generalHandlers = []        
         
+        # 性能统计，为None时不统计
+        self._profiler = None
+        
     #----------------------------------------------------------------------
     def __run(self):
         """引擎运行"""
@@ -223,6 +285,12 @@ class EventEngine2(object):
     #----------------------------------------------------------------------
     def __process(self, event):
         """处理事件"""
+        # 开启性能统计时，由统计器逐个调用处理函数并计时
+        if self._profiler:
+            handlerList = self.__handlers.get(event.type_, []) + self.__generalHandlers
+            self._profiler.process(event, handlerList, self.__queue.qsize())
+            return
+        
         # 检查是否存在对该事件进行监听的处理函数
         if event.type_ in self.__handlers:
             # 若存在，则按顺序将事件传递给处理函数执行
@@ -280,8 +348,11 @@ class EventEngine2(object):
         self.__thread.join()
             
     #----------------------------------------------------------------------
-    def register(self, type_, handler):
-        """注册事件处理函数监听"""
+    def register(self, type_, handler, shardKey=None):
+        """
+        注册事件处理函数监听
+        shardKey为分片键函数，仅在ShardedEventEngine中生效，这里忽略
+        """
         # 尝试获取该事件类型对应的处理函数列表，若无defaultDict会自动创建新的list
         handlerList = self.__handlers[type_]
         
@@ -306,6 +377,9 @@ class EventEngine2(object):
     #----------------------------------------------------------------------
     def put(self, event):
         """向事件队列中存入事件"""
+        if self._profiler:
+            event.putTime = time()
+        
         self.__queue.put(event)
 
     #----------------------------------------------------------------------
@@ -319,6 +393,637 @@ class EventEngine2(object):
         """注销通用事件处理函数监听"""
         if handler in self.__generalHandlers:
             self.__generalHandlers.remove(handler)
+            
+    #----------------------------------------------------------------------
+    def hasHandler(self, type_):
+        """检查是否有函数监听该类型的事件（包括通用事件处理函数）"""
+        return type_ in self.__handlers or bool(self.__generalHandlers)
+            
+
+
+########################################################################
+class BatchEventEngine(EventProfilingMixin):
+    """
+    批量处理的高吞吐事件驱动引擎，接口和EventEngine2一致
+    
+    1. 使用deque加条件变量作为事件队列，存入事件时只有在处理线程
+       等待中才需要加锁通知
+    2. 处理线程每次从队列中批量取出事件，队列为空时才进入等待
+    3. 注册监听函数时预先生成每种事件的处理函数元组（包含通用处理函数），
+       处理事件时只需一次字典查找
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, batchSize=1000):
+        """初始化事件引擎"""
+        # 事件队列
+        self.__queue = deque()
+        self.__condition = Condition()
+        self.__waiting = False                          # 处理线程是否在等待新事件
+        self.__batchSize = batchSize                    # 每批处理的最大事件数量
+        
+        # 事件引擎开关
+        self.__active = False
+        
+        # 事件处理线程
+        self.__thread = Thread(target = self.__run)
+        
+        # 计时器，用于触发计时器事件
+        self.__timer = Thread(target = self.__runTimer)
+        self.__timerActive = False                      # 计时器工作状态
+        self.__timerSleep = 1                           # 计时器触发间隔（默认1秒）        
+        
+        # 事件类型对应的监听函数列表
+        self.__handlers = defaultdict(list)
+        
+        # 通用回调函数列表（所有事件均调用）
+        self.__generalHandlers = []
+        
+        # 预先生成的处理函数元组，key为事件类型，value为该事件的处理函数加上通用处理函数
+        self.__dispatchDict = {}
+        self.__generalTuple = ()
+        
+        # 性能统计，为None时不统计
+        self._profiler = None
+        
+    #----------------------------------------------------------------------
+    def __run(self):
+        """引擎运行"""
+        queue = self.__queue
+        process = self.__process
+        
+        while self.__active:
+            # 队列为空时等待，获取事件的阻塞时间设为1秒
+            if not queue:
+                with self.__condition:
+                    self.__waiting = True
+                    if not queue:
+                        self.__condition.wait(1)
+                    self.__waiting = False
+                continue
+            
+            # 批量取出事件处理
+            for i in range(min(len(queue), self.__batchSize)):
+                process(queue.popleft())
+            
+    #----------------------------------------------------------------------
+    def __process(self, event):
+        """处理事件"""
+        if self._profiler:
+            handlerList = self.__dispatchDict.get(event.type_, self.__generalTuple)
+            self._profiler.process(event, handlerList, len(self.__queue))
+            return
+        
+        for handler in self.__dispatchDict.get(event.type_, self.__generalTuple):
+            handler(event)
+               
+    #----------------------------------------------------------------------
+    def __runTimer(self):
+        """运行在计时器线程中的循环函数"""
+        while self.__timerActive:
+            # 创建计时器事件
+            event = Event(type_=EVENT_TIMER)
+        
+            # 向队列中存入计时器事件
+            self.put(event)    
+            
+            # 等待
+            sleep(self.__timerSleep)
+
+    #----------------------------------------------------------------------
+    def __updateDispatch(self):
+        """重新生成处理函数元组"""
+        self.__generalTuple = tuple(self.__generalHandlers)
+        self.__dispatchDict = {type_: tuple(handlerList) + self.__generalTuple
+                               for type_, handlerList in self.__handlers.items()}
+
+    #----------------------------------------------------------------------
+    def start(self, timer=True):
+        """
+        引擎启动
+        timer：是否要启动计时器
+        """
+        # 将引擎设为启动
+        self.__active = True
+        
+        # 启动事件处理线程
+        self.__thread.start()
+        
+        # 启动计时器，计时器事件间隔默认设定为1秒
+        if timer:
+            self.__timerActive = True
+            self.__timer.start()
+    
+    #----------------------------------------------------------------------
+    def stop(self):
+        """停止引擎"""
+        # 将引擎设为停止
+        self.__active = False
+        
+        # 停止计时器
+        if self.__timerActive:
+            self.__timerActive = False
+            self.__timer.join()
+        
+        # 唤醒并等待事件处理线程退出
+        with self.__condition:
+            self.__condition.notify()
+        self.__thread.join()
+            
+    #----------------------------------------------------------------------
+    def register(self, type_, handler, shardKey=None):
+        """
+        注册事件处理函数监听
+        shardKey为分片键函数，仅在ShardedEventEngine中生效，这里忽略
+        """
+        handlerList = self.__handlers[type_]
+        
+        if handler not in handlerList:
+            handlerList.append(handler)
+        
+        self.__updateDispatch()
+            
+    #----------------------------------------------------------------------
+    def unregister(self, type_, handler):
+        """注销事件处理函数监听"""
+        handlerList = self.__handlers[type_]
+            
+        if handler in handlerList:
+            handlerList.remove(handler)
+
+        if not handlerList:
+            del self.__handlers[type_]
+        
+        self.__updateDispatch()
+        
+    #----------------------------------------------------------------------
+    def put(self, event):
+        """向事件队列中存入事件"""
+        if self._profiler:
+            event.putTime = time()
+        
+        self.__queue.append(event)
+        
+        # 只有处理线程在等待时才需要加锁通知
+        if self.__waiting:
+            with self.__condition:
+                self.__condition.notify()
+
+    #----------------------------------------------------------------------
+    def registerGeneralHandler(self, handler):
+        """注册通用事件处理函数监听"""
+        if handler not in self.__generalHandlers:
+            self.__generalHandlers.append(handler)
+        
+        self.__updateDispatch()
+            
+    #----------------------------------------------------------------------
+    def unregisterGeneralHandler(self, handler):
+        """注销通用事件处理函数监听"""
+        if handler in self.__generalHandlers:
+            self.__generalHandlers.remove(handler)
+        
+        self.__updateDispatch()
+            
+    #----------------------------------------------------------------------
+    def hasHandler(self, type_):
+        """检查是否有函数监听该类型的事件（包括通用事件处理函数）"""
+        return bool(self.__dispatchDict.get(type_, self.__generalTuple))
+            
+
+
+########################################################################
+class EventWorker(object):
+    """ShardedEventEngine中的工作线程，按顺序处理分配给自己的事件"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, name, engine):
+        """Constructor"""
+        self.engine = engine            # 所属的事件引擎，用于获取性能统计器
+        self.queue = deque()            # 元素为(处理函数元组, 事件)
+        self.condition = Condition()
+        self.waiting = False
+        self.active = False
+        self.thread = Thread(target=self.run, name=name)
+    
+    #----------------------------------------------------------------------
+    def run(self):
+        """线程运行"""
+        queue = self.queue
+        
+        while self.active:
+            if not queue:
+                with self.condition:
+                    self.waiting = True
+                    if not queue:
+                        self.condition.wait(1)
+                    self.waiting = False
+                continue
+            
+            handlers, event = queue.popleft()
+            
+            profiler = self.engine._profiler
+            if profiler:
+                profiler.process(event, handlers, len(queue))
+                continue
+            
+            for handler in handlers:
+                handler(event)
+    
+    #----------------------------------------------------------------------
+    def put(self, handlers, event):
+        """存入待处理的事件"""
+        self.queue.append((handlers, event))
+        
+        if self.waiting:
+            with self.condition:
+                self.condition.notify()
+    
+    #----------------------------------------------------------------------
+    def start(self):
+        """启动"""
+        self.active = True
+        self.thread.start()
+    
+    #----------------------------------------------------------------------
+    def stop(self):
+        """停止"""
+        self.active = False
+        with self.condition:
+            self.condition.notify()
+        self.thread.join()
+
+
+#----------------------------------------------------------------------
+def shardBySymbol(event):
+    """按事件数据中的vtSymbol分片"""
+    return getattr(event.dict_.get('data', None), 'vtSymbol', None)
+
+
+########################################################################
+class ShardedEventEngine(EventProfilingMixin):
+    """
+    多线程分片事件驱动引擎，接口和EventEngine2一致
+    
+    注册监听函数时可以通过shardKey声明分片键函数（输入事件，返回分片键，
+    如shardBySymbol），该函数处理的事件按分片键分配到N个工作线程中的一个：
+    同一分片键的事件总是由同一个线程按存入顺序处理。
+    
+    未声明分片键的监听函数（包括通用处理函数）全部在0号线程中按原有顺序处理，
+    行为与EventEngine2相同。声明分片键的监听函数需要自行保证线程安全。
+    
+    本引擎目前为实验性功能，使用限制：
+    1. 自带的应用中只有CtaEngine支持分片：全局配置中设置ctaShardBySymbol为true后，
+       CTA引擎的行情、委托、成交监听函数按vtSymbol分片，同一合约的事件由同一线程处理，
+       要求交易不同合约的策略之间互相独立（跨合约的套利策略不能使用）。
+       其他应用均未声明分片键，它们的全部监听函数都在0号线程中运行
+    2. 工作线程受GIL限制，即使声明了分片键，纯Python的计算（如CTA策略逻辑）
+       也无法利用多核，分片只能隔离慢速的处理函数（如I/O、释放GIL的NumPy计算），
+       避免其阻塞其他应用的事件处理
+    3. 需要让CPU密集的策略分布到多个核心时，应将策略分组运行在多个独立的
+       进程中（如通过vnpy.rpc连接），而不是依赖本引擎
+    4. 开启性能统计时所有工作线程共用一个加锁的统计器
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, workerCount=4):
+        """初始化事件引擎"""
+        self.__workers = [EventWorker('EventWorker%s' %i, self) for i in range(workerCount)]
+        self.__workerCount = workerCount
+        
+        # 计时器，用于触发计时器事件
+        self.__timer = Thread(target = self.__runTimer)
+        self.__timerActive = False                      # 计时器工作状态
+        self.__timerSleep = 1                           # 计时器触发间隔（默认1秒）
+        
+        # 事件类型对应的监听函数列表，元素为(处理函数, 分片键函数)
+        self.__handlers = defaultdict(list)
+        
+        # 通用回调函数列表（所有事件均调用，在0号线程中处理）
+        self.__generalHandlers = []
+        
+        # 预先生成的分发表，key为事件类型，value为(0号线程处理函数元组, 分片处理函数元组)
+        self.__dispatchDict = {}
+        self.__generalDispatch = ((), ())
+    
+    #----------------------------------------------------------------------
+    def __runTimer(self):
+        """运行在计时器线程中的循环函数"""
+        while self.__timerActive:
+            # 创建计时器事件
+            event = Event(type_=EVENT_TIMER)
+        
+            # 向队列中存入计时器事件
+            self.put(event)    
+            
+            # 等待
+            sleep(self.__timerSleep)
+    
+    #----------------------------------------------------------------------
+    def __updateDispatch(self):
+        """重新生成分发表"""
+        generalTuple = tuple(self.__generalHandlers)
+        self.__generalDispatch = (generalTuple, ())
+        
+        self.__dispatchDict = {}
+        for type_, handlerList in self.__handlers.items():
+            mainTuple = tuple([handler for handler, shardKey in handlerList 
+                               if shardKey is None]) + generalTuple
+            shardTuple = tuple([(handler, shardKey) for handler, shardKey in handlerList
+                                if shardKey is not None])
+            self.__dispatchDict[type_] = (mainTuple, shardTuple)
+    
+    #----------------------------------------------------------------------
+    def start(self, timer=True):
+        """
+        引擎启动
+        timer：是否要启动计时器
+        """
+        for worker in self.__workers:
+            worker.start()
+        
+        if timer:
+            self.__timerActive = True
+            self.__timer.start()
+    
+    #----------------------------------------------------------------------
+    def stop(self):
+        """停止引擎"""
+        if self.__timerActive:
+            self.__timerActive = False
+            self.__timer.join()
+        
+        for worker in self.__workers:
+            worker.stop()
+    
+    #----------------------------------------------------------------------
+    def register(self, type_, handler, shardKey=None):
+        """
+        注册事件处理函数监听
+        shardKey：分片键函数，为None时在0号线程中处理
+        """
+        handlerList = self.__handlers[type_]
+        
+        if handler not in [h for h, k in handlerList]:
+            handlerList.append((handler, shardKey))
+        
+        self.__updateDispatch()
+    
+    #----------------------------------------------------------------------
+    def unregister(self, type_, handler):
+        """注销事件处理函数监听"""
+        handlerList = self.__handlers[type_]
+        
+        for d in handlerList:
+            if d[0] == handler:
+                handlerList.remove(d)
+                break
+        
+        if not handlerList:
+            del self.__handlers[type_]
+        
+        self.__updateDispatch()
+    
+    #----------------------------------------------------------------------
+    def put(self, event):
+        """根据分发表将事件分配到对应的工作线程"""
+        if self._profiler:
+            event.putTime = time()
+        
+        mainTuple, shardTuple = self.__dispatchDict.get(event.type_, self.__generalDispatch)
+        
+        if mainTuple:
+            self.__workers[0].put(mainTuple, event)
+        
+        for handler, shardKey in shardTuple:
+            i = hash(shardKey(event)) % self.__workerCount
+            self.__workers[i].put((handler,), event)
+    
+    #----------------------------------------------------------------------
+    def registerGeneralHandler(self, handler):
+        """注册通用事件处理函数监听"""
+        if handler not in self.__generalHandlers:
+            self.__generalHandlers.append(handler)
+        
+        self.__updateDispatch()
+    
+    #----------------------------------------------------------------------
+    def unregisterGeneralHandler(self, handler):
+        """注销通用事件处理函数监听"""
+        if handler in self.__generalHandlers:
+            self.__generalHandlers.remove(handler)
+        
+        self.__updateDispatch()
+    
+    #----------------------------------------------------------------------
+    def hasHandler(self, type_):
+        """检查是否有函数监听该类型的事件（包括通用处理函数）"""
+        mainTuple, shardTuple = self.__dispatchDict.get(type_, self.__generalDispatch)
+        return bool(mainTuple or shardTuple)
+    
+    #----------------------------------------------------------------------
+    def getQueueSize(self):
+        """获取各工作线程的队列长度"""
+        return [len(worker.queue) for worker in self.__workers]
+
+
+########################################################################
+class LatencyHistogram(object):
+    """
+    耗时直方图，按对数刻度分桶（每倍频程4个桶），
+    记录时只需计算桶编号，分位数精度约为19%
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self):
+        """Constructor"""
+        self.count = 0
+        self.total = 0          # 总耗时（微秒）
+        self.max = 0            # 最大耗时（微秒）
+        self.bucketDict = defaultdict(int)
+    
+    #----------------------------------------------------------------------
+    def add(self, us):
+        """记录一次耗时（微秒）"""
+        self.count += 1
+        self.total += us
+        if us > self.max:
+            self.max = us
+        
+        if us < 1:
+            bucket = 0
+        else:
+            bucket = int(math.log(us, 2) * 4) + 1
+        self.bucketDict[bucket] += 1
+    
+    #----------------------------------------------------------------------
+    def percentile(self, p):
+        """计算分位数（p为0到100），返回所在桶的上限，不超过最大值"""
+        if not self.count:
+            return 0
+        
+        target = self.count * p / 100.0
+        n = 0
+        for bucket in sorted(self.bucketDict.keys()):
+            n += self.bucketDict[bucket]
+            if n >= target:
+                return min(2 ** (bucket / 4.0), self.max)
+        return self.max
+    
+    #----------------------------------------------------------------------
+    def getResult(self):
+        """获取统计结果"""
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0,
+            'p50': self.percentile(50),
+            'p99': self.percentile(99),
+            'max': self.max
+        }
+
+
+########################################################################
+class EventProfiler(object):
+    """
+    事件引擎性能统计
+    统计每种事件、每个处理函数的调用次数和耗时分布，
+    以及队列深度和事件在队列中的等待时间，耗时单位均为微秒
+    
+    ShardedEventEngine的多个工作线程共用一个统计器，统计数据的更新和读取
+    都在锁内进行，处理函数的调用在锁外进行
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, put, interval=10):
+        """Constructor"""
+        self.put = put                  # 事件引擎的put函数，用于推送统计事件
+        self.interval = interval        # 统计事件推送间隔（秒）
+        self.lastPushTime = time()
+        
+        self.lock = Lock()
+        self.reset()
+    
+    #----------------------------------------------------------------------
+    def reset(self):
+        """清空统计数据"""
+        self.eventDict = defaultdict(LatencyHistogram)      # key为事件类型
+        self.handlerDict = defaultdict(LatencyHistogram)    # key为(事件类型, 处理函数名)
+        self.waitHistogram = LatencyHistogram()             # 队列等待时间
+        self.depthMax = 0
+        self.depthTotal = 0
+        self.depthCount = 0
+        self.nameDict = {}                                  # 处理函数名缓存
+    
+    #----------------------------------------------------------------------
+    def getHandlerName(self, handler):
+        """获取处理函数名，对象方法为类名.方法名"""
+        key = id(handler)
+        name = self.nameDict.get(key, None)
+        
+        if name is None:
+            obj = getattr(handler, '__self__', None)
+            funcName = getattr(handler, '__name__', repr(handler))
+            if obj is not None:
+                name = '%s.%s' %(obj.__class__.__name__, funcName)
+            else:
+                name = funcName
+            self.nameDict[key] = name
+        
+        return name
+    
+    #----------------------------------------------------------------------
+    def process(self, event, handlerList, queueSize):
+        """调用处理函数并统计"""
+        start = time()
+        
+        # 逐个调用处理函数并计时
+        type_ = event.type_
+        costList = []
+        t1 = start
+        for handler in handlerList:
+            handler(event)
+            t2 = time()
+            costList.append((handler, (t2 - t1) * 1000000))
+            t1 = t2
+        
+        with self.lock:
+            # 队列统计
+            self.depthCount += 1
+            self.depthTotal += queueSize
+            if queueSize > self.depthMax:
+                self.depthMax = queueSize
+            
+            putTime = getattr(event, 'putTime', None)
+            if putTime:
+                self.waitHistogram.add((start - putTime) * 1000000)
+            
+            # 处理函数统计
+            for handler, cost in costList:
+                self.handlerDict[(type_, self.getHandlerName(handler))].add(cost)
+            
+            self.eventDict[type_].add((t1 - start) * 1000000)
+            
+            # 检查是否需要推送统计事件
+            push = type_ == EVENT_TIMER and t1 - self.lastPushTime >= self.interval
+            if push:
+                self.lastPushTime = t1
+        
+        # 定时推送统计事件
+        if push:
+            profileEvent = Event(type_=EVENT_PROFILE)
+            profileEvent.dict_['data'] = self.getProfile()
+            self.put(profileEvent)
+    
+    #----------------------------------------------------------------------
+    def getProfile(self, reset=False):
+        """获取统计结果字典"""
+        with self.lock:
+            handlers = defaultdict(dict)
+            for (type_, name), histogram in self.handlerDict.items():
+                handlers[type_][name] = histogram.getResult()
+            
+            d = {
+                'queue': {
+                    'depthMax': self.depthMax,
+                    'depthMean': self.depthTotal / self.depthCount if self.depthCount else 0,
+                    'wait': self.waitHistogram.getResult()
+                },
+                'events': dict([(type_, histogram.getResult()) 
+                                for type_, histogram in self.eventDict.items()]),
+                'handlers': dict(handlers)
+            }
+            
+            if reset:
+                self.reset()
+        
+        return d
+    
+    #----------------------------------------------------------------------
+    def dump(self):
+        """格式化统计结果，按处理函数的总耗时从大到小排列"""
+        d = self.getProfile()
+        
+        lines = []
+        queue = d['queue']
+        wait = queue['wait']
+        lines.append(u'队列深度：平均%.1f，最大%s' %(queue['depthMean'], queue['depthMax']))
+        lines.append(u'队列等待(us)：p50 %.1f，p99 %.1f，max %.1f' %(wait['p50'], wait['p99'], 
+                                                               wait['max']))
+        
+        lines.append(u'%-30s%-40s%10s%12s%12s%12s' %('type', 'handler', 'count', 
+                                                   'p50(us)', 'p99(us)', 'max(us)'))
+        l = []
+        for type_, handlers in d['handlers'].items():
+            for name, result in handlers.items():
+                l.append((result['mean'] * result['count'], type_, name, result))
+        l.sort(key=lambda x: x[0], reverse=True)
+        
+        for total, type_, name, result in l:
+            lines.append(u'%-30s%-40s%10s%12.1f%12.1f%12.1f' %(type_, name, result['count'],
+                                                           result['p50'], result['p99'],
+                                                           result['max']))
+        
+        return '\n'.join(lines)
 
 
 ########################################################################
@@ -350,6 +1055,39 @@ def test():
     ee.start()
     
     app.exec_()
+
+
+#----------------------------------------------------------------------
+def benchmark(count=1000000):
+    """
+    吞吐量测试函数，比较EventEngine2和BatchEventEngine每秒处理的事件数量
+    模拟一个事件类型注册了两个处理函数的情况
+    """
+    for engineClass in [EventEngine2, BatchEventEngine]:
+        ee = engineClass()
+        
+        result = {'count': 0}
+        def handler1(event):
+            result['count'] += 1
+        def handler2(event):
+            pass
+        
+        ee.register('eBenchmark', handler1)
+        ee.register('eBenchmark', handler2)
+        ee.start()
+        
+        start = time()
+        for i in range(count):
+            ee.put(Event('eBenchmark'))
+        
+        while result['count'] < count:
+            sleep(0.001)
+        cost = time() - start
+        
+        ee.stop()
+        
+        print(u'%s：处理%s个事件耗时%.3f秒，每秒%.0f个' %(engineClass.__name__, count, 
+                                                   cost, count/cost))
     
     
 # 直接运行脚本可以进行测试
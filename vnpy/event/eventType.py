@@ -14,6 +14,7 @@ from __future__ import print_function
 
 
 EVENT_TIMER = 'eTimer'                  # 计时器事件，每隔1秒发送一次
+EVENT_PROFILE = 'eProfile'              # 事件引擎性能统计事件，开启统计后定时发送
  
 
 
@@ -25,8 +25,12 @@ vega：当v涨跌1个点时，price的变动（如从16%涨到17%）
 
 from __future__ import division
 
+import numpy as np
 from scipy import stats
-from math import (log, pow, sqrt, exp)
+from scipy.special import ndtr
+from math import (log, pow, sqrt, exp, pi)
+
+from .impv import solveImpv
 
 cdf = stats.norm.cdf
 
@@ -39,6 +43,9 @@ STEP_DIFF = STEP_CHANGE * 2
 
 DX_TARGET = 0.00001
 
+SQRT_2PI = sqrt(2 * pi)
+PRICE_TOLERANCE = 1e-8      # 批量计算隐含波动率时的最小有效时间价值（相对行权价）
+
 
 #----------------------------------------------------------------------
 def calculatePrice(s, k, r, t, v, cp):
@@ -150,4 +157,90 @@ def calculateImpv(price, s, k, r, t, cp):
     v = round(v, 4)
     
     return v
-    
\ No newline at end of file
+    
+
+#----------------------------------------------------------------------
+# 以下为基于NumPy数组的批量计算函数，用于一次性计算整条期权链
+# 参数可以是数组或者标量（按NumPy规则广播），希腊值使用解析公式计算，
+# 定义和上面数值差分版本的结果保持一致
+#----------------------------------------------------------------------
+def calculateD1D2(s, k, r, t, v):
+    """计算d1和d2，无效的波动率和剩余时间替换为1避免除0"""
+    valid = (v > 0) & (t > 0)
+    v = np.where(valid, v, 1)
+    t = np.where(valid, t, 1)
+    
+    vt = v * np.sqrt(t)
+    d1 = (np.log(s / k) + (r + 0.5 * v * v) * t) / vt
+    d2 = d1 - vt
+    return d1, d2, vt, valid
+
+#----------------------------------------------------------------------
+def calculatePriceArray(s, k, r, t, v, cp):
+    """批量计算期权价格"""
+    s, k, r, t, v, cp = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in (s, k, r, t, v, cp)])
+    
+    d1, d2, vt, valid = calculateD1D2(s, k, r, t, v)
+    price = cp * (s * ndtr(cp * d1) - k * ndtr(cp * d2) * np.exp(-r * t))
+    
+    # 波动率或剩余时间无效时返回期权空间价值
+    return np.where(valid, price, np.maximum(0, cp * (s - k)))
+
+#----------------------------------------------------------------------
+def calculateGreeksArray(s, k, r, t, v, cp):
+    """批量计算期权的价格和希腊值，返回(price, delta, gamma, theta, vega)数组"""
+    s, k, r, t, v, cp = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in (s, k, r, t, v, cp)])
+    
+    d1, d2, vt, valid = calculateD1D2(s, k, r, t, v)
+    sqrtT = np.sqrt(np.where(valid, t, 1))
+    pdf1 = np.exp(-0.5 * d1 * d1) / SQRT_2PI
+    kDiscount = k * np.exp(-r * t)
+    nd2 = ndtr(cp * d2)
+    
+    price = cp * (s * ndtr(cp * d1) - kDiscount * nd2)
+    
+    originalDelta = cp * ndtr(cp * d1)
+    originalGamma = pdf1 / (s * vt)
+    
+    delta = originalDelta * s * 0.01
+    gamma = (originalDelta + s * originalGamma) * pow(0.01, 3) * s * s
+    theta = -(s * pdf1 * np.where(valid, v, 1) / (2 * sqrtT) + cp * r * kDiscount * nd2) / 240
+    vega = s * pdf1 * sqrtT / 100
+    
+    # 波动率或剩余时间无效时按期权空间价值计算
+    intrinsic = np.maximum(0, cp * (s - k))
+    price = np.where(valid, price, intrinsic)
+    delta = np.where(valid, delta, np.where(intrinsic > 0, cp * s * 0.01, 0))
+    gamma = np.where(valid, gamma, 0)
+    theta = np.where(valid, theta, 0)
+    vega = np.where(valid, vega, 0)
+    
+    return price, delta, gamma, theta, vega
+
+#----------------------------------------------------------------------
+def calculatePriceVega(s, k, r, t, v, cp):
+    """批量计算期权价格和原始vega，输入均为有效值的数组，用于隐含波动率求解"""
+    d1, d2, vt, valid = calculateD1D2(s, k, r, t, v)
+    price = cp * (s * ndtr(cp * d1) - k * ndtr(cp * d2) * np.exp(-r * t))
+    vega = s * np.exp(-0.5 * d1 * d1) / SQRT_2PI * np.sqrt(t)
+    return price, vega
+
+#----------------------------------------------------------------------
+def calculateImpvArray(price, s, k, r, t, cp, v0=None):
+    """
+    批量计算隐含波动率，返回(隐含波动率数组, 状态码数组)
+    v0为初始波动率数组，传入上一次的计算结果可以加快收敛，状态码定义见impv.py
+    """
+    price, s, k, r, t, cp = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in (price, s, k, r, t, cp)])
+    price, s, k, r, t, cp = [x.ravel() for x in (price, s, k, r, t, cp)]
+    
+    # 检查期权价格为正数且满足最小价值（即到期行权价值），
+    # 和最小价值的差距过小时波动率无法确定，同样视为无效
+    minValue = np.where(cp == 1, (s - k) * np.exp(-r * t), k * np.exp(-r * t) - s)
+    valid = (price > PRICE_TOLERANCE * k) & (price - minValue > PRICE_TOLERANCE * k) & (t > 0) & (s > 0) & (k > 0)
+    
+    # 只计算尚未收敛的位置
+    priceVegaFunc = lambda v, index: calculatePriceVega(s[index], k[index], r[index], t[index], 
+                                                        v, cp[index])
+    
+    return solveImpv(price, valid, priceVegaFunc, v0)
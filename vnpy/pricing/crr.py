@@ -15,8 +15,12 @@ cp：期权类型，+1/-1对应call/put
 n: 二叉树高度
 price：期权价格
 
-出于开发演示的目的，本文件中的希腊值计算基于简单数值差分法，
-运算效率一般，实盘中建议使用更高速的算法。
+单个希腊值的计算函数（calculateDelta等）基于简单数值差分法，运算效率一般；
+calculateGreeks以及以Array结尾的批量计算函数基于同一次二叉树倒推的结果，
+delta、gamma和theta直接从树的前两步节点读取，vega对波动率做差分，
+不同的波动率作为同一批数据在一次倒推中计算完成。
+
+注意和原有实现保持一致，针对期货期权a取1，且未对期权价值做贴现，r不参与计算。
 
 本文件中的希腊值计算结果没有采用传统的模型价格数值，而是采用
 了实盘交易中更为实用的百分比变动数值，具体定义如下
@@ -29,6 +33,8 @@ vega：当v涨跌1个点时，price的变动（如从16%涨到17%）
 import numpy as np
 from math import (isnan, exp, sqrt, pow)
 
+from .impv import solveImpv
+
 
 # 计算希腊值和隐含波动率时用的参数
 STEP_CHANGE = 0.001
@@ -38,6 +44,7 @@ STEP_DIFF = STEP_CHANGE * 2
 
 DX_TARGET = 0.00001
 
+PRICE_TOLERANCE = 1e-8      # 批量计算隐含波动率时的最小有效时间价值（相对行权价）
 
 
 #----------------------------------------------------------------------
@@ -77,9 +84,27 @@ def generateTree(f, k, r, t, v, cp, n):
     
 #----------------------------------------------------------------------
 def calculatePrice(f, k, r, t, v, cp, n=15):
-    """计算期权价格"""
-    oTree, uTree = generateTree(f, k, r, t, v, cp, n)
-    return oTree[0, 0]
+    """计算期权价格，只保留当前一层节点，不生成完整的二叉树矩阵"""
+    if t <= 0 or v <= 0:
+        return max(0, cp * (f - k))
+    
+    dt = t / n
+    u = exp(v * sqrt(dt))
+    d = 1 / u
+    p1 = (1 - d) / (u - d)
+    p2 = 1 - p1
+    
+    # 到期时的期权价值
+    fList = [f * pow(u, n - 2 * j) for j in range(n+1)]
+    oList = [max(0, cp * (x - k)) for x in fList]
+    
+    # 逐层倒推
+    for i in range(n-1, -1, -1):
+        fList = [x * d for x in fList[:-1]]
+        oList = [max(p1 * oList[j] + p2 * oList[j+1], cp * (fList[j] - k)) 
+                 for j in range(i+1)]
+    
+    return oList[0]
 
 #----------------------------------------------------------------------
 def calculateDelta(f, k, r, t, v, cp, n=15):
@@ -121,13 +146,9 @@ def calculateOriginalVega(f, k, r, t, v, cp, n=15):
 
 #----------------------------------------------------------------------
 def calculateGreeks(f, k, r, t, v, cp, n=15):
-    """计算期权的价格和希腊值"""
-    price = calculatePrice(f, k, r, t, v, cp, n)
-    delta = calculateDelta(f, k, r, t, v, cp, n)
-    gamma = calculateGamma(f, k, r, t, v, cp, n)
-    theta = calculateTheta(f, k, r, t, v, cp, n)
-    vega = calculateVega(f, k, r, t, v, cp, n)
-    return price, delta, gamma, theta, vega
+    """计算期权的价格和希腊值，基于同一次二叉树倒推的结果"""
+    result = calculateGreeksArray(f, k, r, t, v, cp, n)
+    return tuple([float(x) for x in result])
 
 #----------------------------------------------------------------------
 def calculateImpv(price, f, k, r, t, cp, n=15):
@@ -179,3 +200,141 @@ def calculateImpv(price, f, k, r, t, cp, n=15):
     v = round(v, 4)
     
     return v
+
+
+#----------------------------------------------------------------------
+# 以下为基于NumPy数组的批量计算函数，用于一次性计算整条期权链
+# 参数可以是数组或者标量（按NumPy规则广播），所有期权在同一棵
+# 形状为(期权数量, 节点数量)的二叉树上逐层倒推，不再为每次计算分配矩阵
+#----------------------------------------------------------------------
+def sweepTree(f, k, t, v, cp, n):
+    """
+    批量倒推二叉树，输入均为有效值的一维数组
+    返回(根节点价值, 第1步节点价值, 第2步节点价值, 上涨幅度u)，
+    第i步第j个节点对应的标的价格为f * u^(i-2j)
+    """
+    dt = t / n
+    lnU = v * np.sqrt(dt)
+    u = np.exp(lnU)
+    d = 1 / u
+    
+    # 风险平价概率（a=1）
+    p1 = ((1 - d) / (u - d))[:, None]
+    p2 = 1 - p1
+    d = d[:, None]
+    k = k[:, None]
+    cp = cp[:, None]
+    
+    # 到期时的标的价格和期权价值
+    fTree = f[:, None] * np.exp(lnU[:, None] * np.arange(n, -n-1, -2))
+    oTree = np.maximum(0, cp * (fTree - k))
+    
+    option1 = option2 = None
+    for i in range(n-1, -1, -1):
+        fTree = fTree[:, :-1] * d
+        oTree = np.maximum(p1 * oTree[:, :-1] + p2 * oTree[:, 1:],     # 美式期权存续价值
+                           cp * (fTree - k))                          # 美式期权行权价值
+        
+        if i == 2:
+            option2 = oTree
+        elif i == 1:
+            option1 = oTree
+    
+    return oTree[:, 0], option1, option2, u
+
+#----------------------------------------------------------------------
+def prepareArray(*args):
+    """将参数广播为一维数组，并检查二叉树计算需要的参数是否有效"""
+    f, k, r, t, v, cp = [x.ravel() for x in 
+                         np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in args])]
+    valid = (f > 0) & (k > 0) & (t > 0) & (v > 0)
+    return f, k, r, t, v, cp, valid
+
+#----------------------------------------------------------------------
+def calculatePriceArray(f, k, r, t, v, cp, n=15):
+    """批量计算期权价格"""
+    shape = np.broadcast(f, k, r, t, v, cp).shape
+    f, k, r, t, v, cp, valid = prepareArray(f, k, r, t, v, cp)
+    
+    # 参数无效时返回期权空间价值
+    price = np.maximum(0, cp * (f - k))
+    if valid.any():
+        price[valid] = sweepTree(f[valid], k[valid], t[valid], v[valid], cp[valid], n)[0]
+    
+    return price.reshape(shape)
+
+#----------------------------------------------------------------------
+def calculateGreeksArray(f, k, r, t, v, cp, n=15):
+    """
+    批量计算期权的价格和希腊值，返回(price, delta, gamma, theta, vega)数组
+    n至少为2，delta、gamma和theta基于二叉树前两步的节点计算
+    """
+    shape = np.broadcast(f, k, r, t, v, cp).shape
+    f, k, r, t, v, cp, valid = prepareArray(f, k, r, t, v, cp)
+    
+    # 参数无效时按期权空间价值计算
+    intrinsic = np.maximum(0, cp * (f - k))
+    price = intrinsic.copy()
+    delta = np.where(intrinsic > 0, cp * f * 0.01, 0)
+    gamma = np.zeros(len(f))
+    theta = np.zeros(len(f))
+    vega = np.zeros(len(f))
+    
+    if valid.any():
+        fv, kv, tv, vv, cpv = f[valid], k[valid], t[valid], v[valid], cp[valid]
+        m = len(fv)
+        
+        # 当前波动率和上下差分的波动率在同一次倒推中计算
+        option0, option1, option2, u = sweepTree(np.tile(fv, 3), np.tile(kv, 3), np.tile(tv, 3), 
+                                                 np.concatenate([vv, vv*STEP_UP, vv*STEP_DOWN]),
+                                                 np.tile(cpv, 3), n)
+        
+        u = u[:m]
+        u2 = u * u
+        option1 = option1[:m]
+        option2 = option2[:m]
+        
+        # 第1步节点计算delta，第2步节点计算gamma
+        originalDelta = (option1[:, 0] - option1[:, 1]) / (fv * (u - 1 / u))
+        deltaUp = (option2[:, 0] - option2[:, 1]) / (fv * (u2 - 1))
+        deltaDown = (option2[:, 1] - option2[:, 2]) / (fv * (1 - 1 / u2))
+        originalGamma = (deltaUp - deltaDown) / (fv * (u2 - 1 / u2) / 2)
+        
+        price[valid] = option0[:m]
+        delta[valid] = originalDelta * fv * 0.01
+        gamma[valid] = (originalDelta + fv * originalGamma) * pow(0.01, 3) * fv * fv
+        
+        # 第2步中间节点的标的价格不变，剩余时间减少2个步长
+        theta[valid] = (option2[:, 1] - option0[:m]) / (2 * tv / n * 240)
+        vega[valid] = (option0[m:2*m] - option0[2*m:]) / (vv * STEP_DIFF) / 100
+    
+    return tuple([x.reshape(shape) for x in (price, delta, gamma, theta, vega)])
+
+#----------------------------------------------------------------------
+def calculatePriceVega(f, k, r, t, v, cp, n=15):
+    """批量计算期权价格和原始vega，输入均为有效值的数组，用于隐含波动率求解"""
+    m = len(f)
+    option0 = sweepTree(np.tile(f, 3), np.tile(k, 3), np.tile(t, 3),
+                        np.concatenate([v, v*STEP_UP, v*STEP_DOWN]), np.tile(cp, 3), n)[0]
+    vega = (option0[m:2*m] - option0[2*m:]) / (v * STEP_DIFF)
+    return option0[:m], vega
+
+#----------------------------------------------------------------------
+def calculateImpvArray(price, f, k, r, t, cp, v0=None, n=15):
+    """
+    批量计算隐含波动率，返回(隐含波动率数组, 状态码数组)
+    v0为初始波动率数组，传入上一次的计算结果可以加快收敛，状态码定义见impv.py
+    """
+    price, f, k, r, t, cp = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in (price, f, k, r, t, cp)])
+    price, f, k, r, t, cp = [x.ravel() for x in (price, f, k, r, t, cp)]
+    
+    # 检查期权价格为正数且满足最小价值（即立即行权价值），
+    # 和最小价值的差距过小时波动率无法确定，同样视为无效
+    minValue = cp * (f - k)
+    valid = (price > PRICE_TOLERANCE * k) & (price - minValue > PRICE_TOLERANCE * k) & (t > 0) & (f > 0) & (k > 0)
+    
+    # 只计算尚未收敛的位置
+    priceVegaFunc = lambda v, index: calculatePriceVega(f[index], k[index], r[index], t[index], 
+                                                        v, cp[index], n)
+    
+    return solveImpv(price, valid, priceVegaFunc, v0)
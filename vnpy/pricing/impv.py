@@ -0,0 +1,110 @@
+# encoding: UTF-8
+
+'''
+批量隐含波动率求解器，供各定价模型的calculateImpvArray调用
+
+算法为带区间保护的Newton迭代：
+1. 每个位置维护一个包含解的波动率区间[lo, hi]，初始为[MIN_VOL, MAX_VOL]
+2. 每轮迭代根据模型价格和目标价格的大小关系收缩区间
+3. Newton步落在区间外或者vega过小时改用二分，保证每轮区间至少减半或者Newton收敛
+4. Newton步长小于DX_TARGET，或者区间宽度小于DX_TARGET时认为收敛
+
+可以传入上一次的计算结果作为初始值（热启动），行情变化不大时通常1到2轮即可收敛。
+每个位置返回状态码，而不是在无法计算时直接返回0。
+'''
+
+from __future__ import division
+
+import numpy as np
+
+
+# 求解参数
+MIN_VOL = 0.0001        # 波动率下限
+MAX_VOL = 5.0           # 波动率上限
+DEFAULT_VOL = 0.3       # 没有热启动值时的初始波动率
+DX_TARGET = 0.00001     # 收敛精度
+MAX_ITERATION = 50      # 最大迭代次数
+
+# 状态码
+IMPV_NONE = 0               # 尚未计算
+IMPV_CONVERGED = 1          # 收敛
+IMPV_NOT_CONVERGED = 2      # 达到最大迭代次数仍未收敛，返回当前最优估计
+IMPV_BELOW_MIN = 3          # 价格无效或者不高于最低波动率对应的价格（如低于内在价值），返回0
+IMPV_ABOVE_MAX = 4          # 价格不低于最高波动率对应的价格，返回0
+
+
+#----------------------------------------------------------------------
+def solveImpv(price, valid, priceVegaFunc, v0=None, maxIteration=MAX_ITERATION):
+    """
+    批量求解隐含波动率，返回(隐含波动率数组, 状态码数组)
+
+    price：目标期权价格数组
+    valid：可以求解的位置（价格为正、剩余时间为正等由模型判断）
+    priceVegaFunc(v, index)：计算index位置在波动率v下的(模型价格, 原始vega)
+    v0：初始波动率数组（如上一次的计算结果），无效的位置使用DEFAULT_VOL
+    """
+    n = len(price)
+    impv = np.zeros(n)
+    status = np.full(n, IMPV_BELOW_MIN, dtype=np.int8)
+
+    index = np.flatnonzero(valid)
+    if not len(index):
+        return impv, status
+
+    target = price[index]
+
+    # 检查目标价格在波动率上下限对应的价格之间
+    pMin = priceVegaFunc(np.full(len(index), MIN_VOL), index)[0]
+    pMax = priceVegaFunc(np.full(len(index), MAX_VOL), index)[0]
+
+    status[index[target >= pMax]] = IMPV_ABOVE_MAX
+    inside = (target > pMin) & (target < pMax)
+    index = index[inside]
+    target = target[inside]
+
+    lo = np.full(len(index), MIN_VOL)
+    hi = np.full(len(index), MAX_VOL)
+
+    if v0 is None:
+        v = np.full(len(index), DEFAULT_VOL)
+    else:
+        v = np.asarray(v0, dtype=float)[index]
+        v = np.where((v > MIN_VOL) & (v < MAX_VOL), v, DEFAULT_VOL)
+
+    status[index] = IMPV_NOT_CONVERGED
+
+    for i in range(maxIteration):
+        if not len(index):
+            break
+
+        p, vega = priceVegaFunc(v, index)
+        diff = p - target
+
+        # 收缩区间，模型价格高于目标价格时解在v左侧
+        above = diff > 0
+        hi = np.where(above, v, hi)
+        lo = np.where(above, lo, v)
+
+        # Newton步
+        hasVega = vega > 0
+        dx = -diff / np.where(hasVega, vega, 1)
+        newton = v + dx
+
+        # 收敛检查
+        done = (hasVega & (np.abs(dx) < DX_TARGET)) | (hi - lo < DX_TARGET)
+        if done.any():
+            impv[index[done]] = np.where(hasVega & (np.abs(dx) < DX_TARGET), v, (lo + hi) / 2)[done]
+            status[index[done]] = IMPV_CONVERGED
+
+            keep = ~done
+            index, target, lo, hi = index[keep], target[keep], lo[keep], hi[keep]
+            newton, hasVega = newton[keep], hasVega[keep]
+
+        # Newton步落在区间外时改用二分
+        useNewton = hasVega & (newton > lo) & (newton < hi)
+        v = np.where(useNewton, newton, (lo + hi) / 2)
+
+    # 未收敛的位置返回当前估计值
+    impv[index] = v
+
+    return impv, status
@@ -12,6 +12,11 @@ from collections import OrderedDict
 from itertools import product
 import multiprocessing
 import copy
+import json
+import os
+import shutil
+import tempfile
+import traceback
 
 import pymongo
 import numpy as np
@@ -28,11 +33,14 @@ except ImportError:
     pass
 
 from vnpy.trader.vtGlobal import globalSetting
-from vnpy.trader.vtObject import VtTickData, VtBarData
+from vnpy.trader.vtFunction import getTempPath
+from vnpy.trader.vtObject import VtTickData, VtBarData, VtCompactTickData, VtCompactBarData
+from vnpy.trader.vtDataStore import ColumnarStore
 from vnpy.trader.vtConstant import *
 from vnpy.trader.vtGateway import VtOrderData, VtTradeData
 
 from .ctaBase import *
+from .ctaOptimizer import GeneticSearch, SurrogateSearch
 
 
 ########################################################################
@@ -74,6 +82,8 @@ class BacktestingEngine(object):
         self.dbClient = None        # 数据库客户端
         self.dbCursor = None        # 数据库指针
         self.hdsClient = None       # 历史数据服务器客户端
+        self.dataStore = None       # 列式数据存储，设置后优先从中读取数据
+        self.compactData = False    # 是否使用紧凑数据类
         
         self.initData = []          # 初始化用的数据
         self.dbName = ''            # 回测数据库名
@@ -99,6 +109,18 @@ class BacktestingEngine(object):
         
         # 日线回测结果计算用
         self.dailyResultDict = OrderedDict()
+        
+        # 优化时提前终止回测用
+        self.pruneSetting = {}          # 提前终止条件，为空时不检查
+        self.pruned = False             # 是否已被提前终止
+        self.pruneTradeCount = 0        # 已计入盈亏的成交数量
+        self.prunePos = 0               # 当前持仓
+        self.pruneCash = 0              # 成交产生的现金流（已扣除手续费和滑点）
+        self.pruneHighlevel = 0         # 盈亏最高值
+        
+        # 向量化撮合用的委托数组，为None时使用逐笔遍历撮合
+        self.limitKernel = None
+        self.stopKernel = None
     
     #------------------------------------------------
     # 通用功能
@@ -155,6 +177,47 @@ class BacktestingEngine(object):
         self.dbName = dbName
         self.symbol = symbol
     
+    #----------------------------------------------------------------------
+    def setVectorizedMatching(self, active=True):
+        """
+        设置是否使用向量化撮合，需要在策略发出委托前调用
+        适用于挂有大量委托的网格类策略
+        """
+        if active:
+            self.limitKernel = MatchingKernel()
+            self.stopKernel = MatchingKernel()
+        else:
+            self.limitKernel = None
+            self.stopKernel = None
+    
+    #----------------------------------------------------------------------
+    def setPruning(self, maxDrawdown=0, minNetPnl=None):
+        """
+        设置回测提前终止条件，每个交易日开始时以最新价格计算盯市盈亏检查：
+        maxDrawdown：盈亏回撤超过该值（正数）时终止，为0则不检查
+        minNetPnl：净盈亏低于该值时终止，为None则不检查
+        """
+        self.pruneSetting = {}
+        if maxDrawdown:
+            self.pruneSetting['maxDrawdown'] = maxDrawdown
+        if minNetPnl is not None:
+            self.pruneSetting['minNetPnl'] = minNetPnl
+    
+    #----------------------------------------------------------------------
+    def setDataStore(self, store):
+        """设置列式数据存储（传入ColumnarStore对象或存储路径）"""
+        if not isinstance(store, ColumnarStore):
+            store = ColumnarStore(store)
+        self.dataStore = store
+    
+    #----------------------------------------------------------------------
+    def setCompactData(self, active=True):
+        """
+        设置是否使用基于__slots__的紧凑数据类（VtCompactBarData/VtCompactTickData），
+        可以显著降低初始化数据的内存占用，但策略中不能给K线或Tick对象添加新的属性
+        """
+        self.compactData = active
+    
     #----------------------------------------------------------------------
     def setCapital(self, capital):
         """设置资本金"""
@@ -196,6 +259,10 @@ class BacktestingEngine(object):
     #----------------------------------------------------------------------
     def loadHistoryData(self):
         """载入历史数据"""
+        if self.dataStore:
+            self.loadStoreData()
+            return
+        
         self.dbClient = pymongo.MongoClient(globalSetting['mongoHost'], globalSetting['mongoPort'])
         collection = self.dbClient[self.dbName][self.symbol]          
 
@@ -203,10 +270,10 @@ class BacktestingEngine(object):
         
         # 首先根据回测模式，确认要使用的数据类
         if self.mode == self.BAR_MODE:
-            dataClass = VtBarData
+            dataClass = VtCompactBarData if self.compactData else VtBarData
             func = self.newBar
         else:
-            dataClass = VtTickData
+            dataClass = VtCompactTickData if self.compactData else VtTickData
             func = self.newTick
 
         # 载入初始化需要用的数据        
@@ -222,10 +289,13 @@ class BacktestingEngine(object):
         
         # 将数据从查询指针中读取出，并生成列表
         self.initData = []              # 清空initData列表
-        for d in initCursor:
-            data = dataClass()
-            data.__dict__ = d
-            self.initData.append(data)      
+        if self.compactData:
+            self.initData = [dataClass.fromDict(d) for d in initCursor]
+        else:
+            for d in initCursor:
+                data = dataClass()
+                data.__dict__ = d
+                self.initData.append(data)      
         
         # 载入回测数据
         if self.hdsClient:
@@ -246,6 +316,26 @@ class BacktestingEngine(object):
         else:
             count = initCursor.count() + self.dbCursor.count()
         self.output(u'载入完成，数据量：%s' %count)
+    
+    #----------------------------------------------------------------------
+    def loadStoreData(self):
+        """从列式数据存储载入历史数据，回测数据以生成器方式逐条创建对象"""
+        self.output(u'开始载入数据')
+        
+        store = self.dataStore
+        initArray = store.loadRange(self.dbName, self.symbol, 
+                                    self.dataStartDate, self.strategyStartDate, 
+                                    includeEnd=False)
+        self.initData = list(store.iterData(self.dbName, self.symbol, initArray, 
+                                            compact=self.compactData))
+        
+        dataArray = store.loadRange(self.dbName, self.symbol, 
+                                    self.strategyStartDate, self.dataEndDate)
+        self.dbCursor = store.iterData(self.dbName, self.symbol, dataArray, 
+                                       compact=self.compactData)
+        
+        count = len(initArray) + len(dataArray)
+        self.output(u'载入完成，数据量：%s' %count)
         
     #----------------------------------------------------------------------
     def runBacktesting(self):
@@ -255,10 +345,10 @@ class BacktestingEngine(object):
         
         # 首先根据回测模式，确认要使用的数据类
         if self.mode == self.BAR_MODE:
-            dataClass = VtBarData
+            dataClass = VtCompactBarData if self.compactData else VtBarData
             func = self.newBar
         else:
-            dataClass = VtTickData
+            dataClass = VtCompactTickData if self.compactData else VtTickData
             func = self.newTick
 
         self.output(u'开始回测')
@@ -273,12 +363,31 @@ class BacktestingEngine(object):
         
         self.output(u'开始回放数据')
 
-        for d in self.dbCursor:
-            data = dataClass()
-            data.__dict__ = d
-            func(data)     
-            
-        self.output(u'数据回放结束')
+        if self.dataStore:
+            for data in self.dbCursor:
+                func(data)
+                
+                if self.pruned:
+                    break
+        elif self.compactData:
+            for d in self.dbCursor:
+                func(dataClass.fromDict(d))
+                
+                if self.pruned:
+                    break
+        else:
+            for d in self.dbCursor:
+                data = dataClass()
+                data.__dict__ = d
+                func(data)     
+                
+                if self.pruned:
+                    break
+        
+        if self.pruned:
+            self.output(u'回测满足终止条件，提前结束于：%s' %self.dt)
+        else:
+            self.output(u'数据回放结束')
         
     #----------------------------------------------------------------------
     def newBar(self, bar):
@@ -328,6 +437,12 @@ class BacktestingEngine(object):
             buyBestCrossPrice = self.tick.askPrice1
             sellBestCrossPrice = self.tick.bidPrice1
         
+        # 使用向量化撮合
+        if self.limitKernel:
+            self.crossLimitOrderByKernel(buyCrossPrice, sellCrossPrice,
+                                         buyBestCrossPrice, sellBestCrossPrice)
+            return
+        
         # 遍历限价单字典中的所有限价单
         for orderID, order in list(self.workingLimitOrderDict.items()):
             # 推送委托进入队列（未成交）的状态更新
@@ -398,6 +513,11 @@ class BacktestingEngine(object):
             sellCrossPrice = self.tick.lastPrice
             bestCrossPrice = self.tick.lastPrice
         
+        # 使用向量化撮合
+        if self.stopKernel:
+            self.crossStopOrderByKernel(buyCrossPrice, sellCrossPrice, bestCrossPrice)
+            return
+        
         # 遍历停止单字典中的所有停止单
         for stopOrderID, so in list(self.workingStopOrderDict.items()):
             # 判断是否会成交
@@ -459,6 +579,140 @@ class BacktestingEngine(object):
                 self.strategy.onOrder(order)
                 self.strategy.onTrade(trade)
     
+    #----------------------------------------------------------------------
+    def crossLimitOrderByKernel(self, buyCrossPrice, sellCrossPrice,
+                                buyBestCrossPrice, sellBestCrossPrice):
+        """
+        基于委托数组向量化撮合限价单
+        一次比较找出所有成交的委托，只为成交的委托创建成交对象
+        """
+        kernel = self.limitKernel
+        slotList, crossList = kernel.crossLimit(buyCrossPrice, sellCrossPrice)
+        if not slotList:
+            return
+        
+        tradeTime = self.dt.strftime('%H:%M:%S')    # 每次撮合只格式化一次时间
+        
+        for slot, cross in zip(slotList, crossList):
+            orderID = kernel.orderIDList[slot]
+            
+            # 委托可能已在之前的回调中被撤销
+            order = self.workingLimitOrderDict.get(orderID, None)
+            if not order:
+                continue
+            
+            # 推送委托进入队列（未成交）的状态更新
+            if not order.status:
+                order.status = STATUS_NOTTRADED
+                kernel.newArray[slot] = False
+                self.strategy.onOrder(order)
+                
+                if orderID not in self.workingLimitOrderDict:
+                    continue
+            
+            if not cross:
+                continue
+            
+            if order.direction == DIRECTION_LONG:
+                price = min(order.price, buyBestCrossPrice)
+                self.strategy.pos += order.totalVolume
+            else:
+                price = max(order.price, sellBestCrossPrice)
+                self.strategy.pos -= order.totalVolume
+            
+            trade = self.createTrade(order.vtSymbol, orderID, order.direction, order.offset,
+                                     price, order.totalVolume, tradeTime)
+            self.strategy.onTrade(trade)
+            
+            # 推送委托数据
+            order.tradedVolume = order.totalVolume
+            order.status = STATUS_ALLTRADED
+            self.strategy.onOrder(order)
+            
+            # 从字典和委托数组中删除该限价单
+            if orderID in self.workingLimitOrderDict:
+                del self.workingLimitOrderDict[orderID]
+            kernel.removeOrder(orderID)
+    
+    #----------------------------------------------------------------------
+    def crossStopOrderByKernel(self, buyCrossPrice, sellCrossPrice, bestCrossPrice):
+        """基于委托数组向量化撮合停止单"""
+        kernel = self.stopKernel
+        slotList, crossList = kernel.crossStop(buyCrossPrice, sellCrossPrice)
+        if not slotList:
+            return
+        
+        tradeTime = self.dt.strftime('%H:%M:%S')
+        
+        for slot in slotList:
+            stopOrderID = kernel.orderIDList[slot]
+            
+            # 停止单可能已在之前的回调中被撤销
+            so = self.workingStopOrderDict.get(stopOrderID, None)
+            if not so:
+                continue
+            
+            # 更新停止单状态，并从字典和委托数组中删除该停止单
+            so.status = STOPORDER_TRIGGERED
+            del self.workingStopOrderDict[stopOrderID]
+            kernel.removeOrder(stopOrderID)
+            
+            if so.direction == DIRECTION_LONG:
+                self.strategy.pos += so.volume
+                price = max(bestCrossPrice, so.price)
+            else:
+                self.strategy.pos -= so.volume
+                price = min(bestCrossPrice, so.price)
+            
+            self.limitOrderCount += 1
+            orderID = str(self.limitOrderCount)
+            
+            trade = self.createTrade(so.vtSymbol, orderID, so.direction, so.offset,
+                                     price, so.volume, tradeTime)
+            
+            # 推送委托数据
+            order = VtOrderData()
+            order.vtSymbol = so.vtSymbol
+            order.symbol = so.vtSymbol
+            order.orderID = orderID
+            order.vtOrderID = orderID
+            order.direction = so.direction
+            order.offset = so.offset
+            order.price = so.price
+            order.totalVolume = so.volume
+            order.tradedVolume = so.volume
+            order.status = STATUS_ALLTRADED
+            order.orderTime = tradeTime
+            
+            self.limitOrderDict[orderID] = order
+            
+            # 按照顺序推送数据
+            self.strategy.onStopOrder(so)
+            self.strategy.onOrder(order)
+            self.strategy.onTrade(trade)
+    
+    #----------------------------------------------------------------------
+    def createTrade(self, vtSymbol, orderID, direction, offset, price, volume, tradeTime):
+        """创建成交对象并保存到成交字典"""
+        self.tradeCount += 1            # 成交编号自增1
+        tradeID = str(self.tradeCount)
+        
+        trade = VtTradeData()
+        trade.vtSymbol = vtSymbol
+        trade.tradeID = tradeID
+        trade.vtTradeID = tradeID
+        trade.orderID = orderID
+        trade.vtOrderID = orderID
+        trade.direction = direction
+        trade.offset = offset
+        trade.price = price
+        trade.volume = volume
+        trade.tradeTime = tradeTime
+        trade.dt = self.dt
+        
+        self.tradeDict[tradeID] = trade
+        return trade
+    
     #------------------------------------------------
     # 策略接口相关
     #------------------------------------------------      
@@ -495,6 +749,10 @@ class BacktestingEngine(object):
         self.workingLimitOrderDict[orderID] = order
         self.limitOrderDict[orderID] = order
         
+        if self.limitKernel:
+            self.limitKernel.addOrder(orderID, order.price, order.direction, 
+                                      order.totalVolume, new=True)
+        
         return [orderID]
     
     #----------------------------------------------------------------------
@@ -509,6 +767,9 @@ class BacktestingEngine(object):
             self.strategy.onOrder(order)
             
             del self.workingLimitOrderDict[vtOrderID]
+            
+            if self.limitKernel:
+                self.limitKernel.removeOrder(vtOrderID)
         
     #----------------------------------------------------------------------
     def sendStopOrder(self, vtSymbol, orderType, price, volume, strategy):
@@ -541,6 +802,9 @@ class BacktestingEngine(object):
         self.stopOrderDict[stopOrderID] = so
         self.workingStopOrderDict[stopOrderID] = so
         
+        if self.stopKernel:
+            self.stopKernel.addOrder(stopOrderID, so.price, so.direction, so.volume)
+        
         # 推送停止单初始更新
         self.strategy.onStopOrder(so)        
         
@@ -554,6 +818,10 @@ class BacktestingEngine(object):
             so = self.workingStopOrderDict[stopOrderID]
             so.status = STOPORDER_CANCELLED
             del self.workingStopOrderDict[stopOrderID]
+            
+            if self.stopKernel:
+                self.stopKernel.removeOrder(stopOrderID)
+            
             self.strategy.onStopOrder(so)
     
     #----------------------------------------------------------------------
@@ -887,6 +1155,11 @@ class BacktestingEngine(object):
         self.stopOrderDict.clear()
         self.workingStopOrderDict.clear()
         
+        # 清空向量化撮合的委托数组
+        if self.limitKernel:
+            self.limitKernel.clear()
+            self.stopKernel.clear()
+        
         # 清空成交相关
         self.tradeCount = 0
         self.tradeDict.clear()
@@ -894,6 +1167,13 @@ class BacktestingEngine(object):
         # 清空逐日统计相关
         self.dailyResultDict.clear()
         
+        # 清空提前终止相关
+        self.pruned = False
+        self.pruneTradeCount = 0
+        self.prunePos = 0
+        self.pruneCash = 0
+        self.pruneHighlevel = 0
+        
     #----------------------------------------------------------------------
     def runOptimization(self, strategyClass, optimizationSetting):
         """优化参数"""
@@ -905,29 +1185,73 @@ class BacktestingEngine(object):
         if not settingList or not targetName:
             self.output(u'优化设置有问题，请检查')
         
+        self.setPruning(**optimizationSetting.pruneSetting)
+        
+        # 历史数据只从数据库载入一次，之后每次回测从内存映射文件读取
+        dataStore = self.dataStore
+        storePath = self.prepareOptimizationData()
+        if storePath and not dataStore:
+            self.setDataStore(storePath)
+        
         # 遍历优化
         resultList = []
-        for setting in settingList:
-            self.clearBacktestingResult()
-            self.output('-' * 30)
-            self.output('setting: %s' %str(setting))
-            self.initStrategy(strategyClass, setting)
-            self.runBacktesting()
-            self.calculateDailyResult()
-            d, result = self.calculateDailyStatistics()            
-            try:
-                targetValue = result[targetName]
-            except KeyError:
-                targetValue = 0
-            resultList.append(([str(setting)], targetValue, result))
+        try:
+            for setting in settingList:
+                self.clearBacktestingResult()
+                self.output('-' * 30)
+                self.output('setting: %s' %str(setting))
+                self.initStrategy(strategyClass, setting)
+                self.runBacktesting()
+                self.calculateDailyResult()
+                d, result = self.calculateDailyStatistics()            
+                try:
+                    targetValue = result[targetName]
+                except KeyError:
+                    targetValue = 0
+                result['pruned'] = self.pruned
+                resultList.append(([str(setting)], targetValue, result))
+        finally:
+            # 回测出错时同样恢复原有的数据存储并删除临时数据
+            self.dataStore = dataStore
+            self.pruneSetting = {}
+            self.clearOptimizationData(storePath)
         
         # 显示结果
-        resultList.sort(reverse=True, key=lambda result:result[1])
+        sortOptimizationResult(resultList)
         return self.outputOptimizeResult(resultList)
 
     #----------------------------------------------------------------------
-    def runParallelOptimization(self, strategyClass, optimizationSetting):
-        """并行优化参数"""
+    def runParallelOptimization(self, strategyClass, optimizationSetting,
+                                callback=None, checkpointFile=''):
+        """
+        并行优化参数
+        callback：每完成一个参数组合时调用，传入(setting, targetValue, result)
+        checkpointFile：断点文件路径，已完成的结果会逐条写入，再次运行时跳过
+        """
+        resultList = []
+        
+        for result in self.iterParallelOptimization(strategyClass, optimizationSetting,
+                                                    checkpointFile):
+            if callback:
+                callback(result)
+            
+            # 运行出错的参数组合不参与排序
+            if result[1] is None:
+                self.output(u'参数：%s运行出错：%s' %(result[0], result[2]['error']))
+                continue
+            
+            resultList.append(result)
+        
+        # 显示结果
+        sortOptimizationResult(resultList)
+        return resultList
+    
+    #----------------------------------------------------------------------
+    def iterParallelOptimization(self, strategyClass, optimizationSetting, checkpointFile=''):
+        """
+        并行优化参数，以生成器的方式按完成顺序逐个返回(setting, targetValue, result)
+        运行出错的参数组合返回的targetValue为None，result中的error字段为错误信息
+        """
         # 获取优化设置        
         settingList = optimizationSetting.generateSetting()
         targetName = optimizationSetting.optimizeTarget
@@ -936,30 +1260,185 @@ class BacktestingEngine(object):
         if not settingList or not targetName:
             self.output(u'优化设置有问题，请检查')
         
+        # 先返回断点文件中已完成的结果
+        finishedSet = set()
+        for result in loadOptimizationCheckpoint(checkpointFile):
+            finishedSet.add(result[0])
+            yield result
+        
+        settingList = [setting for setting in settingList 
+                       if str(setting) not in finishedSet]
+        if not settingList:
+            return
+        
+        # 历史数据只载入一次，各进程以只读方式映射同一份数据文件
+        storePath = self.prepareOptimizationData()
+        
+        taskList = [self.createOptimizeTask(strategyClass, setting, targetName, 
+                                            storePath, optimizationSetting.pruneSetting)
+                    for setting in settingList]
+        
         # 多进程优化，启动一个对应CPU核心数量的进程池
         pool = multiprocessing.Pool(multiprocessing.cpu_count())
-        l = []
+        
+        try:
+            for result in pool.imap_unordered(optimizeTask, taskList):
+                if result[1] is not None:
+                    saveOptimizationCheckpoint(checkpointFile, result)
+                yield result
+            
+            pool.close()
+        finally:
+            # 调用方提前停止迭代时，直接终止尚未完成的进程
+            pool.terminate()
+            pool.join()
+            self.clearOptimizationData(storePath)
 
-        for setting in settingList:
-            l.append(pool.apply_async(optimize, (strategyClass, setting,
-                                                 targetName, self.mode, 
-                                                 self.startDate, self.initDays, self.endDate,
-                                                 self.slippage, self.rate, self.size, self.priceTick,
-                                                 self.dbName, self.symbol)))
-        pool.close()
-        pool.join()
+    #----------------------------------------------------------------------
+    def runGeneticOptimization(self, strategyClass, optimizationSetting, 
+                               callback=None, **kwargs):
+        """
+        遗传算法优化参数，参数网格和优化目标同样来自optimizationSetting
+        kwargs传给GeneticSearch，如populationSize、generations等
+        """
+        searcher = GeneticSearch(optimizationSetting.paramDict, **kwargs)
+        return self.runAdaptiveOptimization(strategyClass, optimizationSetting, 
+                                            searcher, callback)
+    
+    #----------------------------------------------------------------------
+    def runSurrogateOptimization(self, strategyClass, optimizationSetting, 
+                                 callback=None, **kwargs):
+        """
+        代理模型优化参数，kwargs传给SurrogateSearch，如initPoints、iterations等
+        """
+        kwargs.setdefault('batchSize', multiprocessing.cpu_count())
+        searcher = SurrogateSearch(optimizationSetting.paramDict, **kwargs)
+        return self.runAdaptiveOptimization(strategyClass, optimizationSetting, 
+                                            searcher, callback)
+    
+    #----------------------------------------------------------------------
+    def runAdaptiveOptimization(self, strategyClass, optimizationSetting, 
+                                searcher, callback=None):
+        """
+        使用自适应搜索器并行优化参数：
+        每轮从搜索器获取一批参数组合，在进程池中回测后将目标值传回搜索器，
+        直到搜索器不再返回新的参数组合
+        """
+        targetName = optimizationSetting.optimizeTarget
         
-        # 显示结果
-        resultList = [res.get() for res in l]
-        resultList.sort(reverse=True, key=lambda result:result[1])
+        # 检查参数设置问题
+        if not optimizationSetting.paramDict or not targetName:
+            self.output(u'优化设置有问题，请检查')
+            return []
+        
+        storePath = self.prepareOptimizationData()
+        pool = multiprocessing.Pool(multiprocessing.cpu_count())
+        
+        resultDict = OrderedDict()      # 已完成的回测结果，key为str(setting)
+        
+        try:
+            while True:
+                settingList = searcher.ask()
+                if not settingList:
+                    break
+                
+                # 搜索器可能返回已回测过的组合，只回测新的组合
+                taskList = [self.createOptimizeTask(strategyClass, setting, targetName, 
+                                                    storePath, optimizationSetting.pruneSetting)
+                            for setting in settingList
+                            if str(setting) not in resultDict]
+                
+                for result in pool.map(optimizeTask, taskList):
+                    resultDict[result[0]] = result
+                    if callback:
+                        callback(result)
+                
+                # 提前终止的组合目标值不完整，和运行出错一样按最差值传给搜索器
+                targetList = [getCompletedTarget(resultDict[str(setting)]) for setting in settingList]
+                searcher.tell(settingList, targetList)
+                
+                targetList = [getCompletedTarget(r) for r in resultDict.values()]
+                self.output(u'已完成回测：%s，当前最优目标：%s' %(len(resultDict), 
+                            max([t for t in targetList if t is not None] or [None])))
+            
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+            self.clearOptimizationData(storePath)
+        
+        # 运行出错的参数组合不参与排序
+        resultList = [r for r in resultDict.values() if r[1] is not None]
+        sortOptimizationResult(resultList)
         return resultList
-
+    
+    #----------------------------------------------------------------------
+    def createOptimizeTask(self, strategyClass, setting, targetName, 
+                           storePath='', pruneSetting=None):
+        """生成进程池中optimize函数的参数"""
+        return (strategyClass, setting,
+                targetName, self.mode, 
+                self.startDate, self.initDays, self.endDate,
+                self.slippage, self.rate, self.size, self.priceTick,
+                self.dbName, self.symbol, storePath, pruneSetting,
+                self.limitKernel is not None, self.compactData)
+    
+    #----------------------------------------------------------------------
+    def prepareOptimizationData(self):
+        """
+        将优化所需的历史数据一次性从数据库载入到内存映射文件中，返回存储路径，
+        各优化进程挂载同一份文件，由操作系统页缓存共享内存
+        
+        每次优化使用单独的临时目录，避免同时运行的多个优化互相覆盖数据文件，
+        优化结束后由clearOptimizationData删除
+        """
+        # 已设置列式数据存储则直接使用
+        if self.dataStore:
+            return self.dataStore.path
+        
+        self.output(u'开始缓存优化用的历史数据')
+        
+        store = ColumnarStore(tempfile.mkdtemp(prefix='optimizationStore_',
+                                               dir=getTempPath('')))
+        
+        dbClient = pymongo.MongoClient(globalSetting['mongoHost'], globalSetting['mongoPort'])
+        try:
+            count = store.convertFromMongo(dbClient, self.dbName, self.symbol,
+                                           self.dataStartDate, self.dataEndDate,
+                                           output=self.output)
+        finally:
+            dbClient.close()
+        
+        # 没有数据时仍由各进程自行从数据库载入
+        if not count:
+            self.output(u'历史数据为空，无法缓存')
+            shutil.rmtree(store.path, ignore_errors=True)
+            return ''
+        
+        self.output(u'历史数据缓存完成，数据量：%s' %count)
+        return store.path
+    
+    #----------------------------------------------------------------------
+    def clearOptimizationData(self, storePath):
+        """删除prepareOptimizationData为本次优化创建的临时数据目录"""
+        if not storePath:
+            return
+        
+        # 用户自行设置的列式数据存储不删除
+        if self.dataStore and self.dataStore.path == storePath:
+            return
+        
+        shutil.rmtree(storePath, ignore_errors=True)
+    
     #----------------------------------------------------------------------
     def outputOptimizeResult(self, resultList):
         self.output('-' * 30)
         self.output(u'优化结果：')
         for result in resultList:
-            self.output(u'参数：%s，目标：%s' % (result[0], result[1]))
+            if result[2].get('pruned', False):
+                self.output(u'参数：%s，目标：%s（提前终止）' % (result[0], result[1]))
+            else:
+                self.output(u'参数：%s，目标：%s' % (result[0], result[1]))
         return resultList
 
     #----------------------------------------------------------------------
@@ -968,10 +1447,46 @@ class BacktestingEngine(object):
         date = dt.date()
         
         if date not in self.dailyResultDict:
+            # 每个新交易日检查是否满足提前终止条件
+            if self.pruneSetting:
+                self.checkPruning(price)
+            
             self.dailyResultDict[date] = DailyResult(date, price)
         else:
             self.dailyResultDict[date].closePrice = price
             
+    #----------------------------------------------------------------------
+    def checkPruning(self, price):
+        """以最新价格计算盯市盈亏，检查是否满足提前终止条件"""
+        # 成交编号连续递增，只需处理上次检查后新增的成交
+        for i in range(self.pruneTradeCount+1, self.tradeCount+1):
+            trade = self.tradeDict[str(i)]
+            turnover = trade.price * trade.volume * self.size
+            
+            if trade.direction == DIRECTION_LONG:
+                self.prunePos += trade.volume
+                self.pruneCash -= turnover
+            else:
+                self.prunePos -= trade.volume
+                self.pruneCash += turnover
+            
+            self.pruneCash -= turnover * self.rate
+            self.pruneCash -= trade.volume * self.size * self.slippage
+        
+        self.pruneTradeCount = self.tradeCount
+        
+        netPnl = self.pruneCash + self.prunePos * price * self.size
+        self.pruneHighlevel = max(self.pruneHighlevel, netPnl)
+        drawdown = self.pruneHighlevel - netPnl
+        
+        maxDrawdown = self.pruneSetting.get('maxDrawdown', 0)
+        if maxDrawdown and drawdown > maxDrawdown:
+            self.pruned = True
+        
+        minNetPnl = self.pruneSetting.get('minNetPnl', None)
+        if minNetPnl is not None and netPnl < minNetPnl:
+            self.pruned = True
+    
     #----------------------------------------------------------------------
     def calculateDailyResult(self):
         """计算按日统计的交易结果"""
@@ -1001,8 +1516,8 @@ class BacktestingEngine(object):
     #----------------------------------------------------------------------
     def calculateDailyStatistics(self, annualDays=240):
         """计算按日统计的结果"""
-        dateList = self.dailyResultDict.keys()
-        resultList = self.dailyResultDict.values()
+        dateList = list(self.dailyResultDict.keys())
+        resultList = list(self.dailyResultDict.values())
         
         startDate = dateList[0]
         endDate = dateList[-1]  
@@ -1249,6 +1764,132 @@ class DailyResult(object):
         self.netPnl = self.totalPnl - self.commission - self.slippage
 
 
+########################################################################
+class MatchingKernel(object):
+    """
+    向量化撮合用的委托数组
+    活动委托的价格、方向、数量保存在NumPy数组中，按委托发出的先后顺序排列，
+    撮合时通过一次向量化比较找出所有满足条件的委托。
+    撤销或成交的委托只标记为非活动，待非活动委托过多时再统一压缩。
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, capacity=64):
+        """Constructor"""
+        self.orderIDList = []       # 数组位置对应的委托编号
+        self.slotDict = {}          # 委托编号对应的数组位置
+        self.count = 0              # 已使用的数组长度
+        
+        self.priceArray = np.zeros(capacity)
+        self.directionArray = np.zeros(capacity, dtype=np.int8)    # 1为多，-1为空
+        self.volumeArray = np.zeros(capacity)
+        self.activeArray = np.zeros(capacity, dtype=bool)          # 是否仍为活动委托
+        self.newArray = np.zeros(capacity, dtype=bool)             # 是否尚未推送过未成交状态
+    
+    #----------------------------------------------------------------------
+    def addOrder(self, orderID, price, direction, volume, new=False):
+        """添加委托"""
+        # 撮合回调中也可能添加委托，此时不能压缩数组改变已有位置，只能扩容
+        if self.count == len(self.priceArray):
+            self.resize(len(self.priceArray) * 2)
+        
+        slot = self.count
+        self.count += 1
+        
+        self.orderIDList.append(orderID)
+        self.slotDict[orderID] = slot
+        
+        self.priceArray[slot] = price
+        self.directionArray[slot] = 1 if direction == DIRECTION_LONG else -1
+        self.volumeArray[slot] = volume
+        self.activeArray[slot] = True
+        self.newArray[slot] = new
+    
+    #----------------------------------------------------------------------
+    def removeOrder(self, orderID):
+        """移除委托（标记为非活动）"""
+        slot = self.slotDict.pop(orderID, None)
+        if slot is not None:
+            self.activeArray[slot] = False
+            self.newArray[slot] = False
+    
+    #----------------------------------------------------------------------
+    def resize(self, capacity):
+        """扩充数组容量"""
+        for name in ['priceArray', 'directionArray', 'volumeArray',
+                     'activeArray', 'newArray']:
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+    
+    #----------------------------------------------------------------------
+    def compact(self):
+        """非活动委托超过一半时将其压缩掉，保持原有顺序"""
+        n = self.count
+        if len(self.slotDict) * 2 > n:
+            return
+        keep = np.flatnonzero(self.activeArray[:n])
+        
+        m = len(keep)
+        for name in ['priceArray', 'directionArray', 'volumeArray',
+                     'activeArray', 'newArray']:
+            array = getattr(self, name)
+            array[:m] = array[keep]
+            array[m:n] = 0
+        
+        self.orderIDList = [self.orderIDList[i] for i in keep.tolist()]
+        self.slotDict = dict(zip(self.orderIDList, range(m)))
+        self.count = m
+    
+    #----------------------------------------------------------------------
+    def clear(self):
+        """清空所有委托"""
+        self.orderIDList = []
+        self.slotDict.clear()
+        self.count = 0
+        self.activeArray[:] = False
+        self.newArray[:] = False
+    
+    #----------------------------------------------------------------------
+    def crossLimit(self, buyCrossPrice, sellCrossPrice):
+        """
+        限价单撮合：买单价格不低于buyCrossPrice，卖单价格不高于sellCrossPrice
+        返回需要处理的数组位置列表（含尚未推送状态的新委托）和对应的是否成交列表
+        """
+        self.compact()
+        
+        n = self.count
+        price = self.priceArray[:n]
+        direction = self.directionArray[:n]
+        
+        cross = np.zeros(n, dtype=bool)
+        if buyCrossPrice > 0:       # 国内的行情在涨停时askPrice1为0，此时买无法成交
+            cross |= (direction == 1) & (price >= buyCrossPrice)
+        if sellCrossPrice > 0:      # 国内的行情在跌停时bidPrice1为0，此时卖无法成交
+            cross |= (direction == -1) & (price <= sellCrossPrice)
+        cross &= self.activeArray[:n]
+        
+        slots = np.flatnonzero(cross | self.newArray[:n])
+        return slots.tolist(), cross[slots].tolist()
+    
+    #----------------------------------------------------------------------
+    def crossStop(self, buyCrossPrice, sellCrossPrice):
+        """停止单撮合：买单价格不高于buyCrossPrice，卖单价格不低于sellCrossPrice"""
+        self.compact()
+        
+        n = self.count
+        price = self.priceArray[:n]
+        direction = self.directionArray[:n]
+        
+        cross = (((direction == 1) & (price <= buyCrossPrice)) |
+                 ((direction == -1) & (price >= sellCrossPrice)))
+        cross &= self.activeArray[:n]
+        
+        slots = np.flatnonzero(cross)
+        return slots.tolist(), [True] * len(slots)
+
+
 ########################################################################
 class OptimizationSetting(object):
     """优化设置"""
@@ -1259,6 +1900,7 @@ class OptimizationSetting(object):
         self.paramDict = OrderedDict()
         
         self.optimizeTarget = ''        # 优化目标字段
+        self.pruneSetting = {}          # 回测提前终止条件
         
     #----------------------------------------------------------------------
     def addParameter(self, name, start, end=None, step=None):
@@ -1306,6 +1948,18 @@ class OptimizationSetting(object):
     def setOptimizeTarget(self, target):
         """设置优化目标字段"""
         self.optimizeTarget = target
+        
+    #----------------------------------------------------------------------
+    def setPruning(self, maxDrawdown=0, minNetPnl=None):
+        """
+        设置回测提前终止条件，回测过程中盈亏回撤超过maxDrawdown
+        或净盈亏低于minNetPnl时提前结束该参数组合的回测
+        """
+        self.pruneSetting = {}
+        if maxDrawdown:
+            self.pruneSetting['maxDrawdown'] = maxDrawdown
+        if minNetPnl is not None:
+            self.pruneSetting['minNetPnl'] = minNetPnl
 
 
 ########################################################################
@@ -1374,8 +2028,14 @@ def formatNumber(n):
 def optimize(strategyClass, setting, targetName,
              mode, startDate, initDays, endDate,
              slippage, rate, size, priceTick,
-             dbName, symbol):
-    """多进程优化时跑在每个进程中运行的函数"""
+             dbName, symbol, storePath='', pruneSetting=None,
+             vectorizedMatching=False, compactData=False):
+    """
+    多进程优化时跑在每个进程中运行的函数
+    storePath为父进程缓存的列式数据存储路径，为空时从数据库载入数据
+    pruneSetting为回测提前终止条件
+    vectorizedMatching、compactData和父进程引擎的设置保持一致
+    """
     engine = BacktestingEngine()
     engine.setBacktestingMode(mode)
     engine.setStartDate(startDate, initDays)
@@ -1386,6 +2046,15 @@ def optimize(strategyClass, setting, targetName,
     engine.setPriceTick(priceTick)
     engine.setDatabase(dbName, symbol)
     
+    if storePath:
+        engine.setDataStore(storePath)
+    
+    if pruneSetting:
+        engine.setPruning(**pruneSetting)
+    
+    engine.setVectorizedMatching(vectorizedMatching)
+    engine.setCompactData(compactData)
+    
     engine.initStrategy(strategyClass, setting)
     engine.runBacktesting()
     
@@ -1395,5 +2064,83 @@ def optimize(strategyClass, setting, targetName,
         targetValue = result[targetName]
     except KeyError:
         targetValue = 0       
+    result['pruned'] = engine.pruned
     return (str(setting), targetValue, result)    
+
+
+#----------------------------------------------------------------------
+def optimizeTask(args):
+    """
+    进程池中调用的包装函数，捕获异常，
+    避免单个参数组合运行出错导致整个优化的结果丢失
+    """
+    try:
+        return optimize(*args)
+    except Exception:
+        return (str(args[1]), None, {'error': traceback.format_exc()})
+
+
+#----------------------------------------------------------------------
+def getCompletedTarget(result):
+    """获取完整回测的目标值，运行出错或者被提前终止时返回None"""
+    if result[1] is None or result[2].get('pruned', False):
+        return None
+    return result[1]
+
+
+#----------------------------------------------------------------------
+def sortOptimizationResult(resultList):
+    """
+    优化结果排序，完整回测的结果按目标值从大到小排在前面，
+    提前终止的结果目标值只对应部分回测区间，统一排在后面
+    """
+    resultList.sort(reverse=True, key=lambda result: (not result[2].get('pruned', False), 
+                                                      result[1]))
+    return resultList
+
+
+#----------------------------------------------------------------------
+def loadOptimizationCheckpoint(fileName):
+    """读取优化断点文件中已完成的结果"""
+    resultList = []
+    
+    if not fileName or not os.path.isfile(fileName):
+        return resultList
+    
+    with open(fileName) as f:
+        for line in f:
+            # 跳过进程崩溃时可能写了一半的行
+            try:
+                d = json.loads(line)
+            except ValueError:
+                continue
+            resultList.append((d['setting'], d['targetValue'], d['result']))
+    
+    return resultList
+
+
+#----------------------------------------------------------------------
+def saveOptimizationCheckpoint(fileName, result):
+    """将一个完成的优化结果追加写入断点文件"""
+    if not fileName:
+        return
+    
+    d = {
+        'setting': result[0],
+        'targetValue': result[1],
+        'result': result[2]
+    }
+    
+    # 进程崩溃时可能留下写了一半的行，先换行避免新的结果和其连在一起
+    line = json.dumps(d, default=str) + '\n'
+    if os.path.isfile(fileName) and os.path.getsize(fileName):
+        with open(fileName, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                line = '\n' + line
+    
+    with open(fileName, 'a') as f:
+        f.write(line)
+        f.flush()
+        os.fsync(f.fileno())
     
@@ -4,8 +4,10 @@
 本文件中包含了CTA模块中用到的一些基础设置、类和常量等。
 '''
 
+from bisect import bisect_right
+
 # CTA引擎中涉及的数据类定义
-from vnpy.trader.vtConstant import EMPTY_UNICODE, EMPTY_STRING, EMPTY_FLOAT, EMPTY_INT
+from vnpy.trader.vtConstant import EMPTY_UNICODE, EMPTY_STRING, EMPTY_FLOAT, EMPTY_INT, DIRECTION_LONG
 
 # 常量定义
 # CTA引擎中涉及到的交易方向类型
@@ -55,4 +57,81 @@ class StopOrder(object):
         
         self.strategy = None             # 下停止单的策略对象
         self.stopOrderID = EMPTY_STRING  # 停止单的本地编号 
-        self.status = EMPTY_STRING       # 停止单状态
\ No newline at end of file
+        self.status = EMPTY_STRING       # 停止单状态
+
+
+########################################################################
+class StopOrderBook(object):
+    """
+    单个合约的本地停止单簿
+    多头停止单按触发价升序排列，空头停止单按触发价降序排列，
+    收到行情时只需二分查找出被触发的前缀部分，触发价相同时按下单先后排序
+    """
+    
+    INFINITY = float('inf')
+
+    #----------------------------------------------------------------------
+    def __init__(self):
+        """Constructor"""
+        self.longKeyList = []       # 多头停止单排序键列表，元素为(触发价, 序号)
+        self.longOrderList = []     # 多头停止单列表，和排序键一一对应
+        self.shortKeyList = []      # 空头停止单排序键列表，元素为(-触发价, 序号)
+        self.shortOrderList = []
+        
+        self.keyDict = {}           # stopOrderID:排序键
+        self.count = 0              # 序号计数
+        
+    #----------------------------------------------------------------------
+    def __len__(self):
+        """停止单数量"""
+        return len(self.keyDict)
+    
+    #----------------------------------------------------------------------
+    def getList(self, so):
+        """获取停止单所在的排序键列表和停止单列表"""
+        if so.direction == DIRECTION_LONG:
+            return self.longKeyList, self.longOrderList
+        else:
+            return self.shortKeyList, self.shortOrderList
+        
+    #----------------------------------------------------------------------
+    def addStopOrder(self, so):
+        """添加停止单"""
+        self.count += 1
+        if so.direction == DIRECTION_LONG:
+            key = (so.price, self.count)
+        else:
+            key = (-so.price, self.count)
+        
+        keyList, orderList = self.getList(so)
+        i = bisect_right(keyList, key)
+        keyList.insert(i, key)
+        orderList.insert(i, so)
+        
+        self.keyDict[so.stopOrderID] = key
+        
+    #----------------------------------------------------------------------
+    def removeStopOrder(self, so):
+        """移除停止单，不存在则返回False"""
+        key = self.keyDict.pop(so.stopOrderID, None)
+        if not key:
+            return False
+        
+        keyList, orderList = self.getList(so)
+        i = bisect_right(keyList, key) - 1
+        del keyList[i]
+        del orderList[i]
+        return True
+    
+    #----------------------------------------------------------------------
+    def getTriggered(self, lastPrice):
+        """获取被最新价触发的停止单列表，先多头后空头"""
+        # 多头：触发价小于等于最新价
+        n = bisect_right(self.longKeyList, (lastPrice, self.INFINITY))
+        l = self.longOrderList[:n]
+        
+        # 空头：触发价大于等于最新价
+        n = bisect_right(self.shortKeyList, (-lastPrice, self.INFINITY))
+        l.extend(self.shortOrderList[:n])
+        
+        return l
@@ -13,12 +13,13 @@ from collections import OrderedDict
 from datetime import datetime, timedelta
 from copy import copy
 
-from vnpy.event import Event
+from vnpy.event import Event, shardBySymbol
+from vnpy.trader.vtGlobal import globalSetting
 from vnpy.trader.vtEvent import *
 from vnpy.trader.vtConstant import *
 from vnpy.trader.vtObject import VtTickData, VtBarData
 from vnpy.trader.vtGateway import VtSubscribeReq, VtOrderReq, VtCancelOrderReq, VtLogData
-from vnpy.trader.vtFunction import todayDate, getJsonPath
+from vnpy.trader.vtFunction import todayDate, getJsonPath, parseTickDatetime
 from vnpy.trader.app import AppEngine
 
 from .ctaBase import *
@@ -64,6 +65,9 @@ class CtaEngine(AppEngine):
         self.stopOrderDict = {}             # 停止单撤销后不会从本字典中删除
         self.workingStopOrderDict = {}      # 停止单撤销后会从本字典中删除
         
+        # 按合约索引的活动停止单簿，key为vtSymbol，value为StopOrderBook对象
+        self.stopOrderBookDict = {}
+        
         # 保存策略名称和委托号列表的字典
         # key为name，value为保存orderID（限价+本地停止）的集合
         self.strategyOrderDict = {}
@@ -94,6 +98,7 @@ class CtaEngine(AppEngine):
         
         req.productClass = strategy.productClass
         req.currency = strategy.currency        
+        req.strategyName = strategy.name
         
         # 设计为CTA引擎发出的委托只允许使用限价单
         req.priceType = PRICETYPE_LIMITPRICE    
@@ -184,6 +189,13 @@ class CtaEngine(AppEngine):
         self.stopOrderDict[stopOrderID] = so
         self.workingStopOrderDict[stopOrderID] = so
         
+        # 添加到合约的停止单簿中
+        book = self.stopOrderBookDict.get(vtSymbol, None)
+        if not book:
+            book = StopOrderBook()
+            self.stopOrderBookDict[vtSymbol] = book
+        book.addStopOrder(so)
+        
         # 保存stopOrderID到策略委托号集合中
         self.strategyOrderDict[strategy.name].add(stopOrderID)
         
@@ -203,8 +215,9 @@ class CtaEngine(AppEngine):
             # 更改停止单状态为已撤销
             so.status = STOPORDER_CANCELLED
             
-            # 从活动停止单字典中移除
+            # 从活动停止单字典和停止单簿中移除
             del self.workingStopOrderDict[stopOrderID]
+            self.stopOrderBookDict[so.vtSymbol].removeStopOrder(so)
             
             # 从策略委托号集合中移除
             s = self.strategyOrderDict[strategy.name]
@@ -219,45 +232,51 @@ class CtaEngine(AppEngine):
         """收到行情后处理本地停止单（检查是否要立即发出）"""
         vtSymbol = tick.vtSymbol
         
-        # 首先检查是否有策略交易该合约
-        if vtSymbol in self.tickStrategyDict:
-            # 遍历等待中的停止单，检查是否会被触发
-            for so in self.workingStopOrderDict.values():
-                if so.vtSymbol == vtSymbol:
-                    longTriggered = so.direction==DIRECTION_LONG and tick.lastPrice>=so.price        # 多头停止单被触发
-                    shortTriggered = so.direction==DIRECTION_SHORT and tick.lastPrice<=so.price     # 空头停止单被触发
-                    
-                    if longTriggered or shortTriggered:
-                        # 买入和卖出分别以涨停跌停价发单（模拟市价单）
-                        # 对于没有涨跌停价格的市场则使用5档报价
-                        if so.direction==DIRECTION_LONG:
-                            if tick.upperLimit:
-                                price = tick.upperLimit
-                            else:
-                                price = tick.askPrice5
-                        else:
-                            if tick.lowerLimit:
-                                price = tick.lowerLimit
-                            else:
-                                price = tick.bidPrice5
-                        
-                        # 发出市价委托
-                        vtOrderID = self.sendOrder(so.vtSymbol, so.orderType, 
-                                                   price, so.volume, so.strategy)
-                        
-                        # 检查因为风控流控等原因导致的委托失败（无委托号）
-                        if vtOrderID:
-                            # 从活动停止单字典中移除该停止单
-                            del self.workingStopOrderDict[so.stopOrderID]
-                            
-                            # 从策略委托号集合中移除
-                            s = self.strategyOrderDict[so.strategy.name]
-                            if so.stopOrderID in s:
-                                s.remove(so.stopOrderID)
-                            
-                            # 更新停止单状态，并通知策略
-                            so.status = STOPORDER_TRIGGERED
-                            so.strategy.onStopOrder(so)
+        # 首先检查是否有策略交易该合约，以及该合约是否有等待中的停止单
+        if vtSymbol not in self.tickStrategyDict:
+            return
+        
+        book = self.stopOrderBookDict.get(vtSymbol, None)
+        if not book:
+            return
+        
+        # 从停止单簿中取出被触发的停止单
+        for so in book.getTriggered(tick.lastPrice):
+            # 停止单可能已在之前的策略回调中被撤销（如OCO）
+            if so.status != STOPORDER_WAITING:
+                continue
+            
+            # 买入和卖出分别以涨停跌停价发单（模拟市价单）
+            # 对于没有涨跌停价格的市场则使用5档报价
+            if so.direction==DIRECTION_LONG:
+                if tick.upperLimit:
+                    price = tick.upperLimit
+                else:
+                    price = tick.askPrice5
+            else:
+                if tick.lowerLimit:
+                    price = tick.lowerLimit
+                else:
+                    price = tick.bidPrice5
+            
+            # 发出市价委托
+            vtOrderID = self.sendOrder(so.vtSymbol, so.orderType, 
+                                       price, so.volume, so.strategy)
+            
+            # 检查因为风控流控等原因导致的委托失败（无委托号）
+            if vtOrderID:
+                # 从活动停止单字典和停止单簿中移除该停止单
+                del self.workingStopOrderDict[so.stopOrderID]
+                book.removeStopOrder(so)
+                
+                # 从策略委托号集合中移除
+                s = self.strategyOrderDict[so.strategy.name]
+                if so.stopOrderID in s:
+                    s.remove(so.stopOrderID)
+                
+                # 更新停止单状态，并通知策略
+                so.status = STOPORDER_TRIGGERED
+                so.strategy.onStopOrder(so)
 
     #----------------------------------------------------------------------
     def processTickEvent(self, event):
@@ -274,7 +293,7 @@ class CtaEngine(AppEngine):
             try:
                 # 添加datetime字段
                 if not tick.datetime:
-                    tick.datetime = datetime.strptime(' '.join([tick.date, tick.time]), '%Y%m%d %H:%M:%S.%f')
+                    tick.datetime = parseTickDatetime(tick.date, tick.time)
             except ValueError:
                 self.writeCtaLog(traceback.format_exc())
                 return
@@ -331,9 +350,16 @@ class CtaEngine(AppEngine):
     #----------------------------------------------------------------------
     def registerEvent(self):
         """注册事件监听"""
-        self.eventEngine.register(EVENT_TICK, self.processTickEvent)
-        self.eventEngine.register(EVENT_ORDER, self.processOrderEvent)
-        self.eventEngine.register(EVENT_TRADE, self.processTradeEvent)
+        # 使用ShardedEventEngine时可以设置按合约分片，同一合约的行情、委托、成交
+        # 由同一个工作线程按顺序处理，要求交易不同合约的策略之间互相独立
+        if globalSetting.get('ctaShardBySymbol', False):
+            self.eventEngine.register(EVENT_TICK, self.processTickEvent, shardKey=shardBySymbol)
+            self.eventEngine.register(EVENT_ORDER, self.processOrderEvent, shardKey=shardBySymbol)
+            self.eventEngine.register(EVENT_TRADE, self.processTradeEvent, shardKey=shardBySymbol)
+        else:
+            self.eventEngine.register(EVENT_TICK, self.processTickEvent)
+            self.eventEngine.register(EVENT_ORDER, self.processOrderEvent)
+            self.eventEngine.register(EVENT_TRADE, self.processTradeEvent)
  
     #----------------------------------------------------------------------
     def insertData(self, dbName, collectionName, data):
@@ -479,7 +505,7 @@ class CtaEngine(AppEngine):
                         self.cancelOrder(vtOrderID)
                 
                 # 对该策略发出的所有本地停止单撤单
-                for stopOrderID, so in self.workingStopOrderDict.items():
+                for stopOrderID, so in list(self.workingStopOrderDict.items()):
                     if so.strategy is strategy:
                         self.cancelStopOrder(stopOrderID)   
         else:
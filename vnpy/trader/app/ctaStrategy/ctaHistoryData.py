@@ -6,19 +6,25 @@
 2. 将通达信导出的历史数据载入到MongoDB中的函数
 3. 将交易开拓者导出的历史数据载入到MongoDB中的函数
 4. 将OKEX下载的历史数据载入到MongoDB中的函数
+
+数据导入统一使用批量处理流程：一次读取整个文件后按列解析，日期时间只对去重后的
+字符串调用strptime，在内存中按datetime去重后分块批量写入MongoDB，也可以通过store
+参数直接写入列式存储（ColumnarStore），返回写入的数据条数
 """
 from __future__ import print_function
 
 import csv
+import sys
 from datetime import datetime, timedelta
 from time import time
-from struct import unpack
 
+import numpy as np
 import pymongo
 
 from vnpy.trader.vtGlobal import globalSetting
 from vnpy.trader.vtConstant import *
 from vnpy.trader.vtObject import VtBarData
+from vnpy.trader.vtDataStore import BAR_DTYPE, DATA_BAR
 from .ctaBase import SETTING_DB_NAME, TICK_DB_NAME, MINUTE_DB_NAME, DAILY_DB_NAME
 
 
@@ -73,105 +79,196 @@ def downloadEquityDailyBarts(self, symbol):
         print(u'找不到合约%s' %symbol)
 
 #----------------------------------------------------------------------
-def loadMcCsv(fileName, dbName, symbol):
+def readCsvRows(fileName, skipRows=0):
+    """读取CSV文件的全部行，返回行列表"""
+    # Python 2的csv模块要求以二进制模式打开，Python 3则需要关闭换行符转换
+    if sys.version_info[0] < 3:
+        f = open(fileName, 'rb')
+    else:
+        f = open(fileName, 'r', newline='')
+    
+    with f:
+        rows = [row for row in csv.reader(f) if row]
+    return rows[skipRows:]
+
+#----------------------------------------------------------------------
+def parseDatetime(dateList, dateFormat, timeList=None, timeFormat=None):
+    """
+    批量解析日期和时间字符串，返回(datetime64数组, date字符串数组, time字符串数组)
+    历史K线中的日期和时间重复度很高，只对去重后的值调用strptime，再按索引展开
+    """
+    dates, dateIndex = np.unique(np.asarray(dateList), return_inverse=True)
+    dayList = [datetime.strptime(s, dateFormat) for s in dates]
+    
+    dayArray = np.array(dayList, dtype='datetime64[us]')[dateIndex]
+    dateArray = np.array([d.strftime('%Y%m%d') for d in dayList])[dateIndex]
+    
+    if timeList is None:
+        return dayArray, dateArray, np.full(len(dayArray), '', dtype='U8')
+    
+    times, timeIndex = np.unique(np.asarray(timeList), return_inverse=True)
+    tList = [datetime.strptime(s, timeFormat) for s in times]
+    
+    secondArray = np.array([t.hour*3600 + t.minute*60 + t.second for t in tList], dtype='timedelta64[s]')
+    timeArray = np.array([t.strftime('%H:%M:%S') for t in tList])[timeIndex]
+    
+    return dayArray + secondArray[timeIndex], dateArray, timeArray
+
+#----------------------------------------------------------------------
+def buildBarArray(datetimeArray, dateArray, timeArray, openList, highList, lowList, 
+                  closeList, volumeList, openInterestList=None):
+    """将各列数据组合为K线结构化数组，数值列为字符串时直接转换为浮点数"""
+    array = np.zeros(len(datetimeArray), dtype=BAR_DTYPE)
+    array['datetime'] = datetimeArray
+    array['date'] = dateArray
+    array['time'] = timeArray
+    array['open'] = np.asarray(openList, dtype=float)
+    array['high'] = np.asarray(highList, dtype=float)
+    array['low'] = np.asarray(lowList, dtype=float)
+    array['close'] = np.asarray(closeList, dtype=float)
+    array['volume'] = np.asarray(volumeList, dtype=float)
+    
+    if openInterestList is not None:
+        array['openInterest'] = np.asarray(openInterestList, dtype=float)
+    
+    return array
+
+#----------------------------------------------------------------------
+def dropDuplicates(array):
+    """按datetime排序并去重，同一时间戳保留文件中靠后的一条，返回保留行的索引"""
+    index = np.argsort(array['datetime'], kind='mergesort')
+    
+    dt = array['datetime'][index]
+    keep = np.ones(len(index), dtype=bool)
+    keep[:-1] = dt[1:] != dt[:-1]
+    
+    return index[keep]
+
+#----------------------------------------------------------------------
+def saveBarArray(array, dbName, symbol, store=None, chunkSize=10000, extraDict=None):
+    """
+    去重后分块写入K线数据
+    store为列式存储（ColumnarStore）对象时写入列式存储，否则写入MongoDB：
+    集合为空时使用insert_many，否则按datetime批量upsert，重复导入不会产生重复数据
+    extraDict为BAR_DTYPE以外的额外字段数组字典，只写入MongoDB
+    """
+    total = len(array)
+    index = dropDuplicates(array)
+    array = array[index]
+    count = len(array)
+    
+    print(u'解析完成，共%s条，去重后%s条' %(total, count))
+    
+    if not count:
+        return 0
+    
+    # 写入列式存储
+    if store:
+        meta = {'dataType': DATA_BAR, 'vtSymbol': symbol, 'symbol': symbol}
+        return store.writeArray(dbName, symbol, array, meta)
+    
+    # 写入MongoDB
+    client = pymongo.MongoClient(globalSetting['mongoHost'], globalSetting['mongoPort'])
+    collection = client[dbName][symbol]
+    collection.ensure_index([('datetime', pymongo.ASCENDING)], unique=True)
+    
+    upsert = collection.find_one() is not None
+    
+    template = VtBarData().__dict__
+    template['vtSymbol'] = symbol
+    template['symbol'] = symbol
+    
+    names = array.dtype.names
+    extraNames = []
+    extraList = []
+    if extraDict:
+        extraNames = list(extraDict.keys())
+        extraList = [np.asarray(extraDict[name])[index].tolist() for name in extraNames]
+    
+    for i in range(0, count, chunkSize):
+        dList = []
+        for n, values in enumerate(array[i:i+chunkSize].tolist()):
+            d = template.copy()
+            d.update(zip(names, values))
+            for name, l in zip(extraNames, extraList):
+                d[name] = l[i+n]
+            dList.append(d)
+        
+        if upsert:
+            requests = [pymongo.UpdateOne({'datetime': d['datetime']}, {'$set': d}, upsert=True) 
+                        for d in dList]
+            collection.bulk_write(requests, ordered=False)
+        else:
+            collection.insert_many(dList, ordered=False)
+        
+        print(u'%s 已写入：%s/%s' %(symbol, min(i+chunkSize, count), count))
+    
+    return count
+
+#----------------------------------------------------------------------
+def loadMcCsv(fileName, dbName, symbol, store=None, chunkSize=10000):
     """将Multicharts导出的csv格式的历史数据插入到Mongo数据库中"""
     start = time()
     print(u'开始读取CSV文件%s中的数据插入到%s的%s中' %(fileName, dbName, symbol))
     
-    # 锁定集合，并创建索引
-    client = pymongo.MongoClient(globalSetting['mongoHost'], globalSetting['mongoPort']) 
-    collection = client[dbName][symbol]
-    collection.ensure_index([('datetime', pymongo.ASCENDING)], unique=True)   
+    # 读取数据，第一行为表头
+    rows = readCsvRows(fileName)
+    if not rows:
+        print(u'文件为空')
+        return 0
     
-    # 读取数据和插入到数据库
-    with open(fileName, 'r') as f:
-        reader = csv.DictReader(f)
-        for d in reader:
-            bar = VtBarData()
-            bar.vtSymbol = symbol
-            bar.symbol = symbol
-            bar.open = float(d['Open'])
-            bar.high = float(d['High'])
-            bar.low = float(d['Low'])
-            bar.close = float(d['Close'])
-            bar.date = datetime.strptime(d['Date'], '%Y-%m-%d').strftime('%Y%m%d')
-            bar.time = d['Time']
-            bar.datetime = datetime.strptime(bar.date + ' ' + bar.time, '%Y%m%d %H:%M:%S')
-            bar.volume = d['TotalVolume']
+    header = rows[0]
+    columns = dict(zip(header, zip(*rows[1:]))) if len(rows) > 1 else dict.fromkeys(header, ())
     
-            flt = {'datetime': bar.datetime}
-            collection.update_one(flt, {'$set':bar.__dict__}, upsert=True)  
-            print(bar.date, bar.time)
+    dt, date, t = parseDatetime(columns['Date'], '%Y-%m-%d', columns['Time'], '%H:%M:%S')
+    array = buildBarArray(dt, date, t, columns['Open'], columns['High'], columns['Low'],
+                          columns['Close'], columns['TotalVolume'])
+    
+    # 插入到数据库
+    count = saveBarArray(array, dbName, symbol, store, chunkSize)
     
     print(u'插入完毕，耗时：%s' % (time()-start))
+    return count
 
 #----------------------------------------------------------------------
-def loadTbCsv(fileName, dbName, symbol):
+def loadTbCsv(fileName, dbName, symbol, store=None, chunkSize=10000):
     """将TradeBlazer导出的csv格式的历史分钟数据插入到Mongo数据库中"""
     start = time()
     print(u'开始读取CSV文件%s中的数据插入到%s的%s中' %(fileName, dbName, symbol))
     
-    # 锁定集合，并创建索引
-    client = pymongo.MongoClient(globalSetting['mongoHost'], globalSetting['mongoPort'])
-    collection = client[dbName][symbol]
-    collection.ensure_index([('datetime', pymongo.ASCENDING)], unique=True)   
-    
-    # 读取数据和插入到数据库
-    reader = csv.reader(file(fileName, 'r'))
-    for d in reader:
-        bar = VtBarData()
-        bar.vtSymbol = symbol
-        bar.symbol = symbol
-        bar.open = float(d[1])
-        bar.high = float(d[2])
-        bar.low = float(d[3])
-        bar.close = float(d[4])
-        bar.date = datetime.strptime(d[0].split(' ')[0], '%Y/%m/%d').strftime('%Y%m%d')
-        bar.time = d[0].split(' ')[1]+":00"
-        bar.datetime = datetime.strptime(bar.date + ' ' + bar.time, '%Y%m%d %H:%M:%S')
-        bar.volume = d[5]
-        bar.openInterest = d[6]
-
-        flt = {'datetime': bar.datetime}
-        collection.update_one(flt, {'$set':bar.__dict__}, upsert=True)  
-        print(bar.date, bar.time)
+    # 读取数据，时间格式为2017/09/28 10:52
+    columns = list(zip(*readCsvRows(fileName))) or [()] * 7
+    stamps = [s.split(' ') for s in columns[0]]
+    
+    dt, date, t = parseDatetime([s[0] for s in stamps], '%Y/%m/%d', [s[1] for s in stamps], '%H:%M')
+    array = buildBarArray(dt, date, t, columns[1], columns[2], columns[3], columns[4], 
+                          columns[5], columns[6])
+    
+    # 插入到数据库
+    count = saveBarArray(array, dbName, symbol, store, chunkSize)
     
     print(u'插入完毕，耗时：%s' % (time()-start))
+    return count
     
  #----------------------------------------------------------------------
-def loadTbPlusCsv(fileName, dbName, symbol):
+def loadTbPlusCsv(fileName, dbName, symbol, store=None, chunkSize=10000):
     """将TB极速版导出的csv格式的历史分钟数据插入到Mongo数据库中"""
     start = time()
     print(u'开始读取CSV文件%s中的数据插入到%s的%s中' %(fileName, dbName, symbol)) 
 
-    # 锁定集合，并创建索引
-    client = pymongo.MongoClient(globalSetting['mongoHost'], globalSetting['mongoPort'])
-    collection = client[dbName][symbol]
-    collection.ensure_index([('datetime', pymongo.ASCENDING)], unique=True)      
-
-    # 读取数据和插入到数据库
-    reader = csv.reader(file(fileName, 'r'))
-    for d in reader:
-        bar = VtBarData()
-        bar.vtSymbol = symbol
-        bar.symbol = symbol
-        bar.open = float(d[2])
-        bar.high = float(d[3])
-        bar.low = float(d[4])
-        bar.close = float(d[5])
-        bar.date = str(d[0])
-        
-        tempstr=str(round(float(d[1])*10000)).split(".")[0].zfill(4)
-        bar.time = tempstr[:2]+":"+tempstr[2:4]+":00"
-        
-        bar.datetime = datetime.strptime(bar.date + ' ' + bar.time, '%Y%m%d %H:%M:%S')
-        bar.volume = d[6]
-        bar.openInterest = d[7]
-        flt = {'datetime': bar.datetime}
-        collection.update_one(flt, {'$set':bar.__dict__}, upsert=True)  
-        print(bar.date, bar.time)    
+    # 读取数据，日期格式为20170928，时间格式为0.1052
+    columns = list(zip(*readCsvRows(fileName))) or [()] * 8
+    timeList = [str(int(round(float(s)*10000))).zfill(4) for s in columns[1]]
+    
+    dt, date, t = parseDatetime(columns[0], '%Y%m%d', timeList, '%H%M')
+    array = buildBarArray(dt, date, t, columns[2], columns[3], columns[4], columns[5], 
+                          columns[6], columns[7])
+    
+    # 插入到数据库
+    count = saveBarArray(array, dbName, symbol, store, chunkSize)
 
     print(u'插入完毕，耗时：%s' % (time()-start))
+    return count
 
 #----------------------------------------------------------------------
 """
@@ -184,43 +281,37 @@ def loadTbPlusCsv(fileName, dbName, symbol):
 
 注意事项：导出csv后手工删除表头和表尾
 """
-def loadTdxCsv(fileName, dbName, symbol):
+def loadTdxCsv(fileName, dbName, symbol, store=None, chunkSize=10000):
     """将通达信导出的csv格式的历史分钟数据插入到Mongo数据库中"""
     start = time()
-    date_correct = ""
     print(u'开始读取CSV文件%s中的数据插入到%s的%s中' %(fileName, dbName, symbol))
     
-    # 锁定集合，并创建索引
-    client = pymongo.MongoClient(globalSetting['mongoHost'], globalSetting['mongoPort'])
-    collection = client[dbName][symbol]
-    collection.ensure_index([('datetime', pymongo.ASCENDING)], unique=True)   
-    
-    # 读取数据和插入到数据库
-    reader = csv.reader(file(fileName, 'r'))
-    for d in reader:
-        bar = VtBarData()
-        bar.vtSymbol = symbol
-        bar.symbol = symbol
-        bar.open = float(d[1])
-        bar.high = float(d[2])
-        bar.low = float(d[3])
-        bar.close = float(d[4])
-        #通达信的夜盘时间按照新的一天计算，此处将其按照当天日期统计，方便后续查阅
-        date_temp,time_temp = d[0].strip(' ').replace('\xef\xbb\xbf','').split('-',1)
-        if time_temp == '15:00':
-            date_correct = date_temp
-        if time_temp[:2] == "21" or time_temp[:2] == "22" or time_temp[:2] == "23":
-            date_temp = date_correct
-            
-        bar.date = datetime.strptime(date_temp, '%Y/%m/%d').strftime('%Y%m%d')
-        bar.time = time_temp[:2]+':'+time_temp[3:5]+':00'
-        bar.datetime = datetime.strptime(bar.date + ' ' + bar.time, '%Y%m%d %H:%M:%S')
-        bar.volume = d[5]
-
-        flt = {'datetime': bar.datetime}
-        collection.update_one(flt, {'$set':bar.__dict__}, upsert=True)  
+    # 读取数据
+    columns = list(zip(*readCsvRows(fileName))) or [()] * 6
+    stamps = [s.strip(' ').replace('\xef\xbb\xbf', '').replace(u'\ufeff', '').split('-', 1) 
+              for s in columns[0]]
+    dateList = np.array([s[0] for s in stamps], dtype=object)
+    timeList = [s[1] for s in stamps]
+    
+    #通达信的夜盘时间按照新的一天计算，此处将其按照当天日期统计，方便后续查阅
+    #夜盘K线的日期改为之前最近一根15:00的K线的日期
+    hourList = np.array([s[:2] for s in timeList])
+    closeArray = np.array(timeList) == '15:00'
+    nightArray = (hourList == '21') | (hourList == '22') | (hourList == '23')
+    
+    closeIndex = np.maximum.accumulate(np.where(closeArray, np.arange(len(timeList)), -1))
+    correct = nightArray & (closeIndex >= 0)
+    dateList[correct] = dateList[closeIndex[correct]]
+    
+    dt, date, t = parseDatetime(dateList.astype(str), '%Y/%m/%d', timeList, '%H:%M')
+    array = buildBarArray(dt, date, t, columns[1], columns[2], columns[3], columns[4], 
+                          columns[5])
+    
+    # 插入到数据库
+    count = saveBarArray(array, dbName, symbol, store, chunkSize)
     
     print(u'插入完毕，耗时：%s' % (time()-start))
+    return count
 
 #----------------------------------------------------------------------
 """
@@ -229,82 +320,66 @@ def loadTdxCsv(fileName, dbName, symbol):
 
 注意事项：
 """   
-def loadTdxLc1(fileName, dbName, symbol):
+# 通达信lc1文件的记录格式，每条32字节
+LC1_DTYPE = np.dtype([
+    ('date', '<i2'),        # (年-2004)*2048 + 月*100 + 日
+    ('minute', '<i2'),      # 当日分钟数
+    ('open', '<f4'),
+    ('high', '<f4'),
+    ('low', '<f4'),
+    ('close', '<f4'),
+    ('amount', '<f4'),
+    ('volume', '<i4'),
+    ('reserve', '<i4')
+])
+
+def loadTdxLc1(fileName, dbName, symbol, store=None, chunkSize=10000):
     """将通达信导出的lc1格式的历史分钟数据插入到Mongo数据库中"""
     start = time()
 
     print(u'开始读取通达信Lc1文件%s中的数据插入到%s的%s中' %(fileName, dbName, symbol))
     
-    # 锁定集合，并创建索引
-    client = pymongo.MongoClient(globalSetting['mongoHost'], globalSetting['mongoPort'])
-    collection = client[dbName][symbol]
-    collection.ensure_index([('datetime', pymongo.ASCENDING)], unique=True)  
-
     #读取二进制文件
-    ofile=open(fileName,'rb')
-    buf=ofile.read()
-    ofile.close()
-    
-    num=len(buf)
-    no=num/32
-    b=0
-    e=32  
-    dl = []
-    for i in xrange(no):
-        a=unpack('hhfffffii',buf[b:e])
-        b=b+32
-        e=e+32
-        bar = VtBarData()
-        bar.vtSymbol = symbol
-        bar.symbol = symbol
-        bar.open = a[2]
-        bar.high = a[3]
-        bar.low = a[4]
-        bar.close = a[5]
-        bar.date = str(int(a[0]/2048)+2004)+str(int(a[0]%2048/100)).zfill(2)+str(a[0]%2048%100).zfill(2)
-        bar.time = str(int(a[1]/60)).zfill(2)+':'+str(a[1]%60).zfill(2)+':00'
-        bar.datetime = datetime.strptime(bar.date + ' ' + bar.time, '%Y%m%d %H:%M:%S')
-        bar.volume = a[7]
-
-        flt = {'datetime': bar.datetime}
-        collection.update_one(flt, {'$set':bar.__dict__}, upsert=True)
+    with open(fileName, 'rb') as f:
+        buf = f.read()
+    
+    data = np.frombuffer(buf, dtype=LC1_DTYPE, count=len(buf)//LC1_DTYPE.itemsize)
+    
+    d = data['date'].astype(int)
+    dateList = (d//2048 + 2004) * 10000 + (d%2048//100) * 100 + d%2048%100
+    minute = data['minute'].astype(int)
+    timeList = (minute//60) * 100 + minute%60
+    
+    dt, date, t = parseDatetime(dateList.astype(str), '%Y%m%d', 
+                                np.char.zfill(timeList.astype(str), 4), '%H%M')
+    array = buildBarArray(dt, date, t, data['open'], data['high'], data['low'], data['close'], 
+                          data['volume'])
+    
+    # 插入到数据库
+    count = saveBarArray(array, dbName, symbol, store, chunkSize)
     
     print(u'插入完毕，耗时：%s' % (time()-start))
+    return count
 
 #----------------------------------------------------------------------
-def loadOKEXCsv(fileName, dbName, symbol):
+def loadOKEXCsv(fileName, dbName, symbol, store=None, chunkSize=10000):
     """将OKEX导出的csv格式的历史分钟数据插入到Mongo数据库中"""
     start = time()
     print(u'开始读取CSV文件%s中的数据插入到%s的%s中' %(fileName, dbName, symbol))
 
-    # 锁定集合，并创建索引
-    client = pymongo.MongoClient(globalSetting['mongoHost'], globalSetting['mongoPort'])
-    collection = client[dbName][symbol]
-    collection.ensure_index([('datetime', pymongo.ASCENDING)], unique=True)
-
-    # 读取数据和插入到数据库
-    reader = csv.reader(open(fileName,"r"))
-    for d in reader:
-        if len(d[1]) > 10:
-            bar = VtBarData()
-            bar.vtSymbol = symbol
-            bar.symbol = symbol
-
-            bar.datetime = datetime.strptime(d[1], '%Y-%m-%d %H:%M:%S')
-            bar.date = bar.datetime.date().strftime('%Y%m%d')
-            bar.time = bar.datetime.time().strftime('%H:%M:%S')
-
-            bar.open = float(d[2])
-            bar.high = float(d[3])
-            bar.low = float(d[4])
-            bar.close = float(d[5])
-
-            bar.volume = float(d[6])
-            bar.tobtcvolume = float(d[7])
-
-            flt = {'datetime': bar.datetime}
-            collection.update_one(flt, {'$set':bar.__dict__}, upsert=True)
-            print('%s \t %s' % (bar.date, bar.time))
+    # 读取数据，忽略时间格式不正确的行（如表头）
+    rows = [d for d in readCsvRows(fileName) if len(d[1]) > 10]
+    columns = list(zip(*rows)) or [()] * 8
+    stamps = [s.split(' ') for s in columns[1]]
+    
+    dt, date, t = parseDatetime([s[0] for s in stamps], '%Y-%m-%d', [s[1] for s in stamps], '%H:%M:%S')
+    array = buildBarArray(dt, date, t, columns[2], columns[3], columns[4], columns[5], 
+                          columns[6])
+    
+    # 插入到数据库
+    extraDict = {'tobtcvolume': np.asarray(columns[7], dtype=float)}
+    count = saveBarArray(array, dbName, symbol, store, chunkSize, extraDict)
 
     print(u'插入完毕，耗时：%s' % (time()-start))
+    return count
     
@@ -0,0 +1,260 @@
+# encoding: UTF-8
+
+'''
+本文件中包含了CTA回测参数优化用的自适应搜索算法：
+1. 遗传算法
+2. 基于高斯过程代理模型的搜索
+
+搜索器采用ask/tell接口：ask返回下一批需要回测的参数组合，回测完成后
+通过tell传回对应的优化目标值，由BacktestingEngine负责用进程池并行回测。
+参数的取值范围和OptimizationSetting.addParameter设置的网格一致。
+'''
+from __future__ import division
+
+import random
+from functools import reduce
+
+import numpy as np
+
+
+########################################################################
+class SearchBase(object):
+    """自适应搜索基类，负责参数网格和索引之间的转换"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, paramDict, seed=None):
+        """Constructor"""
+        self.nameList = list(paramDict.keys())
+        self.valueList = [list(v) for v in paramDict.values()]
+        self.sizeList = [len(v) for v in self.valueList]
+        self.totalCount = reduce(lambda x, y: x*y, self.sizeList, 1)    # 网格中的组合总数
+
+        self.rng = random.Random(seed)
+        self.fitnessDict = {}       # key为参数索引元组，value为优化目标值
+
+    #----------------------------------------------------------------------
+    def toSetting(self, index):
+        """参数索引元组转换为参数字典"""
+        return dict(zip(self.nameList, [values[i] for values, i in zip(self.valueList, index)]))
+
+    #----------------------------------------------------------------------
+    def randomIndex(self):
+        """随机生成参数索引元组"""
+        return tuple([self.rng.randrange(n) for n in self.sizeList])
+
+    #----------------------------------------------------------------------
+    def randomIndexList(self, count, exclude=None):
+        """随机生成不重复的参数索引元组列表"""
+        count = min(count, self.totalCount)
+        if exclude is None:
+            exclude = self.fitnessDict
+
+        indexSet = set()
+        maxTry = count * 20
+        while len(indexSet) < count and maxTry:
+            index = self.randomIndex()
+            if index not in exclude:
+                indexSet.add(index)
+            maxTry -= 1
+
+        return list(indexSet)
+
+    #----------------------------------------------------------------------
+    def tell(self, settingList, targetList):
+        """传入回测结果，运行出错的参数组合目标值为None，按最差值处理"""
+        valid = [t for t in targetList if t is not None]
+        worst = min(valid + list(self.fitnessDict.values()) + [0])
+
+        for setting, target in zip(settingList, targetList):
+            index = tuple([values.index(setting[name])
+                           for name, values in zip(self.nameList, self.valueList)])
+            if target is None:
+                target = worst
+            self.fitnessDict[index] = target
+
+
+########################################################################
+class GeneticSearch(SearchBase):
+    """
+    遗传算法搜索
+    个体为参数索引元组，使用锦标赛选择、均匀交叉，变异时以较大概率
+    移动到相邻网格，否则随机重置，每代保留最优的若干个体
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, paramDict, populationSize=50, generations=20,
+                 crossoverRate=0.9, mutationRate=0.2, eliteSize=2,
+                 tournamentSize=3, seed=None):
+        """Constructor"""
+        super(GeneticSearch, self).__init__(paramDict, seed)
+
+        self.populationSize = populationSize    # 种群大小
+        self.generations = generations          # 迭代代数
+        self.crossoverRate = crossoverRate      # 交叉概率
+        self.mutationRate = mutationRate        # 每个参数的变异概率
+        self.eliteSize = eliteSize              # 直接保留到下一代的最优个体数量
+        self.tournamentSize = tournamentSize    # 锦标赛选择的参赛个体数量
+
+        self.generation = 0                     # 当前代数
+        self.population = []                    # 当前种群
+
+    #----------------------------------------------------------------------
+    def ask(self):
+        """
+        返回下一代中尚未回测过的参数组合，迭代结束时返回空列表
+        种群收敛后新一代可能全部是已回测过的个体，此时直接继续繁殖下一代，
+        只有达到迭代代数时才返回空列表
+        """
+        while self.generation < self.generations:
+            if not self.population:
+                self.population = self.randomIndexList(self.populationSize)
+            else:
+                self.population = self.breed()
+
+            self.generation += 1
+
+            newList = list(set([index for index in self.population
+                                if index not in self.fitnessDict]))
+            if newList:
+                return [self.toSetting(index) for index in newList]
+
+        return []
+
+    #----------------------------------------------------------------------
+    def breed(self):
+        """基于当前种群繁殖下一代"""
+        ranked = sorted(self.population, key=lambda index: self.fitnessDict[index],
+                        reverse=True)
+        population = ranked[:self.eliteSize]
+
+        while len(population) < self.populationSize:
+            parent1 = self.select()
+            parent2 = self.select()
+
+            if self.rng.random() < self.crossoverRate:
+                child = tuple([self.rng.choice(genes) for genes in zip(parent1, parent2)])
+            else:
+                child = parent1
+
+            population.append(self.mutate(child))
+
+        return population
+
+    #----------------------------------------------------------------------
+    def select(self):
+        """锦标赛选择"""
+        candidates = [self.rng.choice(self.population) for i in range(self.tournamentSize)]
+        return max(candidates, key=lambda index: self.fitnessDict[index])
+
+    #----------------------------------------------------------------------
+    def mutate(self, index):
+        """变异"""
+        index = list(index)
+
+        for i, n in enumerate(self.sizeList):
+            if n <= 1 or self.rng.random() >= self.mutationRate:
+                continue
+
+            if self.rng.random() < 0.7:
+                index[i] = min(max(index[i] + self.rng.choice([-1, 1]), 0), n-1)
+            else:
+                index[i] = self.rng.randrange(n)
+
+        return tuple(index)
+
+
+########################################################################
+class SurrogateSearch(SearchBase):
+    """
+    代理模型搜索
+    将参数索引归一化到[0, 1]，用RBF核的高斯过程拟合已回测的结果，
+    按UCB（均值+kappa倍标准差）在候选组合中选择下一批参数，
+    同一批中已选中的组合以预测均值作为临时观测值（Kriging Believer），避免扎堆
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, paramDict, initPoints=20, iterations=10, batchSize=8,
+                 kappa=2.0, lengthScale=0.2, noise=1e-4, candidateSize=5000, seed=None):
+        """Constructor"""
+        super(SurrogateSearch, self).__init__(paramDict, seed)
+
+        self.initPoints = initPoints            # 初始随机采样数量
+        self.iterations = iterations            # 代理模型迭代次数
+        self.batchSize = batchSize              # 每次迭代回测的组合数量，通常等于进程数
+        self.kappa = kappa                      # 探索系数
+        self.lengthScale = lengthScale          # RBF核长度
+        self.noise = noise                      # 观测噪声
+        self.candidateSize = candidateSize      # 每次迭代评估的候选组合数量
+
+        self.iteration = 0
+        self.scaleArray = np.array([max(n-1, 1) for n in self.sizeList], dtype=float)
+
+    #----------------------------------------------------------------------
+    def ask(self):
+        """返回下一批参数组合，迭代结束时返回空列表"""
+        if not self.fitnessDict:
+            indexList = self.randomIndexList(self.initPoints)
+        elif self.iteration >= self.iterations:
+            return []
+        else:
+            self.iteration += 1
+            indexList = self.propose()
+
+        return [self.toSetting(index) for index in indexList]
+
+    #----------------------------------------------------------------------
+    def kernel(self, a, b):
+        """RBF核矩阵"""
+        d2 = ((a[:, None, :] - b[None, :, :]) ** 2).sum(axis=2)
+        return np.exp(-0.5 * d2 / self.lengthScale ** 2)
+
+    #----------------------------------------------------------------------
+    def getCandidates(self):
+        """生成尚未回测的候选组合，网格较小时使用全部网格"""
+        if self.totalCount <= self.candidateSize:
+            grids = np.indices(self.sizeList).reshape(len(self.sizeList), -1).T
+            candidates = [tuple(index) for index in grids.tolist()]
+            return [index for index in candidates if index not in self.fitnessDict]
+
+        return self.randomIndexList(self.candidateSize)
+
+    #----------------------------------------------------------------------
+    def propose(self):
+        """基于高斯过程选择下一批参数组合"""
+        candidates = self.getCandidates()
+        if not candidates:
+            return []
+
+        indexList = list(self.fitnessDict.keys())
+        x = np.array(indexList, dtype=float) / self.scaleArray
+        y = np.array([self.fitnessDict[index] for index in indexList], dtype=float)
+
+        # 目标值标准化
+        mean = y.mean()
+        std = y.std() or 1
+        y = (y - mean) / std
+
+        c = np.array(candidates, dtype=float) / self.scaleArray
+
+        result = []
+        for i in range(min(self.batchSize, len(candidates))):
+            k = self.kernel(x, x) + self.noise * np.eye(len(x))
+            l = np.linalg.cholesky(k)
+            alpha = np.linalg.solve(l.T, np.linalg.solve(l, y))
+
+            ks = self.kernel(x, c)
+            mu = ks.T.dot(alpha)
+            v = np.linalg.solve(l, ks)
+            sigma = np.sqrt(np.maximum(1 - (v ** 2).sum(axis=0), 0))
+
+            ucb = mu + self.kappa * sigma
+            for n in result:
+                ucb[n] = -np.inf
+            n = int(ucb.argmax())
+            result.append(n)
+
+            # 以预测均值作为临时观测值
+            x = np.vstack([x, c[n]])
+            y = np.append(y, mu[n])
+
+        return [candidates[n] for n in result]
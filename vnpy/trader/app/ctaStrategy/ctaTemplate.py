@@ -5,7 +5,7 @@
 '''
 
 from vnpy.trader.vtConstant import *
-from vnpy.trader.vtUtility import BarGenerator, ArrayManager
+from vnpy.trader.vtUtility import BarGenerator, ArrayManager, RingArrayManager
 
 from .ctaBase import *
 
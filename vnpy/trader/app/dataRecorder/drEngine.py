@@ -11,19 +11,21 @@ import csv
 import os
 import copy
 import traceback
-from collections import OrderedDict
+from collections import OrderedDict, defaultdict
 from datetime import datetime, timedelta, time
-from queue import Queue, Empty
+from queue import Queue, Empty, Full
 from threading import Thread
-from pymongo.errors import DuplicateKeyError
+from time import time as currentTime
+from pymongo.errors import BulkWriteError
 
 from vnpy.event import Event
 from vnpy.trader.vtEvent import *
-from vnpy.trader.vtFunction import todayDate, getJsonPath
+from vnpy.trader.vtFunction import todayDate, getJsonPath, parseTickDatetime
 from vnpy.trader.vtObject import VtSubscribeReq, VtLogData, VtBarData, VtTickData
 from vnpy.trader.vtUtility import BarGenerator
 
 from .drBase import *
+from .drJournal import DrJournal
 from .language import text
 
 
@@ -55,9 +57,34 @@ class DrEngine(object):
         # 配置字典
         self.settingDict = OrderedDict()
         
+        # 批量写入相关，可在配置文件中修改
+        self.batchSize = 500                    # 单个集合缓存达到该数量时写入
+        self.flushInterval = 1                  # 距离上次写入超过该秒数时写入所有缓存
+        self.maxQueueSize = 100000              # 队列长度上限，超过后阻塞插入请求
+        self.putTimeout = 0.1                   # 队列满时插入请求的最长阻塞秒数，超时则丢弃
+        
+        # 写入统计
+        self.bufferDict = defaultdict(list)     # 待写入数据缓存，key为(dbName, collectionName)
+        self.bufferCount = 0                    # 缓存中的数据数量
+        self.insertCount = 0                    # 已写入的数据数量
+        self.failCount = 0                      # 写入数据库失败的数据数量
+        self.flushCount = 0                     # 批量写入次数
+        self.dropCount = 0                      # 因队列满而丢弃的数据数量
+        self.lastFlushTime = currentTime()      # 上次写入时间
+        self.lastFlushCost = 0                  # 上次写入耗时
+        self.lastDropCount = 0                  # 上次输出积压日志时的丢弃数量
+        self.lastFailCount = 0                  # 上次输出积压日志时的失败数量
+        
+        # 本地日志，在配置文件中启用
+        self.journal = None
+        
+        # 记录日志限流，同一合约的Tick记录日志最少间隔logInterval秒，为0则每个Tick都输出
+        self.logInterval = 1
+        self.logTimeDict = {}                   # vtSymbol:上次输出Tick记录日志的时间
+        
         # 负责执行数据库插入的单独线程相关
         self.active = False                     # 工作状态
-        self.queue = Queue()                    # 队列
+        self.queue = None                       # 队列，在载入配置后创建
         self.thread = Thread(target=self.run)   # 线程
         
         # 收盘相关
@@ -67,6 +94,7 @@ class DrEngine(object):
         
         # 载入设置，订阅行情
         self.loadSetting()
+        self.queue = Queue(self.maxQueueSize)
         
         # 启动数据插入线程
         self.start()
@@ -85,6 +113,18 @@ class DrEngine(object):
             if not working:
                 return
             
+            # 加载批量写入配置
+            self.batchSize = drSetting.get('batchSize', self.batchSize)
+            self.flushInterval = drSetting.get('flushInterval', self.flushInterval)
+            self.maxQueueSize = drSetting.get('maxQueueSize', self.maxQueueSize)
+            self.putTimeout = drSetting.get('putTimeout', self.putTimeout)
+            self.logInterval = drSetting.get('logInterval', self.logInterval)
+            
+            # 加载本地日志配置
+            if drSetting.get('journal', False):
+                self.journal = DrJournal(drSetting.get('journalPath', ''),
+                                         drSetting.get('journalFsync', 1))
+            
             # 加载收盘时间
             if 'marketCloseTime' in drSetting:
                 timestamp = drSetting['marketCloseTime']
@@ -185,10 +225,7 @@ class DrEngine(object):
         
         # 生成datetime对象
         if not tick.datetime:
-            if '.' in tick.time:
-                tick.datetime = datetime.strptime(' '.join([tick.date, tick.time]), '%Y%m%d %H:%M:%S.%f')
-            else:
-                tick.datetime = datetime.strptime(' '.join([tick.date, tick.time]), '%Y%m%d %H:%M:%S')
+            tick.datetime = parseTickDatetime(tick.date, tick.time)
 
         self.onTick(tick)
         
@@ -199,16 +236,25 @@ class DrEngine(object):
     #----------------------------------------------------------------------
     def processTimerEvent(self, event):
         """处理定时事件"""
-        # 如果没有设置收盘时间，则无需处理
-        if not self.marketCloseTime:
-            return
-        
         # 10秒检查一次
         self.timerCount += 1
         if self.timerCount < 10:
             return
         self.timerCount = 0
         
+        # 写入积压超过队列上限的一半，或者上次检查后有新的丢弃、失败数据时输出日志
+        dropCount = self.dropCount
+        failCount = self.failCount
+        if (self.queue.qsize() > self.maxQueueSize / 2 or 
+            dropCount > self.lastDropCount or failCount > self.lastFailCount):
+            self.writeDrLog(u'数据写入积压：%s' %self.getBacklog())
+        self.lastDropCount = dropCount
+        self.lastFailCount = failCount
+        
+        # 如果没有设置收盘时间，则无需处理
+        if not self.marketCloseTime:
+            return
+        
         # 获取当前时间
         currentTime = datetime.now().time()
         
@@ -232,29 +278,33 @@ class DrEngine(object):
         vtSymbol = tick.vtSymbol
         
         if vtSymbol in self.tickSymbolSet:
-            self.insertData(TICK_DB_NAME, vtSymbol, tick)
-            
+            # 主力合约和具体合约的数据合并为一次插入请求
             if vtSymbol in self.activeSymbolDict:
                 activeSymbol = self.activeSymbolDict[vtSymbol]
-                self.insertData(TICK_DB_NAME, activeSymbol, tick)
-            
+                self.insertData(TICK_DB_NAME, (vtSymbol, activeSymbol), tick)
+            else:
+                self.insertData(TICK_DB_NAME, vtSymbol, tick)
             
-            self.writeDrLog(text.TICK_LOGGING_MESSAGE.format(symbol=tick.vtSymbol,
-                                                             time=tick.time, 
-                                                             last=tick.lastPrice, 
-                                                             bid=tick.bidPrice1, 
-                                                             ask=tick.askPrice1))
+            # 高频Tick只按间隔输出记录日志
+            now = currentTime()
+            if now - self.logTimeDict.get(vtSymbol, 0) >= self.logInterval:
+                self.logTimeDict[vtSymbol] = now
+                self.writeDrLog(text.TICK_LOGGING_MESSAGE.format(symbol=tick.vtSymbol,
+                                                                 time=tick.time, 
+                                                                 last=tick.lastPrice, 
+                                                                 bid=tick.bidPrice1, 
+                                                                 ask=tick.askPrice1))
     
     #----------------------------------------------------------------------
     def onBar(self, bar):
         """分钟线更新"""
         vtSymbol = bar.vtSymbol
         
-        self.insertData(MINUTE_DB_NAME, vtSymbol, bar)
-        
         if vtSymbol in self.activeSymbolDict:
             activeSymbol = self.activeSymbolDict[vtSymbol]
-            self.insertData(MINUTE_DB_NAME, activeSymbol, bar)                    
+            self.insertData(MINUTE_DB_NAME, (vtSymbol, activeSymbol), bar)
+        else:
+            self.insertData(MINUTE_DB_NAME, vtSymbol, bar)
         
         self.writeDrLog(text.BAR_LOGGING_MESSAGE.format(symbol=bar.vtSymbol, 
                                                         time=bar.time, 
@@ -271,29 +321,116 @@ class DrEngine(object):
  
     #----------------------------------------------------------------------
     def insertData(self, dbName, collectionName, data):
-        """插入数据到数据库（这里的data可以是VtTickData或者VtBarData）"""
-        self.queue.put((dbName, collectionName, data.__dict__))
+        """
+        插入数据到数据库（这里的data可以是VtTickData或者VtBarData）
+        collectionName可以是集合名的元组，表示同一数据写入多个集合
+        队列已满时阻塞等待（背压），超时后丢弃该数据
+        启用本地日志时先写入日志，丢弃或写入数据库失败的数据可以通过回放日志恢复
+        """
+        if self.journal:
+            self.journal.write(dbName, collectionName, data.__dict__)
+        
+        try:
+            self.queue.put((dbName, collectionName, data.__dict__), timeout=self.putTimeout)
+        except Full:
+            self.dropCount += 1
         
     #----------------------------------------------------------------------
     def run(self):
         """运行插入线程"""
         while self.active:
             try:
-                dbName, collectionName, d = self.queue.get(block=True, timeout=1)
+                dbName, collectionName, d = self.queue.get(block=True, timeout=self.flushInterval)
                 
                 # 这里采用MongoDB的update模式更新数据，在记录tick数据时会由于查询
                 # 过于频繁，导致CPU占用和硬盘读写过高后系统卡死，因此不建议使用
                 #flt = {'datetime': d['datetime']}
                 #self.mainEngine.dbUpdate(dbName, collectionName, d, flt, True)
                 
-                # 使用insert模式更新数据，可能存在时间戳重复的情况，需要用户自行清洗
-                try:
-                    self.mainEngine.dbInsert(dbName, collectionName, d)
-                except DuplicateKeyError:
-                    self.writeDrLog(u'键值重复插入失败，报错信息：%s' %traceback.format_exc())
+                # 使用insert模式批量写入数据，可能存在时间戳重复的情况，需要用户自行清洗
+                if isinstance(collectionName, tuple):
+                    for name in collectionName:
+                        self.bufferData(dbName, name, d)
+                else:
+                    self.bufferData(dbName, collectionName, d)
             except Empty:
                 pass
             
+            # 超过时间间隔则写入所有缓存
+            if currentTime() - self.lastFlushTime >= self.flushInterval:
+                self.flushAll()
+        
+        # 退出前写入队列和缓存中剩余的数据
+        while True:
+            try:
+                dbName, collectionName, d = self.queue.get(block=False)
+            except Empty:
+                break
+            
+            if isinstance(collectionName, tuple):
+                for name in collectionName:
+                    self.bufferData(dbName, name, d)
+            else:
+                self.bufferData(dbName, collectionName, d)
+        
+        self.flushAll()
+    
+    #----------------------------------------------------------------------
+    def bufferData(self, dbName, collectionName, d):
+        """缓存待写入的数据，缓存数量达到批量大小时写入"""
+        # 同一数据写入多个集合时，插入后会被添加_id字段，因此需要复制
+        buf = self.bufferDict[(dbName, collectionName)]
+        buf.append(d.copy())
+        self.bufferCount += 1
+        
+        if len(buf) >= self.batchSize:
+            self.flush(dbName, collectionName)
+    
+    #----------------------------------------------------------------------
+    def flush(self, dbName, collectionName):
+        """批量写入某个集合的缓存数据"""
+        buf = self.bufferDict.pop((dbName, collectionName), None)
+        if not buf:
+            return
+        
+        start = currentTime()
+        
+        # 只统计实际写入成功的数量，其余计入失败数量
+        count = 0
+        try:
+            count = self.mainEngine.dbInsertMany(dbName, collectionName, buf, ordered=False) or 0
+        except BulkWriteError as e:
+            count = e.details.get('nInserted', 0)
+            self.writeDrLog(u'批量插入部分失败，报错信息：%s' %e.details.get('writeErrors', [])[:1])
+        except Exception:
+            self.writeDrLog(u'批量插入失败，报错信息：%s' %traceback.format_exc())
+        
+        self.bufferCount -= len(buf)
+        self.insertCount += count
+        self.failCount += len(buf) - count
+        self.flushCount += 1
+        self.lastFlushCost = currentTime() - start
+    
+    #----------------------------------------------------------------------
+    def flushAll(self):
+        """写入所有缓存数据"""
+        for dbName, collectionName in list(self.bufferDict.keys()):
+            self.flush(dbName, collectionName)
+        self.lastFlushTime = currentTime()
+    
+    #----------------------------------------------------------------------
+    def getBacklog(self):
+        """获取写入积压情况"""
+        return {
+            'queueSize': self.queue.qsize(),
+            'bufferCount': self.bufferCount,
+            'insertCount': self.insertCount,
+            'failCount': self.failCount,
+            'flushCount': self.flushCount,
+            'dropCount': self.dropCount,
+            'lastFlushCost': self.lastFlushCost
+        }
+            
     #----------------------------------------------------------------------
     def start(self):
         """启动"""
@@ -307,6 +444,9 @@ class DrEngine(object):
             self.active = False
             self.thread.join()
         
+        if self.journal:
+            self.journal.close()
+        
     #----------------------------------------------------------------------
     def writeDrLog(self, content):
         """快速发出日志事件"""
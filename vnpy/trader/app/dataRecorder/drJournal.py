@@ -0,0 +1,288 @@
+# encoding: UTF-8
+
+'''
+本文件中实现了行情记录的本地预写日志（Journal），以及将日志回放到数据库的工具。
+
+DrEngine在数据进入插入队列之前先顺序追加写入日志文件，即使程序崩溃或者
+MongoDB在交易时段不可用，也可以在事后通过回放日志补全数据。
+
+日志文件按自然日分段，文件名为YYYYMMDD.jnl，每条记录的格式为：
+    4字节数据长度 + 4字节CRC32校验 + pickle序列化的(dbName, collectionName, d)
+读取时遇到不完整或校验失败的记录（如崩溃时写入一半）则停止读取该文件。
+'''
+
+from __future__ import print_function
+
+import os
+import struct
+import zlib
+from collections import defaultdict
+from datetime import datetime
+from threading import Thread, Lock, Event
+from time import time as currentTime
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from vnpy.trader.vtFunction import getTempPath
+
+
+# 记录头：数据长度、CRC32校验
+HEADER = struct.Struct('<II')
+
+# pickle协议版本，使用2以兼容Python 2
+PICKLE_PROTOCOL = 2
+
+# 日志文件后缀
+JOURNAL_SUFFIX = '.jnl'
+
+
+########################################################################
+class DrJournal(object):
+    """
+    行情记录日志
+    fsyncInterval大于0时每隔该秒数将数据同步到磁盘，等于0时每条记录都同步，
+    小于0时只写入操作系统缓存，由操作系统决定何时落盘
+    
+    定时同步在日志自身的同步线程中执行，调用write的事件处理线程只负责写入文件缓存，
+    不会因为os.fsync的磁盘IO而阻塞。fsyncInterval等于0时为了保证每条记录都落盘，
+    仍然在write中同步
+    """
+    
+    # fsyncInterval小于0时同步线程只将文件缓存写入操作系统，使用的间隔秒数
+    flushInterval = 1
+
+    #----------------------------------------------------------------------
+    def __init__(self, path='', fsyncInterval=1):
+        """Constructor"""
+        if not path:
+            path = getTempPath('drJournal')
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+        self.path = path
+        self.fsyncInterval = fsyncInterval
+
+        self.f = None               # 当前分段文件
+        self.segmentDate = ''       # 当前分段日期
+        self.lastSyncTime = 0       # 上次同步时间
+        self.dirty = False          # 是否有尚未同步的数据
+        self.writeCount = 0         # 已写入的记录数量
+        
+        self.lock = Lock()          # 保护文件对象的锁，写入和同步在不同线程中执行
+        
+        # 同步线程
+        self.stopEvent = Event()
+        self.thread = None
+        if fsyncInterval != 0:
+            self.thread = Thread(target=self.run)
+            self.thread.daemon = True
+            self.thread.start()
+
+    #----------------------------------------------------------------------
+    def getFilePath(self, date):
+        """获取某日的分段文件路径"""
+        return os.path.join(self.path, date + JOURNAL_SUFFIX)
+
+    #----------------------------------------------------------------------
+    def rotate(self, date):
+        """切换到新的分段文件"""
+        self.closeFile()
+
+        self.f = open(self.getFilePath(date), 'ab')
+        self.segmentDate = date
+
+    #----------------------------------------------------------------------
+    def write(self, dbName, collectionName, d):
+        """追加写入一条记录"""
+        payload = pickle.dumps((dbName, collectionName, d), PICKLE_PROTOCOL)
+        date = datetime.now().strftime('%Y%m%d')
+        
+        with self.lock:
+            if date != self.segmentDate:
+                self.rotate(date)
+            
+            self.f.write(HEADER.pack(len(payload), zlib.crc32(payload) & 0xffffffff))
+            self.f.write(payload)
+
+            self.writeCount += 1
+            self.dirty = True
+
+            if self.fsyncInterval == 0:
+                self.f.flush()
+                os.fsync(self.f.fileno())
+                self.dirty = False
+                self.lastSyncTime = currentTime()
+
+    #----------------------------------------------------------------------
+    def run(self):
+        """同步线程的运行函数"""
+        if self.fsyncInterval > 0:
+            interval = self.fsyncInterval
+        else:
+            interval = self.flushInterval
+        
+        while not self.stopEvent.wait(interval):
+            self.sync()
+
+    #----------------------------------------------------------------------
+    def sync(self):
+        """将缓存数据写入磁盘"""
+        with self.lock:
+            if not self.f or not self.dirty:
+                return
+
+            self.f.flush()
+            self.dirty = False
+            
+            if self.fsyncInterval < 0:
+                return
+            
+            # 复制文件描述符后在锁外同步，同步期间不阻塞写入，分段切换也不会关闭正在同步的描述符
+            fd = os.dup(self.f.fileno())
+        
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        
+        self.lastSyncTime = currentTime()
+
+    #----------------------------------------------------------------------
+    def closeFile(self):
+        """关闭当前分段文件，调用时需要持有锁"""
+        if self.f:
+            self.f.flush()
+            os.fsync(self.f.fileno())
+            self.f.close()
+
+        self.f = None
+        self.segmentDate = ''
+        self.dirty = False
+
+    #----------------------------------------------------------------------
+    def close(self):
+        """停止同步线程并关闭当前分段文件"""
+        if self.thread:
+            self.stopEvent.set()
+            self.thread.join()
+            self.thread = None
+        
+        with self.lock:
+            self.closeFile()
+
+
+#----------------------------------------------------------------------
+def readJournal(fileName):
+    """
+    读取日志文件的生成器，返回(dbName, collectionName, d)
+    写入时collectionName为元组（主力合约）的记录会展开为多条
+    """
+    with open(fileName, 'rb') as f:
+        while True:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size:
+                break
+
+            length, crc = HEADER.unpack(header)
+            payload = f.read(length)
+
+            if len(payload) < length or (zlib.crc32(payload) & 0xffffffff) != crc:
+                print(u'%s 存在不完整的记录，停止读取' % fileName)
+                break
+
+            dbName, collectionName, d = pickle.loads(payload)
+            if isinstance(collectionName, tuple):
+                for name in collectionName:
+                    yield dbName, name, d
+            else:
+                yield dbName, collectionName, d
+
+
+#----------------------------------------------------------------------
+def listJournal(path='', startDate='', endDate=''):
+    """获取日期区间内的日志文件列表，日期格式为YYYYMMDD"""
+    if not path:
+        path = getTempPath('drJournal')
+    if not os.path.exists(path):
+        return []
+
+    l = []
+    for name in sorted(os.listdir(path)):
+        if not name.endswith(JOURNAL_SUFFIX):
+            continue
+
+        date = name[:-len(JOURNAL_SUFFIX)]
+        if startDate and date < startDate:
+            continue
+        if endDate and date > endDate:
+            continue
+
+        l.append(os.path.join(path, name))
+
+    return l
+
+
+#----------------------------------------------------------------------
+def replayToMongo(dbClient, fileList, chunkSize=5000):
+    """
+    将日志回放到MongoDB
+    以完整的记录作为查询条件进行upsert，只有所有字段都相同的记录才视为重复：
+    重复回放或者和已插入的数据重叠时不会产生重复数据，同时保留时间戳相同的不同Tick
+    """
+    from pymongo import ReplaceOne
+
+    count = 0
+    requestDict = defaultdict(list)
+
+    def flush(key):
+        dbName, collectionName = key
+        dbClient[dbName][collectionName].bulk_write(requestDict.pop(key), ordered=False)
+
+    for fileName in fileList:
+        for dbName, collectionName, d in readJournal(fileName):
+            key = (dbName, collectionName)
+            requestDict[key].append(ReplaceOne(d, d, upsert=True))
+            count += 1
+
+            if len(requestDict[key]) >= chunkSize:
+                flush(key)
+
+        print(u'%s 回放完成，累计记录数：%s' % (fileName, count))
+
+    for key in list(requestDict.keys()):
+        flush(key)
+
+    return count
+
+
+#----------------------------------------------------------------------
+def replayToStore(store, fileList):
+    """
+    将日志回放到列式存储（ColumnarStore）
+    列式存储写入时按datetime去重，可以重复回放
+    """
+    from vnpy.trader.vtDataStore import DATA_TICK, DATA_BAR
+
+    count = 0
+    dataDict = defaultdict(list)
+
+    for fileName in fileList:
+        for dbName, collectionName, d in readJournal(fileName):
+            dataDict[(dbName, collectionName)].append(d)
+            count += 1
+
+        # 按文件写入，避免占用过多内存
+        for (dbName, collectionName), dList in dataDict.items():
+            if 'lastPrice' in dList[0]:
+                dataType = DATA_TICK
+            else:
+                dataType = DATA_BAR
+            store.writeData(dbName, collectionName, dList, dataType)
+        dataDict.clear()
+
+        print(u'%s 回放完成，累计记录数：%s' % (fileName, count))
+
+    return count
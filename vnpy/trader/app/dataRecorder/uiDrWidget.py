@@ -83,6 +83,7 @@ class DrEngineManager(QtWidgets.QWidget):
         self.logMonitor = QtWidgets.QTextEdit()
         self.logMonitor.setReadOnly(True)
         self.logMonitor.setMinimumHeight(600)
+        self.logMonitor.document().setMaximumBlockCount(10000)     # 只保留最近的日志
         
         # 设置布局
         grid = QtWidgets.QGridLayout()
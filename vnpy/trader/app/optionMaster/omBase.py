@@ -5,9 +5,13 @@ from __future__ import division
 from copy import copy
 from collections import OrderedDict
 from math import log1p
+from time import time
+
+import numpy as np
 
 from vnpy.trader.vtConstant import *
 from vnpy.trader.vtObject import VtTickData
+from vnpy.pricing.impv import IMPV_NONE
 
 from .omDate import getTimeToMaturity
 
@@ -139,10 +143,11 @@ class OmUnderlying(OmInstrument):
         super(OmUnderlying, self).newTick(tick)
         
         self.theoDelta = self.size * self.midPrice / 100
+        self.calculatePosGreeks()
         
-        # 遍历推送自己的行情到期权链中
+        # 标记以自己为标的的期权链需要重新定价，由持仓组合统一计算
         for chain in self.chainDict.values():
-            chain.newUnderlyingTick()
+            chain.dirty = True
 
     #----------------------------------------------------------------------
     def newTrade(self, trade):
@@ -182,8 +187,15 @@ class OmOption(OmInstrument):
         self.bidImpv = EMPTY_FLOAT
         self.askImpv = EMPTY_FLOAT
         self.midImpv = EMPTY_FLOAT
+        
+        self.askImpvStatus = IMPV_NONE  # 隐含波动率求解状态，只在批量计算时更新
+        self.bidImpvStatus = IMPV_NONE
+        self.midImpvStatus = IMPV_NONE
+        
+        self.impvDirty = False          # 行情已更新但隐含波动率尚未计算
     
         # 定价公式
+        self.model = model
         self.calculatePrice = model.calculatePrice
         self.calculateGreeks = model.calculateGreeks
         self.calculateImpv = model.calculateImpv
@@ -209,6 +221,8 @@ class OmOption(OmInstrument):
     #----------------------------------------------------------------------
     def calculateOptionImpv(self):
         """计算隐含波动率"""
+        self.impvDirty = False
+        
         underlyingPrice = self.underlying.midPrice
         if not underlyingPrice or not self.t:
             return        
@@ -254,9 +268,9 @@ class OmOption(OmInstrument):
     
     #----------------------------------------------------------------------
     def newTick(self, tick):
-        """行情更新"""
+        """行情更新，隐含波动率由期权链统一计算"""
         super(OmOption, self).newTick(tick)
-        self.calculateOptionImpv()
+        self.impvDirty = True
     
     #----------------------------------------------------------------------
     def newUnderlyingTick(self):
@@ -306,6 +320,20 @@ class OmChain(object):
             self.putDict[option.symbol] = option
             self.optionDict[option.symbol] = option
         
+        # 批量定价相关，定价模型支持数组计算时整条期权链一次性计算
+        self.optionList = list(self.optionDict.values())
+        model = self.optionList[0].model if self.optionList else None
+        self.calculateGreeksArray = getattr(model, 'calculateGreeksArray', None)
+        self.calculateImpvArray = getattr(model, 'calculateImpvArray', None)
+        
+        self.kArray = np.array([option.k for option in self.optionList], dtype=float)
+        self.cpArray = np.array([option.cp for option in self.optionList], dtype=float)
+        self.sizeArray = np.array([option.size for option in self.optionList], dtype=float)
+        
+        # 待计算标记
+        self.dirty = False              # 标的行情已更新，需要整条期权链重新定价
+        self.impvDirtyDict = {}         # 行情已更新，需要计算隐含波动率的期权
+        
         # 持仓数据
         self.longPos = EMPTY_INT
         self.shortPos = EMPTY_INT
@@ -324,6 +352,7 @@ class OmChain(object):
         self.longPos = 0
         self.shortPos = 0
         self.netPos = 0
+        self.posValue = 0
         self.posDelta = 0
         self.posGamma = 0
         self.posTheta = 0
@@ -342,19 +371,127 @@ class OmChain(object):
         
         self.netPos = self.longPos - self.shortPos    
     
+    #----------------------------------------------------------------------
+    def getPosGreeks(self):
+        """获取持仓数据，用于持仓组合按变化量更新"""
+        return (self.longPos, self.shortPos, self.posValue, self.posDelta,
+                self.posGamma, self.posTheta, self.posVega)
+    
     #----------------------------------------------------------------------
     def newTick(self, tick):
-        """期权行情更新"""
+        """期权行情更新，只标记待计算，由update统一计算"""
         option = self.optionDict[tick.symbol]
         option.newTick(tick)
+        self.impvDirtyDict[option.symbol] = option
+    
+    #----------------------------------------------------------------------
+    def update(self):
+        """执行待计算的更新，返回是否有计算发生"""
+        if self.dirty:
+            self.newUnderlyingTick()
+        elif self.impvDirtyDict:
+            # 期权行情变化只影响隐含波动率，不影响理论价和持仓希腊值
+            optionList = list(self.impvDirtyDict.values())
+            self.impvDirtyDict = {}
+            
+            if self.calculateImpvArray:
+                self.calculateChainImpv(optionList)
+            else:
+                for option in optionList:
+                    option.calculateOptionImpv()
+        else:
+            return False
+        
+        return True
     
     #----------------------------------------------------------------------
     def newUnderlyingTick(self):
         """期货行情更新"""
-        for option in self.optionDict.values():
-            option.newUnderlyingTick()
+        self.dirty = False
+        self.impvDirtyDict = {}
+        
+        if self.calculateGreeksArray:
+            self.calculateChainGreeks()
+        else:
+            for option in self.optionDict.values():
+                option.newUnderlyingTick()
             
         self.calculatePosGreeks()
+    
+    #----------------------------------------------------------------------
+    def calculateChainImpv(self, optionList):
+        """批量计算期权的隐含波动率，卖价、买价和中间价一次性求解，以上一次的结果作为初始值"""
+        s = np.array([option.underlying.midPrice for option in optionList], dtype=float)
+        r = np.array([option.r for option in optionList], dtype=float)
+        t = np.array([option.t for option in optionList], dtype=float)
+        k = np.array([option.k for option in optionList], dtype=float)
+        cp = np.array([option.cp for option in optionList], dtype=float)
+        
+        self.solveImpv(optionList, s, k, r, t, cp)
+        
+    #----------------------------------------------------------------------
+    def solveImpv(self, optionList, s, k, r, t, cp):
+        """求解隐含波动率并更新到期权对象中"""
+        n = len(optionList)
+        priceList = ([option.askPrice1 for option in optionList] + 
+                     [option.bidPrice1 for option in optionList] + 
+                     [option.midPrice for option in optionList])
+        v0 = ([option.askImpv for option in optionList] + 
+              [option.bidImpv for option in optionList] + 
+              [option.midImpv for option in optionList])
+        
+        impv, status = self.calculateImpvArray(priceList, np.tile(s, 3), np.tile(k, 3), 
+                                               np.tile(r, 3), np.tile(t, 3), np.tile(cp, 3), v0)
+        impv = impv.tolist()
+        status = status.tolist()
+        
+        impvValid = ((s > 0) & (t > 0)).tolist()
+        
+        for i, (option, valid) in enumerate(zip(optionList, impvValid)):
+            option.impvDirty = False
+            if valid:
+                option.askImpv = impv[i]
+                option.bidImpv = impv[i+n]
+                option.midImpv = impv[i+2*n]
+                option.askImpvStatus = status[i]
+                option.bidImpvStatus = status[i+n]
+                option.midImpvStatus = status[i+2*n]
+        
+    #----------------------------------------------------------------------
+    def calculateChainGreeks(self):
+        """批量计算整条期权链的隐含波动率、理论希腊值和持仓希腊值"""
+        optionList = self.optionList
+        if not optionList:
+            return
+        
+        s = np.array([option.underlying.midPrice for option in optionList], dtype=float)
+        r = np.array([option.r for option in optionList], dtype=float)
+        t = np.array([option.t for option in optionList], dtype=float)
+        k = self.kArray
+        cp = self.cpArray
+        
+        # 隐含波动率
+        self.solveImpv(optionList, s, k, r, t, cp)
+        
+        # 理论价和希腊值
+        pricingImpv = np.array([option.pricingImpv for option in optionList], dtype=float)
+        price, delta, gamma, theta, vega = self.calculateGreeksArray(s, k, r, t, pricingImpv, cp)
+        size = self.sizeArray
+        
+        greeksValid = ((s > 0) & (pricingImpv > 0)).tolist()
+        
+        result = zip(optionList, greeksValid, price.tolist(), (delta*size).tolist(), 
+                     (gamma*size).tolist(), (theta*size).tolist(), (vega*size).tolist())
+        
+        for option, gv, p, d, g, th, ve in result:
+            if gv:
+                option.theoPrice = p
+                option.theoDelta = d
+                option.theoGamma = g
+                option.theoTheta = th
+                option.theoVega = ve
+            
+            option.calculatePosGreeks()
         
     #----------------------------------------------------------------------
     def newTrade(self, trade):
@@ -426,8 +563,12 @@ class OmPortfolio(object):
     """持仓组合"""
 
     #----------------------------------------------------------------------
-    def __init__(self, name, model, underlyingList, chainList):
-        """Constructor"""
+    def __init__(self, name, model, underlyingList, chainList, interval=0):
+        """
+        Constructor
+        interval为希腊值重新计算的最小间隔（毫秒），0表示每次行情都计算，
+        间隔内的行情只标记待计算，由下一次行情或者定时事件统一计算
+        """
         self.name = name
         self.model = model
         
@@ -458,10 +599,15 @@ class OmPortfolio(object):
         self.posGamma = EMPTY_FLOAT
         self.posTheta = EMPTY_FLOAT
         self.posVega = EMPTY_FLOAT
+        
+        # 计算频率控制
+        self.interval = interval / 1000
+        self.lastUpdateTime = 0
+        self.dirtyChainDict = OrderedDict()     # 有待计算内容的期权链
     
     #----------------------------------------------------------------------
     def calculatePosGreeks(self):
-        """计算持仓希腊值"""
+        """计算持仓希腊值（全量汇总）"""
         self.longPos = 0
         self.shortPos = 0
         self.netPos = 0
@@ -487,6 +633,40 @@ class OmPortfolio(object):
         
         self.netPos = self.longPos - self.shortPos        
     
+    #----------------------------------------------------------------------
+    def updatePosGreeks(self, old, new):
+        """按期权链持仓数据的变化量更新组合持仓希腊值"""
+        self.longPos += new[0] - old[0]
+        self.shortPos += new[1] - old[1]
+        self.netPos = self.longPos - self.shortPos
+        
+        self.posValue += new[2] - old[2]
+        self.posDelta += new[3] - old[3]
+        self.posGamma += new[4] - old[4]
+        self.posTheta += new[5] - old[5]
+        self.posVega += new[6] - old[6]
+    
+    #----------------------------------------------------------------------
+    def update(self):
+        """计算所有待计算的期权链，并按变化量更新组合持仓希腊值"""
+        self.lastUpdateTime = time()
+        
+        if not self.dirtyChainDict:
+            return
+        
+        for chain in self.dirtyChainDict.values():
+            old = chain.getPosGreeks()
+            if chain.update():
+                self.updatePosGreeks(old, chain.getPosGreeks())
+        
+        self.dirtyChainDict.clear()
+    
+    #----------------------------------------------------------------------
+    def checkUpdate(self):
+        """距离上一次计算超过间隔时执行计算"""
+        if time() - self.lastUpdateTime >= self.interval:
+            self.update()
+    
     #----------------------------------------------------------------------
     def newTick(self, tick):
         """行情推送"""
@@ -495,11 +675,17 @@ class OmPortfolio(object):
         if symbol in self.optionDict:
             chain = self.optionDict[symbol].chain
             chain.newTick(tick)
-            self.calculatePosGreeks()
+            self.dirtyChainDict[chain.symbol] = chain
+            self.checkUpdate()
         elif symbol in self.underlyingDict:
             underlying = self.underlyingDict[symbol]
+            
+            oldPosDelta = underlying.posDelta
             underlying.newTick(tick)
-            self.calculatePosGreeks()
+            self.posDelta += underlying.posDelta - oldPosDelta
+            
+            self.dirtyChainDict.update(underlying.chainDict)
+            self.checkUpdate()
     
     #----------------------------------------------------------------------
     def newTrade(self, trade):
@@ -508,12 +694,16 @@ class OmPortfolio(object):
         
         if symbol in self.optionDict:
             chain = self.optionDict[symbol].chain
+            
+            old = chain.getPosGreeks()
             chain.newTrade(trade)
-            self.calculatePosGreeks()
+            self.updatePosGreeks(old, chain.getPosGreeks())
         elif symbol in self.underlyingDict:
             underlying = self.underlyingDict[symbol]
+            
+            oldPosDelta = underlying.posDelta
             underlying.newTrade(trade)
-            self.calculatePosGreeks()
+            self.posDelta += underlying.posDelta - oldPosDelta
     
     #----------------------------------------------------------------------
     def adjustR(self):
@@ -22,6 +22,7 @@ from vnpy.pricing import black, bs, crr, bsCython, crrCython
 from .omBase import (OmOption, OmUnderlying, OmChain, OmPortfolio,
                      EVENT_OM_LOG, EVENT_OM_STRATEGY, EVENT_OM_STRATEGYLOG,
                      OM_DB_NAME)
+from .omSurface import OmSurface
 from .strategy import STRATEGY_CLASS
 
 
@@ -50,6 +51,7 @@ class OmEngine(object):
         self.eventEngine = eventEngine
         
         self.portfolio = None
+        self.surface = None               # 波动率曲面，未启用时使用手动设置的定价波动率
         self.optionContractDict = {}      # symbol:contract
         
         self.strategyEngine = OmStrategyEngine(self, eventEngine)
@@ -60,6 +62,7 @@ class OmEngine(object):
     def registerEvent(self):
         """注册事件监听"""
         self.eventEngine.register(EVENT_CONTRACT, self.processContractEvent)
+        self.eventEngine.register(EVENT_TIMER, self.processTimerEvent)
     
     #----------------------------------------------------------------------
     def processTickEvent(self, event):
@@ -73,6 +76,15 @@ class OmEngine(object):
         trade = event.dict_['data']
         self.portfolio.newTrade(trade)
     
+    #----------------------------------------------------------------------
+    def processTimerEvent(self, event):
+        """定时事件，拟合波动率曲面，并计算行情推送间隔内尚未计算的希腊值"""
+        if self.surface:
+            self.surface.update()
+        
+        if self.portfolio:
+            self.portfolio.update()
+    
     #----------------------------------------------------------------------
     def processContractEvent(self, event):
         """合约事件"""
@@ -176,11 +188,18 @@ class OmEngine(object):
             underlying.addChain(chain)
 
         # 创建持仓组合对象并初始化
-        self.portfolio = OmPortfolio(setting['name'], model, underlyingDict.values(), chainList)
+        self.portfolio = OmPortfolio(setting['name'], model, underlyingDict.values(), chainList,
+                                     setting.get('greeksInterval', 0))
         
         # 载入波动率配置
         self.loadImpvSetting()
         
+        # 启用波动率曲面，载入缓存的拟合参数
+        surfaceInterval = setting.get('surfaceInterval', 0)
+        if surfaceInterval:
+            self.surface = OmSurface(self.portfolio, surfaceInterval)
+            self.surface.loadSetting()
+        
         # 订阅行情和事件
         for underlying in underlyingDict.values():
             self.subscribeEvent(underlying.vtSymbol)
@@ -222,6 +241,9 @@ class OmEngine(object):
         """关闭函数"""
         self.saveImpvSetting()
         
+        if self.surface:
+            self.surface.saveSetting()
+        
     #----------------------------------------------------------------------
     def writeLog(self, content):
         """发出日志 """
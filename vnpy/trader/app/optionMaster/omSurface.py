@@ -0,0 +1,279 @@
+# encoding: UTF-8
+
+'''
+波动率曲面组件，基于每条期权链的实时隐含波动率拟合SVI波动率微笑
+
+SVI（raw）参数化形式，x为对数在值程度ln(K/F)，w为总方差（波动率平方乘以剩余时间）：
+w(x) = a + b * (rho * (x - m) + sqrt((x - m)^2 + sigma^2))
+
+拟合规则：
+1. 每条期权链使用虚值期权（行权价不低于远期价格的看涨和行权价低于远期价格的看跌）的
+   中间价隐含波动率，以买卖价隐含波动率之差的倒数作为权重
+2. 拟合按固定间隔在定时事件中执行，以上一次的参数作为初始值，拟合数据没有变化时跳过
+3. 拟合完成后直接计算每个期权的定价波动率并写入pricingImpv，读取时无需再计算，
+   两次拟合之间定价波动率按行权价保持不变
+4. 拟合参数缓存在shelve文件中，启动时载入，行情到达前即可使用
+'''
+
+from __future__ import division
+
+import shelve
+from time import time
+
+import numpy as np
+from scipy.optimize import least_squares
+
+from vnpy.trader.vtConstant import PRODUCT_FUTURES
+from vnpy.trader.vtFunction import getTempPath
+from vnpy.pricing.impv import IMPV_NONE, IMPV_CONVERGED
+
+
+# 拟合参数
+MIN_POINTS = 5                  # 最少拟合数据点数量（SVI共5个参数）
+MIN_SPREAD = 0.001              # 计算权重时的最小买卖价隐含波动率之差
+MAX_NFEV = 200                  # 单次拟合的最大函数计算次数
+
+# SVI参数的上下限，顺序为a、b、rho、m、sigma
+SVI_LOWER = [-1.0, 0.0, -0.999, -1.0, 0.0001]
+SVI_UPPER = [1.0, 5.0, 0.999, 1.0, 5.0]
+
+
+#----------------------------------------------------------------------
+def calculateSvi(params, x):
+    """计算SVI总方差"""
+    a, b, rho, m, sigma = params
+    d = x - m
+    return a + b * (rho * d + np.sqrt(d * d + sigma * sigma))
+
+#----------------------------------------------------------------------
+def calculateSviImpv(params, x, t):
+    """计算SVI对应的隐含波动率，总方差小于0时返回0"""
+    w = calculateSvi(params, x)
+    return np.sqrt(np.maximum(w, 0) / t)
+
+#----------------------------------------------------------------------
+def guessSvi(x, w):
+    """生成SVI参数的初始值"""
+    return [max(w.min() / 2, 0), 0.1, -0.3, 0, 0.1]
+
+#----------------------------------------------------------------------
+def fitSvi(x, impv, weight, t, params0=None):
+    """
+    拟合SVI参数，以隐含波动率的加权误差作为目标
+    成功返回参数列表，失败返回None
+    """
+    if params0 is None:
+        params0 = guessSvi(x, impv * impv * t)
+
+    # 初始值需要在上下限内
+    params0 = np.clip(params0, SVI_LOWER, SVI_UPPER)
+
+    residualFunc = lambda params: (calculateSviImpv(params, x, t) - impv) * weight
+
+    try:
+        result = least_squares(residualFunc, params0, bounds=(SVI_LOWER, SVI_UPPER),
+                               max_nfev=MAX_NFEV)
+    except (ValueError, FloatingPointError):
+        return None
+
+    a, b, rho, m, sigma = result.x
+
+    # 检查最小总方差非负
+    if not result.success or a + b * sigma * np.sqrt(1 - rho * rho) < 0:
+        return None
+
+    return result.x.tolist()
+
+
+########################################################################
+class OmSmile(object):
+    """单个到期日（期权链）的波动率微笑"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, chain):
+        """Constructor"""
+        self.chain = chain
+
+        self.params = None          # 拟合得到的SVI参数
+        self.t = 0                  # 拟合时的剩余时间
+        self.forward = 0            # 拟合时的远期价格
+        self.fitTime = 0            # 上一次拟合的时间
+        self.error = 0              # 上一次拟合的加权均方根误差
+
+        self.lastData = None        # 上一次拟合使用的数据，用于判断是否需要重新拟合
+
+    #----------------------------------------------------------------------
+    def getForward(self, option):
+        """计算远期价格，标的为期货时即为期货价格"""
+        s = option.underlying.midPrice
+        if option.underlying.productClass == PRODUCT_FUTURES:
+            return s
+        return s * np.exp(option.r * option.t)
+
+    #----------------------------------------------------------------------
+    def getData(self):
+        """提取拟合数据，返回(远期价格, 对数在值程度, 中间价隐含波动率, 权重)，数据不足时返回None"""
+        optionList = self.chain.optionList
+        if not optionList or not optionList[0].underlying.midPrice or optionList[0].t <= 0:
+            return None
+
+        forward = self.getForward(optionList[0])
+
+        l = []
+        for option in optionList:
+            # 只使用虚值期权
+            if (option.cp > 0) != (option.k >= forward):
+                continue
+
+            # 买卖价隐含波动率均有效
+            if (option.bidImpv <= 0 or option.askImpv < option.bidImpv or
+                option.bidImpvStatus not in (IMPV_NONE, IMPV_CONVERGED) or
+                option.askImpvStatus not in (IMPV_NONE, IMPV_CONVERGED)):
+                continue
+
+            l.append((np.log(option.k / forward),
+                      (option.bidImpv + option.askImpv) / 2,
+                      1 / max(option.askImpv - option.bidImpv, MIN_SPREAD)))
+
+        if len(l) < MIN_POINTS:
+            return None
+
+        data = np.array(l)
+        return forward, data[:, 0], data[:, 1], data[:, 2] / data[:, 2].mean()
+
+    #----------------------------------------------------------------------
+    def fit(self):
+        """拟合波动率微笑，成功返回True"""
+        data = self.getData()
+        if data is None:
+            return False
+
+        # 数据没有变化时无需重新拟合
+        forward, x, impv, weight = data
+        lastData = np.concatenate([x, impv])
+        if self.params and self.lastData is not None and np.array_equal(lastData, self.lastData):
+            return False
+
+        t = self.chain.optionList[0].t
+
+        params = fitSvi(x, impv, weight, t, self.params)
+        if params is None:
+            return False
+
+        self.params = params
+        self.forward = forward
+        self.t = t
+        self.fitTime = time()
+        self.lastData = lastData
+        self.error = np.sqrt(np.mean(((calculateSviImpv(params, x, t) - impv) * weight) ** 2))
+
+        return True
+
+    #----------------------------------------------------------------------
+    def getImpv(self, k):
+        """计算行权价对应的波动率"""
+        if not self.params or not self.forward or not self.t:
+            return 0
+        return float(calculateSviImpv(self.params, np.log(k / self.forward), self.t))
+
+    #----------------------------------------------------------------------
+    def updatePricingImpv(self):
+        """将拟合结果写入期权的定价波动率"""
+        if not self.params or not self.forward or not self.t:
+            return
+
+        optionList = self.chain.optionList
+        k = np.array([option.k for option in optionList], dtype=float)
+        impv = calculateSviImpv(self.params, np.log(k / self.forward), self.t)
+
+        for option, v in zip(optionList, impv.tolist()):
+            if v > 0:
+                option.pricingImpv = v
+
+        # 定价波动率变化后需要重新计算理论价和希腊值
+        self.chain.dirty = True
+
+    #----------------------------------------------------------------------
+    def getSetting(self):
+        """获取需要缓存的拟合结果"""
+        return {
+            'params': self.params,
+            't': self.t,
+            'forward': self.forward
+        }
+
+    #----------------------------------------------------------------------
+    def loadSetting(self, setting):
+        """载入缓存的拟合结果"""
+        self.params = setting['params']
+        self.t = setting['t']
+        self.forward = setting['forward']
+
+
+########################################################################
+class OmSurface(object):
+    """波动率曲面，管理持仓组合中所有期权链的波动率微笑"""
+    surfaceFileName = 'VolatilitySurface.vt'
+    surfaceFilePath = getTempPath(surfaceFileName)
+
+    #----------------------------------------------------------------------
+    def __init__(self, portfolio, interval):
+        """
+        Constructor
+        interval为拟合间隔（秒）
+        """
+        self.portfolio = portfolio
+        self.interval = interval
+
+        self.smileDict = {}         # chainSymbol:smile
+        for chain in portfolio.chainDict.values():
+            self.smileDict[chain.symbol] = OmSmile(chain)
+
+        self.lastFitTime = 0
+
+    #----------------------------------------------------------------------
+    def update(self, force=False):
+        """到达拟合间隔时拟合所有数据有变化的期权链，返回拟合成功的期权链代码列表"""
+        now = time()
+        if not force and now - self.lastFitTime < self.interval:
+            return []
+        self.lastFitTime = now
+
+        l = []
+        for symbol, smile in self.smileDict.items():
+            if smile.fit():
+                smile.updatePricingImpv()
+                self.portfolio.dirtyChainDict[symbol] = smile.chain
+                l.append(symbol)
+
+        return l
+
+    #----------------------------------------------------------------------
+    def getSmile(self, chainSymbol):
+        """获取期权链的波动率微笑"""
+        return self.smileDict.get(chainSymbol, None)
+
+    #----------------------------------------------------------------------
+    def loadSetting(self):
+        """载入缓存的拟合参数，并更新定价波动率"""
+        f = shelve.open(self.surfaceFilePath)
+
+        for symbol, smile in self.smileDict.items():
+            setting = f.get(symbol, None)
+            if setting:
+                smile.loadSetting(setting)
+                smile.updatePricingImpv()
+                self.portfolio.dirtyChainDict[symbol] = smile.chain
+
+        f.close()
+
+    #----------------------------------------------------------------------
+    def saveSetting(self):
+        """保存拟合参数"""
+        f = shelve.open(self.surfaceFilePath)
+
+        for symbol, smile in self.smileDict.items():
+            if smile.params:
+                f[symbol] = smile.getSetting()
+
+        f.close()
@@ -2,9 +2,10 @@
 
 '''
 本文件中实现了风控引擎，用于提供一系列常用的风控功能：
-1. 委托流控（单位时间内最大允许发出的委托数量）
+1. 委托流控（任意滑动时间窗口内最大允许发出的委托数量，可分别针对全局、接口、合约和策略）
 2. 总成交限制（每日总成交数量限制）
 3. 单笔委托的委托数量控制
+4. 按接口、账户、品种、合约分别配置的分级风控规则（见rmRule.py）
 '''
 
 from __future__ import division
@@ -12,6 +13,8 @@ from __future__ import division
 import json
 import os
 import platform
+from collections import deque
+from time import time
 
 from vnpy.event import Event
 from vnpy.trader.vtEvent import *
@@ -19,6 +22,12 @@ from vnpy.trader.vtConstant import *
 from vnpy.trader.vtGateway import VtLogData
 from vnpy.trader.vtFunction import getJsonPath
 
+from .rmRule import RuleBook
+
+
+# 已结束的委托状态
+FINISHED_STATUS = [STATUS_ALLTRADED, STATUS_REJECTED, STATUS_CANCELLED]
+
 
 ########################################################################
 class RmEngine(object):
@@ -41,10 +50,16 @@ class RmEngine(object):
         self.active = False
 
         # 流控相关
-        self.orderFlowCount = EMPTY_INT     # 单位时间内委托计数
         self.orderFlowLimit = EMPTY_INT     # 委托限制
-        self.orderFlowClear = EMPTY_INT     # 计数清空时间（秒）
-        self.orderFlowTimer = EMPTY_INT     # 计数清空时间计时
+        self.orderFlowClear = EMPTY_INT     # 流控滑动窗口长度（秒）
+        self.orderFlowWindow = OrderFlowWindow()    # 全局流控窗口
+        
+        self.gatewayOrderFlowLimit = EMPTY_INT      # 单接口委托限制，为0则不检查
+        self.symbolOrderFlowLimit = EMPTY_INT       # 单合约委托限制，为0则不检查
+        self.strategyOrderFlowLimit = EMPTY_INT     # 单策略委托限制，为0则不检查
+        self.gatewayWindowDict = {}                 # 接口流控窗口字典
+        self.symbolWindowDict = {}                  # 合约流控窗口字典
+        self.strategyWindowDict = {}                # 策略流控窗口字典
 
         # 单笔委托相关
         self.orderSizeLimit = EMPTY_INT     # 单笔委托最大限制
@@ -59,10 +74,15 @@ class RmEngine(object):
 
         # 活动合约相关
         self.workingOrderLimit = EMPTY_INT  # 活动合约最大限制
+        self.workingOrderSet = set()        # 活动委托号集合，基于委托推送增量维护
         
         # 保证金相关
         self.marginRatioDict = {}           # 保证金占账户净值比例字典
         self.marginRatioLimit = EMPTY_FLOAT # 最大比例限制
+        
+        # 分级风控规则
+        self.ruleBook = RuleBook()
+        self.sizeDict = {}                  # vtSymbol:合约乘数
 
         self.loadSetting()
         self.registerEvent()
@@ -78,6 +98,10 @@ class RmEngine(object):
 
             self.orderFlowLimit = d['orderFlowLimit']
             self.orderFlowClear = d['orderFlowClear']
+            
+            self.gatewayOrderFlowLimit = d.get('gatewayOrderFlowLimit', EMPTY_INT)
+            self.symbolOrderFlowLimit = d.get('symbolOrderFlowLimit', EMPTY_INT)
+            self.strategyOrderFlowLimit = d.get('strategyOrderFlowLimit', EMPTY_INT)
 
             self.orderSizeLimit = d['orderSizeLimit']
 
@@ -88,6 +112,8 @@ class RmEngine(object):
             self.orderCancelLimit = d['orderCancelLimit']
             
             self.marginRatioLimit = d['marginRatioLimit']
+            
+            self.ruleBook.loadRules(d.get('ruleList', []))
 
     #----------------------------------------------------------------------
     def saveSetting(self):
@@ -100,6 +126,10 @@ class RmEngine(object):
 
             d['orderFlowLimit'] = self.orderFlowLimit
             d['orderFlowClear'] = self.orderFlowClear
+            
+            d['gatewayOrderFlowLimit'] = self.gatewayOrderFlowLimit
+            d['symbolOrderFlowLimit'] = self.symbolOrderFlowLimit
+            d['strategyOrderFlowLimit'] = self.strategyOrderFlowLimit
 
             d['orderSizeLimit'] = self.orderSizeLimit
 
@@ -110,6 +140,8 @@ class RmEngine(object):
             d['orderCancelLimit'] = self.orderCancelLimit
             
             d['marginRatioLimit'] = self.marginRatioLimit
+            
+            d['ruleList'] = self.ruleBook.getSettingList()
 
             # 写入json
             jsonD = json.dumps(d, indent=4)
@@ -119,18 +151,27 @@ class RmEngine(object):
     def registerEvent(self):
         """注册事件监听"""
         self.eventEngine.register(EVENT_TRADE, self.updateTrade)
-        self.eventEngine.register(EVENT_TIMER, self.updateTimer)
         self.eventEngine.register(EVENT_ORDER, self.updateOrder)
         self.eventEngine.register(EVENT_ACCOUNT, self.updateAccount)
+        self.eventEngine.register(EVENT_POSITION, self.updatePosition)
         
     #----------------------------------------------------------------------
     def updateOrder(self, event):
-        """更新成交数据"""
-        # 只需要统计撤单成功的委托
+        """更新委托数据"""
         order = event.dict_['data']
+        
+        # 维护活动委托集合
+        if order.status in FINISHED_STATUS:
+            self.workingOrderSet.discard(order.vtOrderID)
+        else:
+            self.workingOrderSet.add(order.vtOrderID)
+        
+        # 只需要统计撤单成功的委托
         if order.status != STATUS_CANCELLED:
             return
         
+        self.ruleBook.updateCancel(order)
+        
         if order.symbol not in self.orderCancelDict:
             self.orderCancelDict[order.symbol] = 1
         else:
@@ -141,16 +182,35 @@ class RmEngine(object):
         """更新成交数据"""
         trade = event.dict_['data']
         self.tradeCount += trade.volume
-
+        
+        self.ruleBook.updateTrade(trade, self.getSize(trade.vtSymbol))
+        
     #----------------------------------------------------------------------
-    def updateTimer(self, event):
-        """更新定时器"""
-        self.orderFlowTimer += 1
+    def updatePosition(self, event):
+        """更新持仓数据"""
+        pos = event.dict_['data']
+        self.ruleBook.updatePosition(pos, self.getSize(pos.vtSymbol))
+        
+    #----------------------------------------------------------------------
+    def getSize(self, vtSymbol):
+        """获取合约乘数，查询不到合约时返回1"""
+        size = self.sizeDict.get(vtSymbol, None)
+        
+        if size is None:
+            contract = self.mainEngine.getContract(vtSymbol)
+            if not contract:
+                return 1
+            
+            size = contract.size or 1
+            self.sizeDict[vtSymbol] = size
+        
+        return size
 
-        # 如果计时超过了流控清空的时间间隔，则执行清空
-        if self.orderFlowTimer >= self.orderFlowClear:
-            self.orderFlowCount = 0
-            self.orderFlowTimer = 0
+    #----------------------------------------------------------------------
+    @property
+    def orderFlowCount(self):
+        """当前滑动窗口内的委托数量"""
+        return self.orderFlowWindow.getCount(time(), self.orderFlowClear)
 
     #----------------------------------------------------------------------
     def updateAccount(self, event):
@@ -164,6 +224,9 @@ class RmEngine(object):
         
         # 更新到字典中
         self.marginRatioDict[account.gatewayName] = ratio
+        
+        # 更新接口对应的账户
+        self.ruleBook.setAccount(account.gatewayName, account.accountID)
 
     #----------------------------------------------------------------------
     def writeRiskLog(self, content):
@@ -206,13 +269,31 @@ class RmEngine(object):
             return False
 
         # 检查流控
-        if self.orderFlowCount >= self.orderFlowLimit:
+        now = time()
+        interval = self.orderFlowClear
+        
+        orderFlowCount = self.orderFlowWindow.getCount(now, interval)
+        if orderFlowCount >= self.orderFlowLimit:
             self.writeRiskLog(u'委托流数量%s，超过限制每%s秒%s'
-                              %(self.orderFlowCount, self.orderFlowClear, self.orderFlowLimit))
+                              %(orderFlowCount, interval, self.orderFlowLimit))
+            return False
+        
+        windowList = [self.orderFlowWindow]
+        
+        if self.gatewayOrderFlowLimit and not self.checkOrderFlow(self.gatewayWindowDict, gatewayName, 
+                                                                 self.gatewayOrderFlowLimit, now, windowList):
+            return False
+        
+        if self.symbolOrderFlowLimit and not self.checkOrderFlow(self.symbolWindowDict, orderReq.vtSymbol, 
+                                                                self.symbolOrderFlowLimit, now, windowList):
+            return False
+        
+        if self.strategyOrderFlowLimit and not self.checkOrderFlow(self.strategyWindowDict, orderReq.strategyName, 
+                                                                  self.strategyOrderFlowLimit, now, windowList):
             return False
 
         # 检查总活动合约
-        workingOrderCount = len(self.mainEngine.getAllWorkingOrders())
+        workingOrderCount = len(self.workingOrderSet)
         if workingOrderCount >= self.workingOrderLimit:
             self.writeRiskLog(u'当前活动委托数量%s，超过限制%s'
                               %(workingOrderCount, self.workingOrderLimit))
@@ -230,21 +311,52 @@ class RmEngine(object):
                               %(gatewayName, self.marginRatioDict[gatewayName], self.marginRatioLimit))
             return False
         
+        # 检查分级风控规则
+        if self.ruleBook.ruleList:
+            msg = self.ruleBook.check(orderReq, gatewayName, self.getSize(orderReq.vtSymbol))
+            if msg:
+                self.writeRiskLog(msg)
+                return False
+        
         # 对于通过风控的委托，增加流控计数
-        self.orderFlowCount += 1
+        for window in windowList:
+            window.add(now)
 
         return True
 
+    #----------------------------------------------------------------------
+    def checkOrderFlow(self, windowDict, key, limit, now, windowList):
+        """检查接口、合约或策略的流控，通过时将对应窗口加入windowList"""
+        if not key:
+            return True
+        
+        window = windowDict.get(key, None)
+        if not window:
+            window = OrderFlowWindow()
+            windowDict[key] = window
+        
+        count = window.getCount(now, self.orderFlowClear)
+        if count >= limit:
+            self.writeRiskLog(u'%s委托流数量%s，超过限制每%s秒%s'
+                              %(key, count, self.orderFlowClear, limit))
+            return False
+        
+        windowList.append(window)
+        return True
+
     #----------------------------------------------------------------------
     def clearOrderFlowCount(self):
         """清空流控计数"""
-        self.orderFlowCount = 0
+        self.orderFlowWindow.clear()
+        for d in [self.gatewayWindowDict, self.symbolWindowDict, self.strategyWindowDict]:
+            d.clear()
         self.writeRiskLog(u'清空流控计数')
 
     #----------------------------------------------------------------------
     def clearTradeCount(self):
         """清空成交数量计数"""
         self.tradeCount = 0
+        self.ruleBook.clear()
         self.writeRiskLog(u'清空总成交计数')
 
     #----------------------------------------------------------------------
@@ -257,6 +369,21 @@ class RmEngine(object):
         """设置流控清空时间"""
         self.orderFlowClear = n
 
+    #----------------------------------------------------------------------
+    def setGatewayOrderFlowLimit(self, n):
+        """设置单接口流控限制"""
+        self.gatewayOrderFlowLimit = n
+    
+    #----------------------------------------------------------------------
+    def setSymbolOrderFlowLimit(self, n):
+        """设置单合约流控限制"""
+        self.symbolOrderFlowLimit = n
+    
+    #----------------------------------------------------------------------
+    def setStrategyOrderFlowLimit(self, n):
+        """设置单策略流控限制"""
+        self.strategyOrderFlowLimit = n
+
     #----------------------------------------------------------------------
     def setOrderSizeLimit(self, n):
         """设置委托最大限制"""
@@ -282,6 +409,12 @@ class RmEngine(object):
         """设置保证金比例限制"""
         self.marginRatioLimit = n/100   # n为百分数，需要除以100
 
+    #----------------------------------------------------------------------
+    def setRuleList(self, settingList):
+        """设置分级风控规则，settingList为规则配置字典列表"""
+        self.ruleBook.loadRules(settingList)
+        self.writeRiskLog(u'分级风控规则更新，规则数量%s' %len(settingList))
+
     #----------------------------------------------------------------------
     def switchEngineStatus(self):
         """开关风控引擎"""
@@ -296,4 +429,100 @@ class RmEngine(object):
     def stop(self):
         """停止"""
         self.saveSetting()
+
+
+########################################################################
+class OrderFlowWindow(object):
+    """
+    流控滑动窗口，记录窗口内每笔委托的发出时间
+    任意长度为interval秒的时间段内，通过的委托数量都不会超过限制，
+    不会出现固定周期清零时在周期边界前后集中发单导致实际流量翻倍的情况
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self):
+        """Constructor"""
+        self.timeQueue = deque()
+        
+    #----------------------------------------------------------------------
+    def getCount(self, now, interval):
+        """移除窗口外的记录，返回窗口内的委托数量"""
+        q = self.timeQueue
+        expire = now - interval
+        while q and q[0] <= expire:
+            q.popleft()
+        return len(q)
+    
+    #----------------------------------------------------------------------
+    def add(self, now):
+        """记录一笔委托"""
+        self.timeQueue.append(now)
+        
+    #----------------------------------------------------------------------
+    def clear(self):
+        """清空"""
+        self.timeQueue.clear()
+
+
+#----------------------------------------------------------------------
+def benchmark(count=100000):
+    """
+    风控检查耗时测试，统计checkRisk每次调用的耗时分布（微秒）
+    模拟开启各级流控和分级风控规则、且所有委托均通过检查的情况
+    """
+    from vnpy.event import EventEngine2
+    from vnpy.event.eventEngine import LatencyHistogram
+    from vnpy.trader.vtObject import VtOrderReq
+    
+    class BenchmarkMainEngine(object):
+        def getContract(self, vtSymbol):
+            return None
+    
+    engine = RmEngine(BenchmarkMainEngine(), EventEngine2())
+    engine.active = True
+    engine.orderSizeLimit = 100
+    engine.tradeLimit = count
+    engine.workingOrderLimit = count
+    engine.orderCancelLimit = count
+    engine.marginRatioLimit = 1
+    
+    engine.orderFlowClear = 1
+    engine.orderFlowLimit = count
+    engine.gatewayOrderFlowLimit = count
+    engine.symbolOrderFlowLimit = count
+    engine.strategyOrderFlowLimit = count
+    
+    engine.ruleBook.loadRules([
+        {'scope': 'gateway', 'key': 'CTP', 'type': 'tradeVolume', 'limit': count},
+        {'scope': 'product', 'key': 'rb', 'type': 'orderSize', 'limit': 100},
+        {'scope': 'symbol', 'key': 'rb1810.SHFE', 'type': 'cancelCount', 'limit': count}
+    ])
+    
+    reqList = []
+    for vtSymbol in ['rb1810.SHFE', 'rb1901.SHFE', 'IF1809.CFFEX']:
+        for strategyName in ['strategy1', 'strategy2']:
+            req = VtOrderReq()
+            req.symbol = vtSymbol.split('.')[0]
+            req.vtSymbol = vtSymbol
+            req.direction = DIRECTION_LONG
+            req.offset = OFFSET_OPEN
+            req.volume = 1
+            req.strategyName = strategyName
+            reqList.append(req)
+    
+    histogram = LatencyHistogram()
+    n = len(reqList)
+    
+    for i in range(count):
+        req = reqList[i % n]
+        start = time()
+        result = engine.checkRisk(req, 'CTP')
+        histogram.add((time() - start) * 1000000)
         
+        if not result:
+            raise RuntimeError(u'第%s笔委托未通过风控检查' % i)
+    
+    d = histogram.getResult()
+    print(u'checkRisk：调用%s次，平均%.2f微秒，p50 %.2f微秒，p99 %.2f微秒，最大%.2f微秒' 
+          %(d['count'], d['mean'], d['p50'], d['p99'], d['max']))
+    return d
@@ -0,0 +1,482 @@
+# encoding: UTF-8
+
+'''
+本文件中实现了风控引擎使用的分级风控规则。
+
+每条规则由作用范围（scope）、范围代码（key）、规则类型（type）和限制值（limit）组成，
+在RM_setting.json的ruleList中配置，例如：
+    {"scope": "account", "key": "0001", "type": "positionNotional", "limit": 5000000}
+    {"scope": "product", "key": "rb", "type": "netDelta", "limit": 500}
+    {"scope": "symbol", "key": "IF1809.CFFEX", "type": "orderSize", "limit": 5}
+
+作用范围：
+1. gateway：接口名称
+2. account：账户代码（接口推送的accountID）
+3. product：品种代码（合约代码的字母部分，如rb1810的品种为rb）
+4. symbol：vt系统合约代码
+
+规则类型：
+1. orderSize：单笔委托数量上限
+2. tradeVolume：当日成交数量上限
+3. cancelCount：当日撤单次数上限
+4. positionNotional：持仓名义价值（各合约净持仓绝对值*合约乘数*价格之和）上限
+5. netDelta：净Delta（各合约净持仓*合约乘数之和）绝对值上限
+
+持仓类规则只检查会增加风险暴露的委托，减仓委托始终放行。
+'''
+
+from __future__ import division
+
+import re
+
+from vnpy.trader.vtConstant import *
+
+
+# 作用范围
+SCOPE_GATEWAY = 'gateway'
+SCOPE_ACCOUNT = 'account'
+SCOPE_PRODUCT = 'product'
+SCOPE_SYMBOL = 'symbol'
+
+SCOPE_LIST = [SCOPE_GATEWAY, SCOPE_ACCOUNT, SCOPE_PRODUCT, SCOPE_SYMBOL]
+
+# 规则类型
+RULE_ORDER_SIZE = 'orderSize'
+RULE_TRADE_VOLUME = 'tradeVolume'
+RULE_CANCEL_COUNT = 'cancelCount'
+RULE_POSITION_NOTIONAL = 'positionNotional'
+RULE_NET_DELTA = 'netDelta'
+
+# 品种代码
+PRODUCT_PATTERN = re.compile(r'^[A-Za-z]+')
+
+
+#----------------------------------------------------------------------
+def getProduct(symbol):
+    """从合约代码中获取品种代码，没有字母前缀（如股票）时返回合约代码本身"""
+    m = PRODUCT_PATTERN.match(symbol)
+    if m:
+        return m.group()
+    return symbol
+
+
+########################################################################
+class RiskRule(object):
+    """风控规则基类"""
+    ruleType = EMPTY_STRING
+
+    #----------------------------------------------------------------------
+    def __init__(self, scope, key, limit):
+        """Constructor"""
+        self.scope = scope      # 作用范围
+        self.key = key          # 范围代码
+        self.limit = limit      # 限制值
+
+    #----------------------------------------------------------------------
+    def getName(self):
+        """规则名称，用于风控日志"""
+        return u'%s[%s]' %(self.scope, self.key)
+
+    #----------------------------------------------------------------------
+    def getSetting(self):
+        """获取规则配置"""
+        return {'scope': self.scope, 'key': self.key, 'type': self.ruleType, 'limit': self.limit}
+
+    #----------------------------------------------------------------------
+    def check(self, orderReq, size):
+        """检查委托，通过返回空字符串，否则返回风控日志内容"""
+        return EMPTY_UNICODE
+
+    #----------------------------------------------------------------------
+    def onTrade(self, trade):
+        """成交更新"""
+        pass
+
+    #----------------------------------------------------------------------
+    def onCancel(self, order):
+        """撤单更新"""
+        pass
+
+    #----------------------------------------------------------------------
+    def onPosition(self, vtSymbol, netChange, size, price):
+        """净持仓变化，netChange为净持仓（多-空）的变化量"""
+        pass
+
+    #----------------------------------------------------------------------
+    def clear(self):
+        """清空当日统计"""
+        pass
+
+
+########################################################################
+class OrderSizeRule(RiskRule):
+    """单笔委托数量"""
+    ruleType = RULE_ORDER_SIZE
+
+    #----------------------------------------------------------------------
+    def check(self, orderReq, size):
+        """检查委托"""
+        if orderReq.volume > self.limit:
+            return u'%s单笔委托数量%s，超过限制%s' %(self.getName(), orderReq.volume, self.limit)
+        return EMPTY_UNICODE
+
+
+########################################################################
+class TradeVolumeRule(RiskRule):
+    """当日成交数量"""
+    ruleType = RULE_TRADE_VOLUME
+
+    #----------------------------------------------------------------------
+    def __init__(self, scope, key, limit):
+        """Constructor"""
+        super(TradeVolumeRule, self).__init__(scope, key, limit)
+        self.tradeCount = EMPTY_INT
+
+    #----------------------------------------------------------------------
+    def check(self, orderReq, size):
+        """检查委托"""
+        if self.tradeCount >= self.limit:
+            return u'%s今日成交数量%s，超过限制%s' %(self.getName(), self.tradeCount, self.limit)
+        return EMPTY_UNICODE
+
+    #----------------------------------------------------------------------
+    def onTrade(self, trade):
+        """成交更新"""
+        self.tradeCount += trade.volume
+
+    #----------------------------------------------------------------------
+    def clear(self):
+        """清空当日统计"""
+        self.tradeCount = 0
+
+
+########################################################################
+class CancelCountRule(RiskRule):
+    """当日撤单次数"""
+    ruleType = RULE_CANCEL_COUNT
+
+    #----------------------------------------------------------------------
+    def __init__(self, scope, key, limit):
+        """Constructor"""
+        super(CancelCountRule, self).__init__(scope, key, limit)
+        self.cancelCount = EMPTY_INT
+
+    #----------------------------------------------------------------------
+    def check(self, orderReq, size):
+        """检查委托"""
+        if self.cancelCount >= self.limit:
+            return u'%s今日撤单次数%s，超过限制%s' %(self.getName(), self.cancelCount, self.limit)
+        return EMPTY_UNICODE
+
+    #----------------------------------------------------------------------
+    def onCancel(self, order):
+        """撤单更新"""
+        self.cancelCount += 1
+
+    #----------------------------------------------------------------------
+    def clear(self):
+        """清空当日统计"""
+        self.cancelCount = 0
+
+
+########################################################################
+class PositionRule(RiskRule):
+    """持仓类规则基类，增量维护范围内各合约的净持仓"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, scope, key, limit):
+        """Constructor"""
+        super(PositionRule, self).__init__(scope, key, limit)
+        self.netDict = {}       # vtSymbol:净持仓
+        self.priceDict = {}     # vtSymbol:最新持仓价格
+
+    #----------------------------------------------------------------------
+    def getNewNet(self, orderReq):
+        """计算委托全部成交后的净持仓，返回(当前净持仓, 成交后净持仓)"""
+        net = self.netDict.get(orderReq.vtSymbol, 0)
+        if orderReq.direction == DIRECTION_LONG:
+            return net, net + orderReq.volume
+        else:
+            return net, net - orderReq.volume
+
+
+########################################################################
+class PositionNotionalRule(PositionRule):
+    """持仓名义价值"""
+    ruleType = RULE_POSITION_NOTIONAL
+
+    #----------------------------------------------------------------------
+    def __init__(self, scope, key, limit):
+        """Constructor"""
+        super(PositionNotionalRule, self).__init__(scope, key, limit)
+        self.notional = EMPTY_FLOAT     # 名义价值汇总
+        self.notionalDict = {}          # vtSymbol:名义价值
+
+    #----------------------------------------------------------------------
+    def check(self, orderReq, size):
+        """检查委托"""
+        net, newNet = self.getNewNet(orderReq)
+        if abs(newNet) <= abs(net):
+            return EMPTY_UNICODE
+
+        vtSymbol = orderReq.vtSymbol
+        price = orderReq.price or self.priceDict.get(vtSymbol, 0)
+        notional = self.notional - self.notionalDict.get(vtSymbol, 0) + abs(newNet) * size * price
+
+        if notional > self.limit:
+            return u'%s委托后持仓名义价值%s，超过限制%s' %(self.getName(), notional, self.limit)
+        return EMPTY_UNICODE
+
+    #----------------------------------------------------------------------
+    def onPosition(self, vtSymbol, netChange, size, price):
+        """净持仓变化"""
+        net = self.netDict.get(vtSymbol, 0) + netChange
+        self.netDict[vtSymbol] = net
+        if price:
+            self.priceDict[vtSymbol] = price
+
+        value = abs(net) * size * self.priceDict.get(vtSymbol, 0)
+        self.notional += value - self.notionalDict.get(vtSymbol, 0)
+        self.notionalDict[vtSymbol] = value
+
+
+########################################################################
+class NetDeltaRule(PositionRule):
+    """净Delta"""
+    ruleType = RULE_NET_DELTA
+
+    #----------------------------------------------------------------------
+    def __init__(self, scope, key, limit):
+        """Constructor"""
+        super(NetDeltaRule, self).__init__(scope, key, limit)
+        self.delta = EMPTY_FLOAT        # 净Delta汇总
+
+    #----------------------------------------------------------------------
+    def check(self, orderReq, size):
+        """检查委托"""
+        net, newNet = self.getNewNet(orderReq)
+        delta = self.delta + (newNet - net) * size
+
+        if abs(delta) > self.limit and abs(delta) > abs(self.delta):
+            return u'%s委托后净Delta%s，超过限制%s' %(self.getName(), delta, self.limit)
+        return EMPTY_UNICODE
+
+    #----------------------------------------------------------------------
+    def onPosition(self, vtSymbol, netChange, size, price):
+        """净持仓变化"""
+        self.netDict[vtSymbol] = self.netDict.get(vtSymbol, 0) + netChange
+        self.delta += netChange * size
+
+
+# 规则类型和规则类的映射
+RULE_CLASS_DICT = {
+    RULE_ORDER_SIZE: OrderSizeRule,
+    RULE_TRADE_VOLUME: TradeVolumeRule,
+    RULE_CANCEL_COUNT: CancelCountRule,
+    RULE_POSITION_NOTIONAL: PositionNotionalRule,
+    RULE_NET_DELTA: NetDeltaRule
+}
+
+
+#----------------------------------------------------------------------
+def createRule(setting):
+    """基于配置字典创建规则"""
+    scope = setting['scope']
+    if scope not in SCOPE_LIST:
+        raise ValueError(u'不支持的规则作用范围：%s' % scope)
+
+    ruleType = setting['type']
+    if ruleType not in RULE_CLASS_DICT:
+        raise ValueError(u'不支持的规则类型：%s' % ruleType)
+
+    return RULE_CLASS_DICT[ruleType](scope, setting['key'], setting['limit'])
+
+
+########################################################################
+class RmPosition(object):
+    """单一接口单一合约的多空持仓，用于计算净持仓变化"""
+
+    #----------------------------------------------------------------------
+    def __init__(self):
+        """Constructor"""
+        self.longPos = EMPTY_INT
+        self.shortPos = EMPTY_INT
+        self.size = 1               # 合约乘数
+        self.price = EMPTY_FLOAT    # 最新持仓价格
+
+    #----------------------------------------------------------------------
+    def getNet(self):
+        """净持仓"""
+        return self.longPos - self.shortPos
+
+    #----------------------------------------------------------------------
+    def updateTrade(self, trade):
+        """成交更新，返回净持仓变化"""
+        self.price = trade.price
+        if trade.direction == DIRECTION_LONG:
+            if trade.offset == OFFSET_OPEN:
+                self.longPos += trade.volume
+            else:
+                self.shortPos -= trade.volume
+            return trade.volume
+        else:
+            if trade.offset == OFFSET_OPEN:
+                self.shortPos += trade.volume
+            else:
+                self.longPos -= trade.volume
+            return -trade.volume
+
+    #----------------------------------------------------------------------
+    def updatePosition(self, pos):
+        """持仓更新，返回净持仓变化"""
+        if pos.price:
+            self.price = pos.price
+        if pos.direction == DIRECTION_LONG:
+            change = pos.position - self.longPos
+            self.longPos = pos.position
+        elif pos.direction == DIRECTION_SHORT:
+            change = self.shortPos - pos.position
+            self.shortPos = pos.position
+        else:
+            change = 0
+        return change
+
+
+########################################################################
+class RuleBook(object):
+    """
+    规则簿
+    规则按(作用范围, 范围代码)编译为索引，再按(接口名称, vtSymbol)缓存适用的规则元组，
+    委托检查和成交、撤单、持仓更新时只需一次字典查询即可得到需要处理的规则
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self):
+        """Constructor"""
+        self.ruleList = []          # 全部规则
+        self.ruleIndex = {}         # (作用范围, 范围代码):[规则]
+        self.dispatchDict = {}      # (接口名称, vtSymbol):(规则)
+        self.accountDict = {}       # 接口名称:账户代码
+        self.posDict = {}           # (接口名称, vtSymbol):RmPosition
+
+    #----------------------------------------------------------------------
+    def loadRules(self, settingList):
+        """读取规则配置并编译索引，已有的持仓会推送给新规则，当日统计从0开始"""
+        self.ruleList = [createRule(setting) for setting in settingList]
+
+        self.ruleIndex = {}
+        for rule in self.ruleList:
+            self.ruleIndex.setdefault((rule.scope, rule.key), []).append(rule)
+
+        self.dispatchDict = {}
+
+        for (gatewayName, vtSymbol), pos in self.posDict.items():
+            net = pos.getNet()
+            for rule in self.getRules(gatewayName, vtSymbol):
+                rule.onPosition(vtSymbol, net, pos.size, pos.price)
+
+    #----------------------------------------------------------------------
+    def getSettingList(self):
+        """获取规则配置列表"""
+        return [rule.getSetting() for rule in self.ruleList]
+
+    #----------------------------------------------------------------------
+    def setAccount(self, gatewayName, accountID):
+        """
+        设置接口对应的账户代码，发生变化时清空规则缓存，
+        并将该接口已有的持仓推送给新适用的账户规则
+        """
+        oldAccountID = self.accountDict.get(gatewayName, EMPTY_STRING)
+        if oldAccountID == accountID:
+            return
+
+        self.accountDict[gatewayName] = accountID
+        self.dispatchDict = {}
+
+        oldRules = self.ruleIndex.get((SCOPE_ACCOUNT, oldAccountID), [])
+        newRules = self.ruleIndex.get((SCOPE_ACCOUNT, accountID), [])
+        if not oldRules and not newRules:
+            return
+
+        for (name, vtSymbol), pos in self.posDict.items():
+            if name != gatewayName:
+                continue
+
+            net = pos.getNet()
+            for rule in oldRules:
+                rule.onPosition(vtSymbol, -net, pos.size, pos.price)
+            for rule in newRules:
+                rule.onPosition(vtSymbol, net, pos.size, pos.price)
+
+    #----------------------------------------------------------------------
+    def getRules(self, gatewayName, vtSymbol):
+        """获取适用于某接口某合约的规则元组"""
+        key = (gatewayName, vtSymbol)
+        rules = self.dispatchDict.get(key, None)
+
+        if rules is None:
+            index = self.ruleIndex
+            product = getProduct(vtSymbol.split('.')[0])
+            accountID = self.accountDict.get(gatewayName, EMPTY_STRING)
+
+            l = index.get((SCOPE_GATEWAY, gatewayName), [])[:]
+            if accountID:
+                l.extend(index.get((SCOPE_ACCOUNT, accountID), []))
+            l.extend(index.get((SCOPE_PRODUCT, product), []))
+            l.extend(index.get((SCOPE_SYMBOL, vtSymbol), []))
+
+            rules = tuple(l)
+            self.dispatchDict[key] = rules
+
+        return rules
+
+    #----------------------------------------------------------------------
+    def check(self, orderReq, gatewayName, size):
+        """检查委托，通过返回空字符串，否则返回风控日志内容"""
+        for rule in self.getRules(gatewayName, orderReq.vtSymbol):
+            msg = rule.check(orderReq, size)
+            if msg:
+                return msg
+        return EMPTY_UNICODE
+
+    #----------------------------------------------------------------------
+    def getPosition(self, gatewayName, vtSymbol, size):
+        """获取持仓对象"""
+        key = (gatewayName, vtSymbol)
+        pos = self.posDict.get(key, None)
+        if not pos:
+            pos = RmPosition()
+            self.posDict[key] = pos
+        pos.size = size
+        return pos
+
+    #----------------------------------------------------------------------
+    def updateTrade(self, trade, size):
+        """成交更新"""
+        netChange = self.getPosition(trade.gatewayName, trade.vtSymbol, size).updateTrade(trade)
+
+        for rule in self.getRules(trade.gatewayName, trade.vtSymbol):
+            rule.onTrade(trade)
+            rule.onPosition(trade.vtSymbol, netChange, size, trade.price)
+
+    #----------------------------------------------------------------------
+    def updateCancel(self, order):
+        """撤单更新"""
+        for rule in self.getRules(order.gatewayName, order.vtSymbol):
+            rule.onCancel(order)
+
+    #----------------------------------------------------------------------
+    def updatePosition(self, pos, size):
+        """持仓更新"""
+        netChange = self.getPosition(pos.gatewayName, pos.vtSymbol, size).updatePosition(pos)
+        if not netChange and not pos.price:
+            return
+
+        for rule in self.getRules(pos.gatewayName, pos.vtSymbol):
+            rule.onPosition(pos.vtSymbol, netChange, size, pos.price)
+
+    #----------------------------------------------------------------------
+    def clear(self):
+        """清空当日统计"""
+        for rule in self.ruleList:
+            rule.clear()
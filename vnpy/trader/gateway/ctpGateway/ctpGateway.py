@@ -15,7 +15,7 @@ from datetime import datetime, timedelta
 
 from vnpy.api.ctp import MdApi, TdApi, defineDict
 from vnpy.trader.vtGateway import *
-from vnpy.trader.vtFunction import getJsonPath, getTempPath
+from vnpy.trader.vtFunction import getJsonPath, getTempPath, parseTickDatetime, getLocalDate
 from vnpy.trader.vtConstant import GATEWAYTYPE_FUTURES
 from .language import text
 
@@ -377,8 +377,8 @@ class CtpMdApi(MdApi):
         
         # 大商所日期转换
         if tick.exchange == EXCHANGE_DCE:
-            tick.date = datetime.now().strftime('%Y%m%d')
-
+            tick.date = getLocalDate()
+        
         # 上交所，SEE，股票期权相关
         if tick.exchange == EXCHANGE_SSE:
             tick.bidPrice2 = data['BidPrice2']
@@ -403,6 +403,13 @@ class CtpMdApi(MdApi):
 
             tick.date = data['TradingDay']
 
+        # 直接生成datetime对象（在日期最终确定后），下游引擎无需再解析时间字符串
+        # 日期或时间异常时保留为None，由下游引擎处理
+        try:
+            tick.datetime = parseTickDatetime(tick.date, data['UpdateTime'], data['UpdateMillisec'])
+        except ValueError:
+            pass
+
         self.gateway.onTick(tick)
         
     #---------------------------------------------------------------------- 
@@ -19,7 +19,7 @@ from futuquant import (OpenQuoteContext, OpenHKTradeContext, OpenUSTradeContext,
 
 from vnpy.trader.vtGateway import *
 from vnpy.trader.vtConstant import GATEWAYTYPE_INTERNATIONAL
-from vnpy.trader.vtFunction import getJsonPath
+from vnpy.trader.vtFunction import getJsonPath, parseTickDatetime
 
 
 # 调用一次datetime，保证初始化
@@ -427,7 +427,7 @@ class FutuGateway(VtGateway):
                 
             tick.date = row['data_date'].replace('-', '')
             tick.time = row['data_time']
-            tick.datetime = datetime.strptime(' '.join([tick.date, tick.time]), '%Y%m%d %H:%M:%S')
+            tick.datetime = parseTickDatetime(tick.date, tick.time)
             tick.openPrice = row['open_price']
             tick.highPrice = row['high_price']
             tick.lowPrice = row['low_price']
@@ -0,0 +1,344 @@
+# encoding: UTF-8
+
+'''
+本文件中包含了基于NumPy内存映射文件的列式行情数据存储。
+
+每个数据库名（对应数据周期，如VnTrader_1Min_Db）和合约代码保存为
+一个.npy结构化数组文件，按datetime排序，同目录下的.json文件保存
+合约代码等不随行变化的字段。
+
+读取时以只读方式内存映射文件，通过二分查找定位日期区间，返回的是
+映射数组的切片视图，不产生数据拷贝。
+'''
+
+import os
+import json
+from datetime import datetime
+
+import numpy as np
+
+from vnpy.trader.vtFunction import getTempPath
+from vnpy.trader.vtObject import VtTickData, VtBarData, VtCompactTickData, VtCompactBarData
+
+
+# 数据类型
+DATA_BAR = 'bar'
+DATA_TICK = 'tick'
+
+# K线结构化数组类型
+BAR_DTYPE = np.dtype([
+    ('datetime', 'datetime64[us]'),
+    ('open', 'f8'),
+    ('high', 'f8'),
+    ('low', 'f8'),
+    ('close', 'f8'),
+    ('volume', 'f8'),
+    ('openInterest', 'f8'),
+    ('date', 'U8'),
+    ('time', 'U15')
+])
+
+# Tick结构化数组类型
+TICK_DTYPE = np.dtype([
+    ('datetime', 'datetime64[us]'),
+    ('lastPrice', 'f8'),
+    ('lastVolume', 'f8'),
+    ('volume', 'f8'),
+    ('openInterest', 'f8'),
+    ('openPrice', 'f8'),
+    ('highPrice', 'f8'),
+    ('lowPrice', 'f8'),
+    ('preClosePrice', 'f8'),
+    ('upperLimit', 'f8'),
+    ('lowerLimit', 'f8'),
+    ('bidPrice1', 'f8'),
+    ('bidPrice2', 'f8'),
+    ('bidPrice3', 'f8'),
+    ('bidPrice4', 'f8'),
+    ('bidPrice5', 'f8'),
+    ('askPrice1', 'f8'),
+    ('askPrice2', 'f8'),
+    ('askPrice3', 'f8'),
+    ('askPrice4', 'f8'),
+    ('askPrice5', 'f8'),
+    ('bidVolume1', 'f8'),
+    ('bidVolume2', 'f8'),
+    ('bidVolume3', 'f8'),
+    ('bidVolume4', 'f8'),
+    ('bidVolume5', 'f8'),
+    ('askVolume1', 'f8'),
+    ('askVolume2', 'f8'),
+    ('askVolume3', 'f8'),
+    ('askVolume4', 'f8'),
+    ('askVolume5', 'f8'),
+    ('date', 'U8'),
+    ('time', 'U15')
+])
+
+DTYPE_DICT = {
+    DATA_BAR: BAR_DTYPE,
+    DATA_TICK: TICK_DTYPE
+}
+
+CLASS_DICT = {
+    DATA_BAR: VtBarData,
+    DATA_TICK: VtTickData
+}
+
+COMPACT_CLASS_DICT = {
+    DATA_BAR: VtCompactBarData,
+    DATA_TICK: VtCompactTickData
+}
+
+# 不随行变化、保存在元数据文件中的字段
+META_FIELDS = ['vtSymbol', 'symbol', 'exchange', 'gatewayName', 'interval']
+
+
+########################################################################
+class ColumnarStore(object):
+    """
+    列式行情数据存储
+    文件布局：path/dbName/symbol.npy + path/dbName/symbol.json
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, path=''):
+        """Constructor"""
+        if not path:
+            path = getTempPath('columnarStore')
+        self.path = path
+
+        self.arrayDict = {}     # 已打开的内存映射数组缓存，key为(dbName, symbol)
+        self.metaDict = {}      # 元数据缓存
+
+    #----------------------------------------------------------------------
+    def getFilePath(self, dbName, symbol, suffix='.npy'):
+        """获取数据文件路径"""
+        return os.path.join(self.path, dbName, symbol + suffix)
+
+    #----------------------------------------------------------------------
+    def hasData(self, dbName, symbol):
+        """检查是否存在数据文件"""
+        return os.path.isfile(self.getFilePath(dbName, symbol))
+
+    #----------------------------------------------------------------------
+    def loadMeta(self, dbName, symbol):
+        """读取元数据"""
+        key = (dbName, symbol)
+        if key not in self.metaDict:
+            with open(self.getFilePath(dbName, symbol, '.json')) as f:
+                self.metaDict[key] = json.load(f)
+        return self.metaDict[key]
+
+    #----------------------------------------------------------------------
+    def loadArray(self, dbName, symbol):
+        """以只读方式内存映射整个数据文件"""
+        key = (dbName, symbol)
+        if key not in self.arrayDict:
+            self.arrayDict[key] = np.load(self.getFilePath(dbName, symbol), mmap_mode='r')
+        return self.arrayDict[key]
+
+    #----------------------------------------------------------------------
+    def loadRange(self, dbName, symbol, start=None, end=None, includeEnd=True):
+        """
+        读取日期区间内的数据，返回内存映射数组的切片视图（无拷贝）
+        start/end为datetime对象，为None时表示不限制
+        """
+        array = self.loadArray(dbName, symbol)
+        index = array['datetime']
+
+        if start is None:
+            startPos = 0
+        else:
+            startPos = index.searchsorted(np.datetime64(start, 'us'), side='left')
+
+        if end is None:
+            endPos = len(array)
+        elif includeEnd:
+            endPos = index.searchsorted(np.datetime64(end, 'us'), side='right')
+        else:
+            endPos = index.searchsorted(np.datetime64(end, 'us'), side='left')
+
+        return array[startPos:endPos]
+
+    #----------------------------------------------------------------------
+    def iterData(self, dbName, symbol, array, chunkSize=10000, compact=False):
+        """
+        将结构化数组逐行转换为VtBarData/VtTickData对象的生成器
+        按块转换，避免一次性为整个区间创建Python对象
+        compact为True时生成VtCompactBarData/VtCompactTickData对象
+        """
+        meta = self.loadMeta(dbName, symbol)
+        if compact:
+            dataClass = COMPACT_CLASS_DICT[meta['dataType']]
+        else:
+            dataClass = CLASS_DICT[meta['dataType']]
+
+        # 以数据类的默认值为模板，填入元数据字段
+        template = dataClass().__dict__
+        for name in META_FIELDS:
+            if name in meta:
+                template[name] = meta[name]
+
+        names = array.dtype.names
+        for i in range(0, len(array), chunkSize):
+            for values in array[i:i+chunkSize].tolist():
+                d = template.copy()
+                d.update(zip(names, values))
+
+                if compact:
+                    yield dataClass.fromDict(d)
+                else:
+                    data = dataClass.__new__(dataClass)
+                    data.__dict__ = d
+                    yield data
+
+    #----------------------------------------------------------------------
+    def deleteData(self, dbName, symbol):
+        """删除数据文件"""
+        key = (dbName, symbol)
+        self.arrayDict.pop(key, None)
+        self.metaDict.pop(key, None)
+
+        for suffix in ['.npy', '.json']:
+            filePath = self.getFilePath(dbName, symbol, suffix)
+            if os.path.isfile(filePath):
+                os.remove(filePath)
+
+    #----------------------------------------------------------------------
+    def writeArray(self, dbName, symbol, array, meta):
+        """
+        写入数据，与已有数据合并，按datetime排序并去重（后写入的覆盖先写入的）
+        meta中必须包含dataType字段
+        """
+        key = (dbName, symbol)
+
+        if self.hasData(dbName, symbol):
+            old = np.load(self.getFilePath(dbName, symbol))
+            array = np.concatenate([old, array.astype(old.dtype)])
+
+        # 稳定排序后，同一时间戳取最后一条
+        array = array[np.argsort(array['datetime'], kind='mergesort')]
+        if len(array):
+            index = array['datetime']
+            keep = np.ones(len(array), dtype=bool)
+            keep[:-1] = index[1:] != index[:-1]
+            array = array[keep]
+
+        # 关闭缓存的映射，防止Windows下替换文件失败
+        self.arrayDict.pop(key, None)
+        self.metaDict.pop(key, None)
+
+        folder = os.path.join(self.path, dbName)
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+        # 先写临时文件再替换，防止写入过程中断导致文件损坏
+        filePath = self.getFilePath(dbName, symbol)
+        tempPath = filePath + '.tmp'
+        with open(tempPath, 'wb') as f:
+            np.save(f, array)
+        replaceFile(tempPath, filePath)
+
+        with open(self.getFilePath(dbName, symbol, '.json'), 'w') as f:
+            json.dump(meta, f)
+
+        return len(array)
+
+    #----------------------------------------------------------------------
+    def writeData(self, dbName, symbol, dataList, dataType):
+        """写入VtBarData/VtTickData对象或Mongo文档字典的列表"""
+        dList = [d if isinstance(d, dict) else d.__dict__ for d in dataList]
+        if not dList:
+            return 0
+
+        array = documentsToArray(dList, DTYPE_DICT[dataType])
+
+        meta = {'dataType': dataType}
+        for name in META_FIELDS:
+            if name in dList[0]:
+                meta[name] = dList[0][name]
+
+        return self.writeArray(dbName, symbol, array, meta)
+
+    #----------------------------------------------------------------------
+    def convertFromMongo(self, dbClient, dbName, symbol, start=None, end=None,
+                         chunkSize=100000, output=None):
+        """
+        将MongoDB中已有的数据集合转换为列式存储文件
+        output为输出转换进度的函数（如引擎的output或writeLog），传入进度字符串
+        """
+        collection = dbClient[dbName][symbol]
+
+        flt = {}
+        if start or end:
+            flt['datetime'] = {}
+            if start:
+                flt['datetime']['$gte'] = start
+            if end:
+                flt['datetime']['$lte'] = end
+
+        cursor = collection.find(flt, projection={'_id': False}).sort('datetime')
+
+        arrayList = []
+        meta = None
+        dtype = None
+        buf = []
+
+        for d in cursor:
+            # 根据第一条数据判断是Tick还是K线
+            if meta is None:
+                if 'lastPrice' in d:
+                    dataType = DATA_TICK
+                else:
+                    dataType = DATA_BAR
+                dtype = DTYPE_DICT[dataType]
+
+                meta = {'dataType': dataType}
+                for name in META_FIELDS:
+                    if name in d:
+                        meta[name] = d[name]
+
+            buf.append(d)
+            if len(buf) >= chunkSize:
+                arrayList.append(documentsToArray(buf, dtype))
+                buf = []
+                if output:
+                    output(u'%s %s 已转换：%s' % (dbName, symbol, len(arrayList)*chunkSize))
+
+        if meta is None:
+            return 0
+
+        if buf:
+            arrayList.append(documentsToArray(buf, dtype))
+
+        return self.writeArray(dbName, symbol, np.concatenate(arrayList), meta)
+
+
+#----------------------------------------------------------------------
+def documentsToArray(dList, dtype):
+    """将数据字典的列表转换为结构化数组"""
+    array = np.zeros(len(dList), dtype=dtype)
+
+    for name in dtype.names:
+        kind = dtype.fields[name][0].kind
+
+        if kind == 'M':
+            array[name] = [d.get(name) for d in dList]
+        elif kind == 'U':
+            array[name] = [d.get(name) or '' for d in dList]
+        else:
+            array[name] = [float(d.get(name) or 0) for d in dList]
+
+    return array
+
+
+#----------------------------------------------------------------------
+def replaceFile(src, dst):
+    """原子替换文件，兼容Python 2"""
+    try:
+        os.replace(src, dst)
+    except AttributeError:
+        if os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
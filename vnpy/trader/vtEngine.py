@@ -5,9 +5,12 @@ from __future__ import division
 import os
 import shelve
 import logging
-from collections import OrderedDict
+from collections import OrderedDict, defaultdict, deque
 from datetime import datetime
 from copy import copy
+from queue import Queue, Empty, Full
+from threading import Thread
+from time import time as currentTime
 
 from pymongo import MongoClient, ASCENDING
 from pymongo.errors import ConnectionFailure
@@ -178,6 +181,10 @@ class MainEngine(object):
         
         # 保存数据引擎里的合约数据到硬盘
         self.dataEngine.saveContracts()
+        
+        # 停止日志引擎，写出队列中剩余的日志
+        if self.logEngine:
+            self.logEngine.stop()
     
     #----------------------------------------------------------------------
     def writeLog(self, content):
@@ -220,6 +227,22 @@ class MainEngine(object):
         else:
             self.writeLog(text.DATA_INSERT_FAILED)
     
+    #----------------------------------------------------------------------
+    def dbInsertMany(self, dbName, collectionName, dList, ordered=False):
+        """
+        向MongoDB中批量插入数据，dList是数据字典的列表，返回成功插入的数量
+        ordered为False时单条数据插入失败（如键值重复）不影响其他数据，
+        部分插入失败时抛出BulkWriteError，成功数量见异常的details['nInserted']
+        """
+        if self.dbClient:
+            db = self.dbClient[dbName]
+            collection = db[collectionName]
+            result = collection.insert_many(dList, ordered=ordered)
+            return len(result.inserted_ids)
+        else:
+            self.writeLog(text.DATA_INSERT_FAILED)
+            return 0
+    
     #----------------------------------------------------------------------
     def dbQuery(self, dbName, collectionName, d, sortKey='', sortDirection=ASCENDING):
         """从MongoDB中读取数据，d是查询要求，返回的是数据库查询的指针"""
@@ -367,6 +390,10 @@ class MainEngine(object):
             
         if globalSetting['logFile']:
             self.logEngine.addFileHandler()
+        
+        # 启动异步输出，终端和文件的写入不占用事件引擎线程
+        if globalSetting.get('logAsync', True):
+            self.logEngine.startAsync(globalSetting.get('logQueueSize', 100000))
             
         # 注册事件监听
         self.registerLogEvent(EVENT_LOG)
@@ -414,12 +441,19 @@ class DataEngine(object):
         self.tradeDict = {}
         self.accountDict = {}
         self.positionDict = {}
-        self.logList = []
-        self.errorList = []
+        
+        # 日志和错误只保留最近的记录，避免长期运行时内存无限增长
+        self.logList = deque(maxlen=globalSetting.get('logCapacity', 10000))
+        self.errorList = deque(maxlen=globalSetting.get('errorCapacity', 1000))
+        
+        # 日志限流，每个来源每秒最多保存logRateLimit条WARNING以下级别的日志，为0则不限流
+        self.logRateLimit = globalSetting.get('logRateLimit', 0)
+        self.logRateDict = {}       # 来源:[当前秒, 当前秒已保存数量, 当前秒限流数量]
         
         # 持仓细节相关
         self.detailDict = {}                                # vtSymbol:PositionDetail
         self.tdPenaltyList = globalSetting['tdPenalty']     # 平今手续费惩罚的产品代码列表
+        self.frozenCheck = False                            # 是否校验增量计算的冻结量
         
         # 读取保存在硬盘的合约数据
         self.loadContracts()
@@ -469,6 +503,17 @@ class DataEngine(object):
         # 更新到持仓细节中
         detail = self.getPositionDetail(order.vtSymbol)
         detail.updateOrder(order)            
+        
+        # 校验模式下，全量重算冻结量并和增量结果比较
+        if self.frozenCheck and not detail.checkFrozen():
+            log = VtLogData()
+            log.gatewayName = order.gatewayName
+            log.logContent = u'%s冻结量增量计算结果不一致，已重新计算' %order.vtSymbol
+            log.logLevel = logging.WARNING
+            
+            event = Event(type_=EVENT_LOG)
+            event.dict_['data'] = log
+            self.eventEngine.put(event)
             
     #----------------------------------------------------------------------
     def processTradeEvent(self, event):
@@ -502,8 +547,45 @@ class DataEngine(object):
     def processLogEvent(self, event):
         """处理日志事件"""
         log = event.dict_['data']
+        
+        if (self.logRateLimit and log.logLevel < logging.WARNING and 
+            not self.checkLogRate(self.getLogSource(event), log)):
+            return
+        
         self.logList.append(log)
     
+    #----------------------------------------------------------------------
+    def getLogSource(self, event):
+        """
+        获取日志来源，用于分别限流
+        Gateway和各个引擎发出的日志以gatewayName作为来源名称，为空时使用事件类型区分
+        """
+        return event.dict_['data'].gatewayName or event.type_
+    
+    #----------------------------------------------------------------------
+    def checkLogRate(self, source, log):
+        """检查日志限流，返回是否保存该日志"""
+        now = int(currentTime())
+        l = self.logRateDict.get(source, None)
+        
+        # 进入新的一秒时，汇总上一秒被限流的日志数量
+        if not l or l[0] != now:
+            if l and l[2]:
+                summary = VtLogData()
+                summary.gatewayName = log.gatewayName
+                summary.logContent = u'日志限流，%s %s有%s条日志未保存' %(source, datetime.fromtimestamp(l[0]).strftime('%H:%M:%S'), l[2])
+                self.logList.append(summary)
+            
+            l = [now, 0, 0]
+            self.logRateDict[source] = l
+        
+        if l[1] >= self.logRateLimit:
+            l[2] += 1
+            return False
+        
+        l[1] += 1
+        return True
+    
     #----------------------------------------------------------------------
     def processErrorEvent(self, event):
         """处理错误事件"""
@@ -613,6 +695,11 @@ class DataEngine(object):
         """查询所有本地持仓缓存细节"""
         return self.detailDict.values()
     
+    #----------------------------------------------------------------------
+    def setFrozenCheck(self, active):
+        """设置是否在每次委托更新时校验持仓冻结量，用于排查问题，会降低性能"""
+        self.frozenCheck = active
+    
     #----------------------------------------------------------------------
     def updateOrderReq(self, req, vtOrderID):
         """委托请求更新"""
@@ -633,12 +720,12 @@ class DataEngine(object):
     #----------------------------------------------------------------------
     def getLog(self):
         """获取日志"""
-        return self.logList
+        return list(self.logList)
     
     #----------------------------------------------------------------------
     def getError(self):
         """获取错误"""
-        return self.errorList
+        return list(self.errorList)
     
 
 ########################################################################    
@@ -665,6 +752,11 @@ class LogEngine(object):
         self.consoleHandler = None
         self.fileHandler = None
         
+        # 异步输出相关
+        self.queue = None           # 日志队列，为None时在调用线程中同步输出
+        self.thread = None          # 输出线程
+        self.dropCount = 0          # 队列已满时丢弃的日志数量
+        
         # 添加NullHandler防止无handler的错误输出
         nullHandler = logging.NullHandler()
         self.logger.addHandler(nullHandler)    
@@ -741,7 +833,57 @@ class LogEngine(object):
         log = event.dict_['data']
         function = self.levelFunctionDict[log.logLevel]     # 获取日志级别对应的处理函数
         msg = '\t'.join([log.gatewayName, log.logContent])
-        function(msg)
+        
+        if not self.queue:
+            function(msg)
+            return
+        
+        try:
+            self.queue.put_nowait((function, msg))
+        except Full:
+            self.dropCount += 1
+    
+    #----------------------------------------------------------------------
+    def startAsync(self, maxSize=100000):
+        """启动异步输出线程"""
+        if self.thread:
+            return
+        
+        self.queue = Queue(maxsize=maxSize)
+        self.thread = Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+    
+    #----------------------------------------------------------------------
+    def run(self):
+        """输出线程的主循环，收到None时退出"""
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            
+            function, msg = item
+            try:
+                function(msg)
+            except Exception:
+                pass
+            
+            # 报告队列满时丢弃的日志数量
+            if self.dropCount and self.queue.empty():
+                count, self.dropCount = self.dropCount, 0
+                self.warn(u'日志队列已满，丢弃%s条日志' %count)
+    
+    #----------------------------------------------------------------------
+    def stop(self):
+        """停止异步输出，等待队列中的日志全部写出"""
+        if not self.thread:
+            return
+        
+        self.queue.put(None)
+        self.thread.join()
+        
+        self.queue = None
+        self.thread = None
   
     
 ########################################################################
@@ -793,6 +935,10 @@ class PositionDetail(object):
         
         self.workingOrderDict = {}
         
+        # 冻结量的增量计算相关
+        self.orderFrozenDict = {}                   # vtOrderID:(方向, 开平, 剩余冻结量)
+        self.frozenSumDict = defaultdict(int)       # (方向, 开平):剩余冻结量之和
+        
     #----------------------------------------------------------------------
     def updateTrade(self, trade):
         """成交更新"""
@@ -847,6 +993,7 @@ class PositionDetail(object):
         self.calculatePrice(trade)
         self.calculatePosition()
         self.calculatePnl()
+        self.calculateFrozen()
     
     #----------------------------------------------------------------------
     def updateOrder(self, order):
@@ -854,13 +1001,16 @@ class PositionDetail(object):
         # 将活动委托缓存下来
         if order.status in self.WORKING_STATUS:
             self.workingOrderDict[order.vtOrderID] = order
+            frozenVolume = order.totalVolume - order.tradedVolume
             
         # 移除缓存中已经完成的委托
         else:
             if order.vtOrderID in self.workingOrderDict:
                 del self.workingOrderDict[order.vtOrderID]
+            frozenVolume = 0
                 
         # 计算冻结
+        self.updateFrozen(order.vtOrderID, order.direction, order.offset, frozenVolume)
         self.calculateFrozen()
     
     #----------------------------------------------------------------------
@@ -878,6 +1028,8 @@ class PositionDetail(object):
             self.shortTd = self.shortPos - self.shortYd
             self.shortPnl = pos.positionProfit
             self.shortPrice = pos.price
+        
+        self.calculateFrozen()
             
     #----------------------------------------------------------------------
     def updateOrderReq(self, req, vtOrderID):
@@ -898,6 +1050,7 @@ class PositionDetail(object):
         self.workingOrderDict[vtOrderID] = order
         
         # 计算冻结量
+        self.updateFrozen(vtOrderID, order.direction, order.offset, order.totalVolume)
         self.calculateFrozen()
         
     #----------------------------------------------------------------------
@@ -941,55 +1094,78 @@ class PositionDetail(object):
         self.shortPos = self.shortTd + self.shortYd      
         
     #----------------------------------------------------------------------
-    def calculateFrozen(self):
-        """计算冻结情况"""
-        # 清空冻结数据
-        self.longPosFrozen = EMPTY_INT
-        self.longYdFrozen = EMPTY_INT
-        self.longTdFrozen = EMPTY_INT
-        self.shortPosFrozen = EMPTY_INT
-        self.shortYdFrozen = EMPTY_INT
-        self.shortTdFrozen = EMPTY_INT     
+    def updateFrozen(self, vtOrderID, direction, offset, frozenVolume):
+        """更新单个委托的剩余冻结量，冻结量为0表示委托已结束"""
+        # 移除该委托原有的冻结量
+        old = self.orderFrozenDict.pop(vtOrderID, None)
+        if old:
+            self.frozenSumDict[(old[0], old[1])] -= old[2]
         
-        # 遍历统计
+        # 加入新的冻结量
+        if frozenVolume:
+            self.orderFrozenDict[vtOrderID] = (direction, offset, frozenVolume)
+            self.frozenSumDict[(direction, offset)] += frozenVolume
+        
+    #----------------------------------------------------------------------
+    def calculateFrozen(self):
+        """
+        计算冻结情况
+        基于按方向和开平汇总的剩余冻结量计算，和活动委托数量无关，
+        平仓委托优先冻结今仓，今仓不足的部分冻结昨仓
+        """
+        d = self.frozenSumDict
+        
+        # 多头委托冻结空头持仓
+        self.shortTdFrozen, self.shortYdFrozen = self.splitFrozen(d[(DIRECTION_LONG, OFFSET_CLOSETODAY)],
+                                                                  d[(DIRECTION_LONG, OFFSET_CLOSEYESTERDAY)],
+                                                                  d[(DIRECTION_LONG, OFFSET_CLOSE)],
+                                                                  self.shortTd)
+        
+        # 空头委托冻结多头持仓
+        self.longTdFrozen, self.longYdFrozen = self.splitFrozen(d[(DIRECTION_SHORT, OFFSET_CLOSETODAY)],
+                                                                d[(DIRECTION_SHORT, OFFSET_CLOSEYESTERDAY)],
+                                                                d[(DIRECTION_SHORT, OFFSET_CLOSE)],
+                                                                self.longTd)
+        
+        # 汇总今昨冻结
+        self.longPosFrozen = self.longYdFrozen + self.longTdFrozen
+        self.shortPosFrozen = self.shortYdFrozen + self.shortTdFrozen
+        
+    #----------------------------------------------------------------------
+    def splitFrozen(self, closeTdVolume, closeYdVolume, closeVolume, td):
+        """计算今昨冻结量，返回(今仓冻结, 昨仓冻结)"""
+        tdFrozen = closeTdVolume + closeVolume
+        ydFrozen = closeYdVolume
+        
+        # 平仓委托冻结的今仓超出今仓数量时，超出部分冻结昨仓
+        if closeVolume and tdFrozen > td:
+            ydFrozen += tdFrozen - td
+            tdFrozen = td
+        
+        return tdFrozen, ydFrozen
+        
+    #----------------------------------------------------------------------
+    def checkFrozen(self):
+        """
+        基于活动委托全量重算冻结量，和增量计算结果比较
+        结果一致返回True，否则使用重算结果修正并返回False
+        """
+        d = defaultdict(int)
         for order in self.workingOrderDict.values():
-            # 计算剩余冻结量
-            frozenVolume = order.totalVolume - order.tradedVolume
-            
-            # 多头委托
-            if order.direction is DIRECTION_LONG:
-                # 平今
-                if order.offset is OFFSET_CLOSETODAY:
-                    self.shortTdFrozen += frozenVolume
-                # 平昨
-                elif order.offset is OFFSET_CLOSEYESTERDAY:
-                    self.shortYdFrozen += frozenVolume
-                # 平仓
-                elif order.offset is OFFSET_CLOSE:
-                    self.shortTdFrozen += frozenVolume
-                    
-                    if self.shortTdFrozen > self.shortTd:
-                        self.shortYdFrozen += (self.shortTdFrozen - self.shortTd)
-                        self.shortTdFrozen = self.shortTd
-            # 空头委托
-            elif order.direction is DIRECTION_SHORT:
-                # 平今
-                if order.offset is OFFSET_CLOSETODAY:
-                    self.longTdFrozen += frozenVolume
-                # 平昨
-                elif order.offset is OFFSET_CLOSEYESTERDAY:
-                    self.longYdFrozen += frozenVolume
-                # 平仓
-                elif order.offset is OFFSET_CLOSE:
-                    self.longTdFrozen += frozenVolume
-                    
-                    if self.longTdFrozen > self.longTd:
-                        self.longYdFrozen += (self.longTdFrozen - self.longTd)
-                        self.longTdFrozen = self.longTd
-                        
-            # 汇总今昨冻结
-            self.longPosFrozen = self.longYdFrozen + self.longTdFrozen
-            self.shortPosFrozen = self.shortYdFrozen + self.shortTdFrozen
+            d[(order.direction, order.offset)] += order.totalVolume - order.tradedVolume
+        
+        keys = set(d.keys()) | set(self.frozenSumDict.keys())
+        consistent = all([d[key] == self.frozenSumDict[key] for key in keys])
+        
+        if not consistent:
+            self.orderFrozenDict = {}
+            self.frozenSumDict = defaultdict(int)
+            for vtOrderID, order in self.workingOrderDict.items():
+                self.updateFrozen(vtOrderID, order.direction, order.offset,
+                                  order.totalVolume - order.tradedVolume)
+            self.calculateFrozen()
+        
+        return consistent
             
     #----------------------------------------------------------------------
     def convertOrderReq(self, req):
@@ -8,7 +8,7 @@ import os
 import decimal
 import json
 import traceback
-from datetime import datetime
+from datetime import datetime, timedelta
 from math import isnan
 
 from six import text_type
@@ -37,6 +37,54 @@ def todayDate():
     return datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)    
 
 
+# Tick日期解析缓存，key为YYYYMMDD字符串，value为(年, 月, 日)
+tickDateDict = {}
+
+#----------------------------------------------------------------------
+def parseTickDatetime(date, time, millisecond=None):
+    """
+    将Tick的日期（YYYYMMDD）和时间（HH:MM:SS或HH:MM:SS.f）字符串解析为datetime对象
+    日期部分按交易日缓存，时间部分直接切片转换为整数，避免使用strptime
+    传入millisecond时time只包含HH:MM:SS，毫秒数直接使用该值（如CTP的UpdateMillisec）
+    """
+    ymd = tickDateDict.get(date, None)
+    if not ymd:
+        ymd = (int(date[0:4]), int(date[4:6]), int(date[6:8]))
+        tickDateDict[date] = ymd
+    
+    # 小时为一位数等非标准格式
+    if time[2:3] != ':':
+        hms, _, fraction = time.partition('.')
+        hour, minute, second = [int(x) for x in hms.split(':')]
+    else:
+        hour = int(time[0:2])
+        minute = int(time[3:5])
+        second = int(time[6:8])
+        fraction = time[9:]
+    
+    if millisecond is not None:
+        microsecond = int(millisecond) * 1000
+    elif fraction:
+        microsecond = int(fraction[:6].ljust(6, '0'))
+    else:
+        microsecond = 0
+    
+    return datetime(ymd[0], ymd[1], ymd[2], hour, minute, second, microsecond)
+
+
+# 本地日期字符串缓存，[日期字符串, 缓存失效时间]
+localDateCache = ['', datetime.min]
+
+#----------------------------------------------------------------------
+def getLocalDate():
+    """获取本机日期字符串（YYYYMMDD），在日期变化前只生成一次"""
+    now = datetime.now()
+    if now >= localDateCache[1]:
+        localDateCache[0] = now.strftime('%Y%m%d')
+        localDateCache[1] = now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    return localDateCache[0]
+
+
 # 图标路径
 iconPathDict = {}
 
@@ -27,10 +27,12 @@ class VtGateway(object):
         event1.dict_['data'] = tick
         self.eventEngine.put(event1)
         
-        # 特定合约代码的事件
-        event2 = Event(type_=EVENT_TICK+tick.vtSymbol)
-        event2.dict_['data'] = tick
-        self.eventEngine.put(event2)
+        # 特定合约代码的事件，只在有函数监听时才创建
+        type_ = EVENT_TICK + tick.vtSymbol
+        if self.eventEngine.hasHandler(type_):
+            event2 = Event(type_=type_)
+            event2.dict_['data'] = tick
+            self.eventEngine.put(event2)
     
     #----------------------------------------------------------------------
     def onTrade(self, trade):
@@ -95,6 +97,10 @@ class VtGateway(object):
     #----------------------------------------------------------------------
     def onLog(self, log):
         """日志推送"""
+        # 未设置来源的日志使用Gateway名称，便于日志按来源限流
+        if not log.gatewayName:
+            log.gatewayName = self.gatewayName
+        
         # 通用事件
         event1 = Event(type_=EVENT_LOG)
         event1.dict_['data'] = log
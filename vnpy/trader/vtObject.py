@@ -134,6 +134,86 @@ class VtBarData(VtBaseData):
         self.interval = EMPTY_UNICODE       # K线周期
     
 
+########################################################################
+class VtCompactData(object):
+    """
+    基于__slots__的紧凑数据类基类，属性和对应的普通数据类保持一致，
+    不为每个对象创建__dict__，适合在内存中保存大量Tick或K线数据。
+    
+    为了兼容已有代码中对__dict__的使用，提供了同名属性：读取时返回包含
+    所有字段的新字典，赋值时从字典中读取同名字段（忽略MongoDB的_id等多余字段）。
+    子类不能添加新的属性。
+    """
+    
+    __slots__ = ()
+    fieldList = []          # (字段名, 默认值)列表，由子类定义
+
+    #----------------------------------------------------------------------
+    def __init__(self):
+        """Constructor"""
+        for name, default in self.fieldList:
+            setattr(self, name, default)
+    
+    #----------------------------------------------------------------------
+    @classmethod
+    def fromDict(cls, d):
+        """从数据字典（如MongoDB查询结果）创建对象，缺少的字段使用默认值"""
+        obj = cls.__new__(cls)
+        get = d.get
+        set_ = setattr              # 回测中每条数据都会调用，使用局部变量减少查找开销
+        for name, default in cls.fieldList:
+            set_(obj, name, get(name, default))
+        return obj
+    
+    #----------------------------------------------------------------------
+    @property
+    def __dict__(self):
+        """返回包含所有字段的字典"""
+        return dict([(name, getattr(self, name)) for name in self.__slots__])
+    
+    #----------------------------------------------------------------------
+    @__dict__.setter
+    def __dict__(self, d):
+        """从字典中读取字段"""
+        for name in self.__slots__:
+            if name in d:
+                setattr(self, name, d[name])
+    
+    #----------------------------------------------------------------------
+    def __getstate__(self):
+        """序列化"""
+        return [getattr(self, name) for name in self.__slots__]
+    
+    #----------------------------------------------------------------------
+    def __setstate__(self, state):
+        """反序列化"""
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+    
+    #----------------------------------------------------------------------
+    def __copy__(self):
+        """浅拷贝"""
+        obj = self.__class__.__new__(self.__class__)
+        obj.__setstate__(self.__getstate__())
+        return obj
+
+
+########################################################################
+class VtCompactTickData(VtCompactData):
+    """紧凑的Tick行情数据类，字段和VtTickData一致"""
+    
+    fieldList = list(VtTickData().__dict__.items())
+    __slots__ = tuple([name for name, default in fieldList])
+    
+    
+########################################################################
+class VtCompactBarData(VtCompactData):
+    """紧凑的K线数据类，字段和VtBarData一致"""
+    
+    fieldList = list(VtBarData().__dict__.items())
+    __slots__ = tuple([name for name, default in fieldList])
+
+
 ########################################################################
 class VtTradeData(VtBaseData):
     """
@@ -482,6 +562,7 @@ class VtOrderReq(object):
         self.priceType = EMPTY_STRING           # 价格类型
         self.direction = EMPTY_STRING           # 买卖
         self.offset = EMPTY_STRING              # 开平
+        self.strategyName = EMPTY_UNICODE       # 发单的策略名称，用于风控按策略统计
         
         # 以下为IB相关
         self.productClass = EMPTY_UNICODE       # 合约类型
@@ -0,0 +1,210 @@
+# encoding: UTF-8
+
+'''
+本文件中包含了基于NumPy的批量K线合成工具，用于从大量历史Tick数据重建K线。
+
+输入输出均为vtDataStore中定义的结构化数组（TICK_DTYPE/BAR_DTYPE），
+可以直接使用ColumnarStore.loadRange读取的数据段，结果也可以直接通过
+ColumnarStore.writeArray保存。
+
+合成规则和BarGenerator保持一致：
+1. Tick合成1分钟K线时，以分钟数变化作为新K线的开始，成交量为相邻Tick
+   累计成交量之差（小于0时记为0），K线时间戳为最后一个Tick时间取整到分钟
+2. 1分钟K线合成X分钟K线时，(minute+1) % X == 0的K线为X分钟K线的最后一根，
+   成交量取整后累加，K线时间戳为第一根1分钟K线的时间
+3. 最后一根尚未结束的K线默认不输出（BarGenerator只在下一根K线开始时推送），
+   需要时可以传入includeLast=True
+'''
+
+from datetime import timedelta
+
+import numpy as np
+
+from vnpy.trader.vtDataStore import BAR_DTYPE, TICK_DTYPE, documentsToArray
+from vnpy.trader.vtObject import VtBarData
+
+
+# 合成周期
+INTERVAL_MINUTE = 'minute'
+INTERVAL_HOUR = 'hour'
+INTERVAL_DAILY = 'daily'
+
+# Tick合成K线需要的字段
+RESAMPLE_TICK_DTYPE = np.dtype([(name, TICK_DTYPE.fields[name][0])
+                                for name in ['datetime', 'lastPrice', 'volume', 'openInterest']])
+
+
+#----------------------------------------------------------------------
+def resampleTicks(ticks, includeLast=False):
+    """
+    Tick合成1分钟K线
+    ticks为TICK_DTYPE结构化数组，或者VtTickData对象/数据字典的列表
+    """
+    # 对象列表只转换合成需要的字段
+    if not isinstance(ticks, np.ndarray):
+        ticks = documentsToArray([d if isinstance(d, dict) else d.__dict__ for d in ticks],
+                                 RESAMPLE_TICK_DTYPE)
+
+    n = len(ticks)
+    if not n:
+        return np.zeros(0, dtype=BAR_DTYPE)
+
+    stamp = ticks['datetime'].astype('datetime64[m]')
+    minute = stamp.astype(np.int64) % 60
+
+    # 每根K线在Tick序列中的开始和结束位置（结束位置不包含）
+    startArray = np.flatnonzero(np.concatenate([[True], minute[1:] != minute[:-1]]))
+    endArray = np.append(startArray[1:], n)
+
+    if not includeLast:
+        startArray = startArray[:-1]
+        endArray = endArray[:-1]
+    if not len(startArray):
+        return np.zeros(0, dtype=BAR_DTYPE)
+
+    stop = endArray[-1]
+    price = ticks['lastPrice'][:stop]
+    lastArray = endArray - 1
+
+    # 每个Tick的成交量变化，第一个Tick没有上一Tick，记为0
+    volume = ticks['volume'][:stop]
+    volumeChange = np.zeros(stop)
+    volumeChange[1:] = np.maximum(volume[1:] - volume[:-1], 0)
+
+    bars = np.zeros(len(startArray), dtype=BAR_DTYPE)
+    bars['datetime'] = stamp[lastArray]
+    bars['open'] = price[startArray]
+    bars['high'] = np.maximum.reduceat(price, startArray)
+    bars['low'] = np.minimum.reduceat(price, startArray)
+    bars['close'] = price[lastArray]
+    bars['volume'] = np.add.reduceat(volumeChange, startArray)
+    bars['openInterest'] = ticks['openInterest'][lastArray]
+    bars['date'], bars['time'] = formatDatetime(bars['datetime'])
+
+    return bars
+
+
+#----------------------------------------------------------------------
+def resampleBars(bars, window, interval=INTERVAL_MINUTE, sessionStart=None,
+                 includeLast=False):
+    """
+    1分钟K线合成更大周期的K线，bars为BAR_DTYPE结构化数组
+
+    interval为INTERVAL_MINUTE时，window为X分钟，使用BarGenerator的(minute+1) % X规则
+    interval为INTERVAL_HOUR时，window为X小时，以sessionStart（datetime.time）
+    为每小时的起点，如股票可以传入time(9, 30)
+    interval为INTERVAL_DAILY时，以sessionStart作为交易日的开始，如期货夜盘传入
+    time(21, 0)，周五夜盘会归入下周一的交易日
+    """
+    n = len(bars)
+    if not n:
+        return np.zeros(0, dtype=BAR_DTYPE)
+
+    stamp = bars['datetime'].astype('datetime64[m]')
+
+    if interval == INTERVAL_MINUTE:
+        # 每根X分钟K线的最后一根1分钟K线
+        minute = stamp.astype(np.int64) % 60
+        lastArray = np.flatnonzero((minute + 1) % window == 0)
+        startArray = np.concatenate([[0], lastArray[:-1] + 1])
+        startArray = startArray[:len(lastArray)]
+
+        if includeLast and (not len(lastArray) or lastArray[-1] < n - 1):
+            startArray = np.append(startArray, lastArray[-1] + 1 if len(lastArray) else 0)
+            lastArray = np.append(lastArray, n - 1)
+        dayArray = None
+    else:
+        if interval == INTERVAL_HOUR:
+            key = hourKey(stamp, window, sessionStart)
+            dayArray = None
+        elif interval == INTERVAL_DAILY:
+            key = dayArray = tradingDay(stamp, sessionStart)
+        else:
+            raise ValueError(u'不支持的合成周期：%s' % interval)
+
+        startArray = np.flatnonzero(np.concatenate([[True], key[1:] != key[:-1]]))
+        lastArray = np.append(startArray[1:], n) - 1
+
+        if not includeLast:
+            startArray = startArray[:-1]
+            lastArray = lastArray[:-1]
+
+    if not len(startArray):
+        return np.zeros(0, dtype=BAR_DTYPE)
+
+    stop = lastArray[-1] + 1
+
+    result = np.zeros(len(startArray), dtype=BAR_DTYPE)
+    result['open'] = bars['open'][startArray]
+    result['high'] = np.maximum.reduceat(bars['high'][:stop], startArray)
+    result['low'] = np.minimum.reduceat(bars['low'][:stop], startArray)
+    result['close'] = bars['close'][lastArray]
+    result['volume'] = np.add.reduceat(np.trunc(bars['volume'][:stop]), startArray)
+    result['openInterest'] = bars['openInterest'][lastArray]
+
+    # 日线以交易日作为时间戳，其他周期使用第一根K线的时间
+    if dayArray is not None:
+        result['datetime'] = dayArray[startArray]
+    else:
+        result['datetime'] = stamp[startArray]
+    result['date'], result['time'] = formatDatetime(result['datetime'])
+
+    return result
+
+
+#----------------------------------------------------------------------
+def hourKey(stamp, window, sessionStart=None):
+    """计算每根K线所属的小时K线编号"""
+    minutes = stamp.astype(np.int64)
+    if sessionStart:
+        minutes = minutes - (sessionStart.hour * 60 + sessionStart.minute)
+    return minutes // (60 * window)
+
+
+#----------------------------------------------------------------------
+def tradingDay(stamp, sessionStart=None):
+    """
+    计算每根K线所属的交易日
+    sessionStart之后的K线属于下一个自然日，遇到周末则顺延到周一
+    """
+    if sessionStart:
+        offset = timedelta(days=1) - timedelta(hours=sessionStart.hour, minutes=sessionStart.minute)
+        stamp = stamp + np.timedelta64(int(offset.total_seconds() // 60), 'm')
+
+    day = stamp.astype('datetime64[D]')
+    if sessionStart:
+        day = np.busday_offset(day, 0, roll='forward')
+    return day
+
+
+#----------------------------------------------------------------------
+def formatDatetime(stamp):
+    """将datetime64数组转换为K线的date（%Y%m%d）和time（%H:%M:%S.%f）字符串数组"""
+    if not len(stamp):
+        return np.zeros(0, dtype='U8'), np.zeros(0, dtype='U15')
+
+    # 'YYYY-MM-DDTHH:MM:SS'，按字符拆分后重新拼接
+    chars = np.datetime_as_string(stamp.astype('datetime64[s]'), unit='s')
+    chars = chars.astype('U19').view('U1').reshape(-1, 19)
+
+    date = np.ascontiguousarray(np.concatenate([chars[:, 0:4], chars[:, 5:7], chars[:, 8:10]],
+                                               axis=1)).view('U8').ravel()
+    time = np.char.add(np.ascontiguousarray(chars[:, 11:19]).view('U8').ravel(), '.000000')
+    return date, time
+
+
+#----------------------------------------------------------------------
+def arrayToBars(array, vtSymbol='', symbol='', exchange=''):
+    """将BAR_DTYPE结构化数组转换为VtBarData对象列表"""
+    names = array.dtype.names
+    barList = []
+
+    for values in array.tolist():
+        bar = VtBarData()
+        bar.__dict__.update(zip(names, values))
+        bar.vtSymbol = vtSymbol
+        bar.symbol = symbol
+        bar.exchange = exchange
+        barList.append(bar)
+
+    return barList
@@ -1,5 +1,6 @@
 # encoding: UTF-8
 
+from collections import deque
 
 import numpy as np
 import talib
@@ -281,3 +282,354 @@ class ArrayManager(object):
         if array:
             return up, down
         return up[-1], down[-1]
+
+
+########################################################################
+class RingArrayManager(ArrayManager):
+    """
+    基于环形缓存的K线序列管理工具，接口和ArrayManager一致
+    
+    每个序列保存在2倍长度的数组中，每根K线同时写入两个位置，任意时刻最近的
+    K线都是数组中的一段连续切片，因此更新K线为O(1)，获取序列时也无需拷贝。
+    
+    不传入array参数时，sma/std/boll/donchian使用流式指标，首次调用时基于当前
+    序列初始化，之后每根K线O(1)增量更新，结果和ArrayManager一致。
+    
+    atr和rsi为Wilder递推平滑指标，talib在固定长度窗口上计算时每次都从窗口
+    起点重新初始化，而递推计算等同于在不限长度的序列上计算，两者的结果始终
+    存在差别（不只是预热阶段）。因此atr/rsi/keltner默认和ArrayManager一样在
+    窗口上调用talib计算，构造时传入recursive=True才使用O(1)的流式递推结果。
+    """
+
+    #----------------------------------------------------------------------
+    def __init__(self, size=100, recursive=False):
+        """Constructor"""
+        self.count = 0                      # 缓存计数
+        self.size = size                    # 缓存大小
+        self.inited = False                 # True if count>=size
+        self.recursive = recursive          # atr和rsi是否使用流式递推计算
+        
+        # 内部多保存一根K线，用于流式指标计算移出窗口的数据
+        self.capacity = size + 1
+        self.start = 0                      # 最老数据在缓存中的位置
+        
+        self.openBuffer = np.zeros(self.capacity * 2)
+        self.highBuffer = np.zeros(self.capacity * 2)
+        self.lowBuffer = np.zeros(self.capacity * 2)
+        self.closeBuffer = np.zeros(self.capacity * 2)
+        self.volumeBuffer = np.zeros(self.capacity * 2)
+        
+        self.streamDict = {}                # 流式指标字典，key为(指标类, 参数)
+        
+    #----------------------------------------------------------------------
+    def updateBar(self, bar):
+        """更新K线"""
+        self.count += 1
+        if not self.inited and self.count >= self.size:
+            self.inited = True
+        
+        # 覆盖最老的数据，并写入镜像位置
+        i = self.start
+        j = i + self.capacity
+        
+        self.openBuffer[i] = self.openBuffer[j] = bar.open
+        self.highBuffer[i] = self.highBuffer[j] = bar.high
+        self.lowBuffer[i] = self.lowBuffer[j] = bar.low
+        self.closeBuffer[i] = self.closeBuffer[j] = bar.close
+        self.volumeBuffer[i] = self.volumeBuffer[j] = bar.volume
+        
+        self.start = (i + 1) % self.capacity
+        
+        # 更新流式指标
+        for stream in self.streamDict.values():
+            stream.update(self)
+        
+    #----------------------------------------------------------------------
+    def getIndex(self, n):
+        """获取倒数第n根K线在缓存中的位置，n从1开始，最大为size+1"""
+        return self.start + self.capacity - n
+    
+    #----------------------------------------------------------------------
+    def getStream(self, streamClass, n):
+        """获取流式指标，不存在则创建"""
+        key = (streamClass, n)
+        stream = self.streamDict.get(key, None)
+        if not stream:
+            stream = streamClass(self, n)
+            self.streamDict[key] = stream
+        return stream
+        
+    #----------------------------------------------------------------------
+    @property
+    def open(self):
+        """获取开盘价序列"""
+        return self.openBuffer[self.start+1:self.start+self.capacity]
+        
+    #----------------------------------------------------------------------
+    @property
+    def high(self):
+        """获取最高价序列"""
+        return self.highBuffer[self.start+1:self.start+self.capacity]
+    
+    #----------------------------------------------------------------------
+    @property
+    def low(self):
+        """获取最低价序列"""
+        return self.lowBuffer[self.start+1:self.start+self.capacity]
+    
+    #----------------------------------------------------------------------
+    @property
+    def close(self):
+        """获取收盘价序列"""
+        return self.closeBuffer[self.start+1:self.start+self.capacity]
+    
+    #----------------------------------------------------------------------
+    @property    
+    def volume(self):
+        """获取成交量序列"""
+        return self.volumeBuffer[self.start+1:self.start+self.capacity]
+    
+    #----------------------------------------------------------------------
+    def sma(self, n, array=False):
+        """简单均线"""
+        if array:
+            return talib.SMA(self.close, n)
+        return self.getStream(SmaStream, n).value
+        
+    #----------------------------------------------------------------------
+    def std(self, n, array=False):
+        """标准差"""
+        if array:
+            return talib.STDDEV(self.close, n)
+        return self.getStream(StdStream, n).value
+    
+    #----------------------------------------------------------------------
+    def atr(self, n, array=False):
+        """ATR指标"""
+        if self.recursive and not array:
+            return self.getStream(AtrStream, n).value
+        return super(RingArrayManager, self).atr(n, array)
+    
+    #----------------------------------------------------------------------
+    def rsi(self, n, array=False):
+        """RSI指标"""
+        if self.recursive and not array:
+            return self.getStream(RsiStream, n).value
+        return super(RingArrayManager, self).rsi(n, array)
+    
+    #----------------------------------------------------------------------
+    def donchian(self, n, array=False):
+        """唐奇安通道"""
+        if array:
+            return talib.MAX(self.high, n), talib.MIN(self.low, n)
+        stream = self.getStream(DonchianStream, n)
+        return stream.up, stream.down
+
+
+########################################################################
+class SmaStream(object):
+    """流式简单均线，维护窗口内收盘价之和"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, am, n):
+        """Constructor"""
+        self.n = n
+        self.updateCount = 0
+        self.resync(am)
+        
+    #----------------------------------------------------------------------
+    def resync(self, am):
+        """基于当前序列重新计算，消除浮点累积误差"""
+        close = am.close[-self.n:]
+        self.total = close.sum()
+        self.value = self.total / self.n
+        
+    #----------------------------------------------------------------------
+    def update(self, am):
+        """更新"""
+        self.updateCount += 1
+        if self.updateCount >= am.size:
+            self.updateCount = 0
+            self.resync(am)
+            return
+        
+        buf = am.closeBuffer
+        self.total += buf[am.getIndex(1)] - buf[am.getIndex(self.n+1)]
+        self.value = self.total / self.n
+
+
+########################################################################
+class StdStream(SmaStream):
+    """流式标准差，维护窗口内收盘价之和与平方和，和talib.STDDEV一致为总体标准差"""
+
+    #----------------------------------------------------------------------
+    def resync(self, am):
+        """基于当前序列重新计算，消除浮点累积误差"""
+        close = am.close[-self.n:]
+        self.total = close.sum()
+        self.squareTotal = (close * close).sum()
+        self.calculate()
+        
+    #----------------------------------------------------------------------
+    def calculate(self):
+        """计算标准差"""
+        mean = self.total / self.n
+        variance = self.squareTotal / self.n - mean * mean
+        self.value = np.sqrt(max(variance, 0))
+        
+    #----------------------------------------------------------------------
+    def update(self, am):
+        """更新"""
+        self.updateCount += 1
+        if self.updateCount >= am.size:
+            self.updateCount = 0
+            self.resync(am)
+            return
+        
+        buf = am.closeBuffer
+        new = buf[am.getIndex(1)]
+        old = buf[am.getIndex(self.n+1)]
+        self.total += new - old
+        self.squareTotal += new * new - old * old
+        self.calculate()
+
+
+########################################################################
+class AtrStream(object):
+    """流式ATR，Wilder平滑，结果等同于在不限长度的序列上递推计算"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, am, n):
+        """Constructor"""
+        self.n = n
+        self.value = np.nan
+        
+        # 和talib一致，以前n个真实波幅的均值作为初始值
+        high = am.high
+        low = am.low
+        close = am.close
+        if len(close) <= n:
+            return
+        
+        prevClose = close[:-1]
+        tr = np.maximum(high[1:], prevClose) - np.minimum(low[1:], prevClose)
+        
+        value = tr[:n].mean()
+        for x in tr[n:]:
+            value = (value * (n - 1) + x) / n
+        self.value = value
+        
+    #----------------------------------------------------------------------
+    def update(self, am):
+        """更新"""
+        if self.value != self.value:    # 数据不足时为nan
+            return
+        
+        high = am.highBuffer[am.getIndex(1)]
+        low = am.lowBuffer[am.getIndex(1)]
+        prevClose = am.closeBuffer[am.getIndex(2)]
+        tr = max(high, prevClose) - min(low, prevClose)
+        
+        self.value = (self.value * (self.n - 1) + tr) / self.n
+
+
+########################################################################
+class RsiStream(object):
+    """流式RSI，Wilder平滑，结果等同于在不限长度的序列上递推计算"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, am, n):
+        """Constructor"""
+        self.n = n
+        self.value = np.nan
+        self.gain = 0
+        self.loss = 0
+        
+        # 和talib一致，以前n个涨跌幅的均值作为初始值
+        close = am.close
+        if len(close) <= n:
+            return
+        
+        diff = np.diff(close)
+        gainArray = np.maximum(diff, 0)
+        lossArray = np.maximum(-diff, 0)
+        
+        gain = gainArray[:n].mean()
+        loss = lossArray[:n].mean()
+        for g, l in zip(gainArray[n:], lossArray[n:]):
+            gain = (gain * (n - 1) + g) / n
+            loss = (loss * (n - 1) + l) / n
+        
+        self.gain = gain
+        self.loss = loss
+        self.calculate()
+        
+    #----------------------------------------------------------------------
+    def calculate(self):
+        """计算RSI"""
+        total = self.gain + self.loss
+        if total:
+            self.value = 100 * self.gain / total
+        else:
+            self.value = 0
+        
+    #----------------------------------------------------------------------
+    def update(self, am):
+        """更新"""
+        if self.value != self.value:    # 数据不足时为nan
+            return
+        
+        n = self.n
+        diff = am.closeBuffer[am.getIndex(1)] - am.closeBuffer[am.getIndex(2)]
+        self.gain = (self.gain * (n - 1) + max(diff, 0)) / n
+        self.loss = (self.loss * (n - 1) + max(-diff, 0)) / n
+        self.calculate()
+
+
+########################################################################
+class DonchianStream(object):
+    """流式唐奇安通道，使用单调队列维护窗口内的最高价和最低价"""
+
+    #----------------------------------------------------------------------
+    def __init__(self, am, n):
+        """Constructor"""
+        self.n = n
+        self.highQueue = deque()    # 元素为(K线序号, 价格)，价格单调递减
+        self.lowQueue = deque()     # 价格单调递增
+        
+        high = am.high
+        low = am.low
+        high = high[-n:]
+        low = low[-n:]
+        begin = am.count - len(high) + 1
+        for i, (h, l) in enumerate(zip(high, low)):
+            self.push(begin + i, h, l)
+            
+    #----------------------------------------------------------------------
+    def push(self, index, high, low):
+        """加入新K线，并移出窗口外的数据"""
+        highQueue = self.highQueue
+        lowQueue = self.lowQueue
+        
+        while highQueue and highQueue[-1][1] <= high:
+            highQueue.pop()
+        highQueue.append((index, high))
+        
+        while lowQueue and lowQueue[-1][1] >= low:
+            lowQueue.pop()
+        lowQueue.append((index, low))
+        
+        limit = index - self.n
+        while highQueue[0][0] <= limit:
+            highQueue.popleft()
+        while lowQueue[0][0] <= limit:
+            lowQueue.popleft()
+        
+        self.up = highQueue[0][1]
+        self.down = lowQueue[0][1]
+        
+    #----------------------------------------------------------------------
+    def update(self, am):
+        """更新"""
+        i = am.getIndex(1)
+        self.push(am.count, am.highBuffer[i], am.lowBuffer[i])